@@ -15,6 +15,10 @@ const MIME_TYPES = {
 };
 
 const API_URL = process.env.API_URL || 'http://python-api:5000';
+// When set, incoming messages are published to this RabbitMQ queue and
+// answered by the Python queue consumer instead of one POST per message
+const INBOUND_QUEUE = process.env.INBOUND_QUEUE;
+let queueChannel = null;
 
 const client = new Client({
     authStrategy: new LocalAuth(),
@@ -33,12 +37,110 @@ const client = new Client({
     }
 });
 
+// MessageMedia objects keyed by the media_id the Python API returns, so a
+// product image is fetched and encoded once rather than on every reply
+const mediaCache = new Map();
+
+async function loadMedia(image, mediaId, inlineMedia) {
+    if (mediaId && mediaCache.has(mediaId)) {
+        return mediaCache.get(mediaId);
+    }
+
+    let media;
+    if (inlineMedia && inlineMedia.data) {
+        media = new MessageMedia(
+            inlineMedia.mimetype || 'image/jpeg',
+            inlineMedia.data,
+            inlineMedia.filename || 'shop_image.jpg'
+        );
+    } else {
+        // Log the image URL for debugging
+        console.log('Attempting to fetch image from:', image);
+
+        // Use the correct path format
+        const imageUrl = image.startsWith('http')
+            ? image
+            : `http://python-api:5000/static/image${image}`;
+
+        console.log('Full image URL:', imageUrl);
+
+        const imageResponse = await fetch(imageUrl);
+        if (!imageResponse.ok) {
+            throw new Error(`Failed to fetch image: ${imageResponse.statusText} (${imageUrl})`);
+        }
+
+        const buffer = await imageResponse.buffer();
+        const mimeType = imageResponse.headers.get('content-type')
+            || MIME_TYPES[path.extname(imageUrl).toLowerCase()]
+            || 'image/jpeg';
+        media = new MessageMedia(
+            mimeType,
+            buffer.toString('base64'),
+            'shop_image' + (path.extname(imageUrl) || '.jpg')
+        );
+    }
+
+    if (mediaId) {
+        mediaCache.set(mediaId, media);
+    }
+    return media;
+}
+
+// Sends to one chat run one after another, so streamed reply chunks from
+// the queue arrive in the order they were published; different chats
+// still send concurrently
+const chatSendChains = new Map();
+
+function sendInOrder(chatId, task) {
+    const previous = chatSendChains.get(chatId) || Promise.resolve();
+    const next = previous.catch(() => {}).then(task);
+    chatSendChains.set(chatId, next);
+    next.catch(() => {}).finally(() => {
+        if (chatSendChains.get(chatId) === next) {
+            chatSendChains.delete(chatId);
+        }
+    });
+    return next;
+}
+
+async function sendReply(chatId, text, image, mediaId, inlineMedia) {
+    if (!image && !inlineMedia) {
+        if (!text) {
+            return;
+        }
+        await client.sendMessage(chatId, text);
+        return;
+    }
+    try {
+        const media = await loadMedia(image, mediaId, inlineMedia);
+        await client.sendMessage(chatId, media, {
+            caption: text
+        });
+    } catch (imageError) {
+        console.error('Error fetching/sending image:', imageError);
+        await client.sendMessage(chatId, text);
+    }
+}
+
 client.on('message', async msg => {
     try {
         if (msg.from === 'status@broadcast' || !msg.body) {
             return;
         }
 
+        // whatsapp-web.js can emit the same message more than once; the
+        // Python side processes each message_id only once
+        const messageId = msg.id && msg.id._serialized;
+
+        if (INBOUND_QUEUE && queueChannel) {
+            queueChannel.sendToQueue(
+                INBOUND_QUEUE,
+                Buffer.from(JSON.stringify({ number: msg.from, message: msg.body, message_id: messageId })),
+                { persistent: true, contentType: 'application/json' }
+            );
+            return;
+        }
+
         const response = await fetch('http://python-api:5000/send', {
             method: 'POST',
             headers: {
@@ -46,47 +148,17 @@ client.on('message', async msg => {
             },
             body: JSON.stringify({
                 number: msg.from,
-                message: msg.body
+                message: msg.body,
+                message_id: messageId
             })
         });
 
         const data = await response.json();
 
-        if (data.success) {
-            if (data.image) {
-                try {
-                    // Log the image URL for debugging
-                    console.log('Attempting to fetch image from:', data.image);
-                    
-                    // Use the correct path format
-                    const imageUrl = data.image.startsWith('http') 
-                        ? data.image 
-                        : `http://python-api:5000/static/image${data.image}`;
-
-                    console.log('Full image URL:', imageUrl);
-
-                    const imageResponse = await fetch(imageUrl);
-                    if (!imageResponse.ok) {
-                        throw new Error(`Failed to fetch image: ${imageResponse.statusText} (${imageUrl})`);
-                    }
-
-                    const buffer = await imageResponse.buffer();
-                    const media = new MessageMedia(
-                        'image/jpeg',
-                        buffer.toString('base64'),
-                        'shop_image.jpg'
-                    );
-
-                    await client.sendMessage(msg.from, media, {
-                        caption: data.response || data.text
-                    });
-                } catch (imageError) {
-                    console.error('Error fetching/sending image:', imageError);
-                    await client.sendMessage(msg.from, data.response || data.text);
-                }
-            } else {
-                await client.sendMessage(msg.from, data.response || data.text);
-            }
+        if (data.success && !data.duplicate) {
+            // Streamed replies already arrived through the queue; send only the image
+            const text = data.streamed ? '' : (data.response || data.text);
+            await sendInOrder(msg.from, () => sendReply(msg.from, text, data.image, data.media_id, data.media));
         }
     } catch (error) {
         console.error('Error in message handler:', error);
@@ -121,6 +193,10 @@ async function connectQueue() {
         const queue = 'whatsapp_messages';
 
         await channel.assertQueue(queue, { durable: true });
+        if (INBOUND_QUEUE) {
+            await channel.assertQueue(INBOUND_QUEUE, { durable: true });
+            queueChannel = channel;
+        }
         console.log('Connected to RabbitMQ, waiting for messages...');
 
         channel.consume(queue, async (msg) => {
@@ -134,7 +210,7 @@ async function connectQueue() {
                         message: data.message
                     });
 
-                    await client.sendMessage(chatId, data.message);
+                    await sendInOrder(chatId, () => sendReply(chatId, data.message, data.image, data.media_id, data.media));
                     channel.ack(msg);
                     
                 } catch (error) {
@@ -0,0 +1,334 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from resilience import CircuitBreaker, RetryBudget, is_retryable
+from streaming import chunk_stream
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiModel:
+    """Adapter around a google.generativeai GenerativeModel.
+
+    Importing the SDK takes most of a second and the welcome, menu and stock
+    replies never need it, so it is imported and configured on first use.
+    warm() does that on a background thread instead, so neither startup nor
+    the first AI answer waits for it. A failed init is not retried.
+
+    The one GenerativeModel is shared by every AI worker thread, so all
+    calls go through the SDK's cached client and reuse its connections.
+    """
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash"):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.error = None
+        self.init_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._initialized = threading.Event()
+
+    @property
+    def initialized(self):
+        """True once init has been attempted, whether or not it worked."""
+        return self._initialized.is_set()
+
+    @property
+    def available(self):
+        return self.error is None
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None and self.error is None:
+                    start = time.perf_counter()
+                    try:
+                        import google.generativeai as genai
+
+                        genai.configure(api_key=self.api_key)
+                        self._model = genai.GenerativeModel(self.model_name)
+                        logger.info("Google AI model initialized successfully")
+                    except Exception as e:
+                        self.error = e
+                        logger.error(f"Failed to initialize Google AI model: {e}")
+                    finally:
+                        self.init_seconds = time.perf_counter() - start
+                        self._initialized.set()
+            if self._model is None:
+                raise RuntimeError(f"Google AI model unavailable: {self.error}")
+        return self._model
+
+    def warm(self):
+        thread = threading.Thread(target=self._warm, name="gemini-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm(self):
+        try:
+            self._load()
+        except RuntimeError:
+            pass
+
+    def generate(self, prompt):
+        response = self._load().generate_content(prompt)
+        return response.text.strip()
+
+    def generate_stream(self, prompt):
+        for chunk in self._load().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeModelError(RuntimeError):
+    """Injected failure; `code` is the HTTP status the real API would send."""
+
+    def __init__(self, code):
+        super().__init__(f"FakeModel injected failure ({code})")
+        self.code = code
+
+
+class FakeModel:
+    """In-process model stub for offline load tests.
+
+    Replies are deterministic for a given prompt; latency is drawn from a
+    normal distribution and a fraction of calls can be made to fail with
+    FakeModelError(`error_code`). Both can be changed while it runs, e.g.
+    error_rate=1.0 for an outage or error_code=429 for rate limiting.
+    generate_stream() yields a longer reply of `stream_sentences` sentences
+    word by word, `token_latency` seconds apart, after the same first delay.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, seed=None, stream_sentences=6, token_latency=0.01,
+                 error_code=503):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.stream_sentences = stream_sentences
+        self.token_latency = token_latency
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _sleep_time(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def generate(self, prompt):
+        delay, failed = self._sleep_time()
+        time.sleep(delay)
+        if failed:
+            raise FakeModelError(self.error_code)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"[fake reply {digest}]"
+
+    def generate_stream(self, prompt):
+        delay, failed = self._sleep_time()
+        time.sleep(delay)
+        if failed:
+            raise FakeModelError(self.error_code)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        sentences = [f"Fake reply {digest} sentence {i + 1} with a few more words of filler text." for i in range(self.stream_sentences)]
+        words = " ".join(sentences).split(" ")
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.token_latency)
+            yield word if index == len(words) - 1 else word + " "
+
+
+class AIBackend:
+    """Runs model calls on a bounded worker pool with a per-request deadline.
+
+    generate() waits at most `timeout` seconds. If the model has not answered
+    by then the fallback text is returned immediately and, once the call
+    completes, the late answer is handed to `late_handler(context, text)`.
+    When every worker and queue slot is taken the fallback is returned
+    without queueing, so a slow model cannot back up the request threads.
+
+    Transient errors (see resilience.is_retryable) are retried up to
+    `retries` times with exponential backoff and full jitter, as long as
+    the deadline allows and the shared `retry_budget` has tokens left.
+    Every attempt's outcome feeds `breaker`; a slow call only counts once
+    it finishes, so a congested model is not mistaken for a broken one.
+    While the breaker is open calls get the fallback at once without
+    touching the model. `fallback_handler(reason)` hears
+    why a fallback was used: "saturated", "circuit_open", "error",
+    "deadline" or "empty".
+    """
+
+    def __init__(self, model, max_workers=8, max_pending=32, timeout=8.0, late_handler=None, stream_timeout=60.0,
+                 retries=2, backoff=0.2, max_backoff=2.0, retry_budget=None, breaker=None, fallback_handler=None):
+        self.model = model
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.late_handler = late_handler
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback_handler = fallback_handler
+        self._random = random.Random()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    @property
+    def available(self):
+        return self.model is not None and getattr(self.model, "available", True)
+
+    @property
+    def can_stream(self):
+        return hasattr(self.model, "generate_stream")
+
+    def _fallback(self, reason, fallback):
+        if self.fallback_handler is not None:
+            self.fallback_handler(reason)
+        return fallback
+
+    def _admit(self):
+        """Take a worker slot; returns why the call can't go ahead, or None."""
+        if not self._slots.acquire(blocking=False):
+            logger.warning("AI worker pool saturated, using fallback response")
+            return "saturated"
+        if not self.breaker.allow():
+            self._slots.release()
+            return "circuit_open"
+        self.retry_budget.deposit()
+        return None
+
+    def _retry_delay(self, error, attempt, deadline):
+        if attempt >= self.retries or not is_retryable(error) or self.breaker.state == CircuitBreaker.OPEN:
+            return None
+        # Full jitter keeps workers that failed together from retrying together
+        delay = self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if time.monotonic() + delay >= deadline or not self.retry_budget.withdraw():
+            return None
+        return delay
+
+    def _call(self, attempt, deadline, can_retry=None):
+        tries = 0
+        while True:
+            try:
+                result = attempt()
+            except Exception as e:
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                else:
+                    # A bad request or a blocked prompt means the service
+                    # answered; it must not open the circuit for everyone
+                    self.breaker.record_success()
+                delay = self._retry_delay(e, tries, deadline) if can_retry is None or can_retry() else None
+                if delay is None:
+                    raise
+                logger.warning(f"AI call failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                tries += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _run(self, prompt, deadline):
+        try:
+            return self._call(lambda: self.model.generate(prompt), deadline)
+        finally:
+            self._slots.release()
+
+    def _deliver_late(self, future, context):
+        if future.cancelled() or future.exception() is not None:
+            return
+        text = future.result()
+        if self.late_handler is None:
+            logger.info(f"Dropping late AI reply for {context}: no late handler configured")
+            return
+        try:
+            self.late_handler(context, text)
+        except Exception as e:
+            logger.error(f"Failed to deliver late AI reply for {context}: {e}")
+
+    def generate(self, prompt, fallback, context=None, timeout=None):
+        reason = self._admit()
+        if reason:
+            return self._fallback(reason, fallback)
+        wait = self.timeout if timeout is None else timeout
+        future = self._executor.submit(self._run, prompt, time.monotonic() + wait)
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeout:
+            logger.warning(f"AI response deadline exceeded for {context}, using fallback response")
+            future.add_done_callback(lambda f: self._deliver_late(f, context))
+            return self._fallback("deadline", fallback)
+        except Exception as e:
+            logger.error(f"AI call for {context} failed: {e}")
+            return self._fallback("error", fallback)
+
+    def _run_stream(self, prompt, on_chunk, first_chunk, sent, parts, deadline):
+        def attempt():
+            del parts[:]
+
+            def pieces():
+                for piece in self.model.generate_stream(prompt):
+                    parts.append(piece)
+                    yield piece
+
+            for chunk in chunk_stream(pieces()):
+                on_chunk(chunk)
+                sent.set()
+                first_chunk.set()
+            return "".join(parts).strip()
+
+        try:
+            # Only retried while nothing has been sent; a half-sent reply
+            # can't be taken back
+            return self._call(attempt, deadline, can_retry=lambda: not sent.is_set())
+        finally:
+            first_chunk.set()
+            self._slots.release()
+
+    def stream(self, prompt, on_chunk, fallback, context=None, timeout=None):
+        """Stream the reply to on_chunk(text) in sentence/paragraph chunks.
+
+        Returns (text, streamed, complete). If no chunk arrives within the
+        deadline the fallback is returned with streamed=False; the answer is
+        still delivered through on_chunk when it turns up, like a late reply.
+        Once streaming has started the caller waits for the rest up to
+        `stream_timeout` seconds and gets whatever has been sent by then;
+        complete is False when that text was cut short by the timeout or an
+        error, so it must not be reused as a full answer.
+        """
+        reason = self._admit()
+        if reason:
+            return self._fallback(reason, fallback), False, False
+        wait = self.timeout if timeout is None else timeout
+        first_chunk = threading.Event()
+        sent = threading.Event()
+        parts = []
+        future = self._executor.submit(self._run_stream, prompt, on_chunk, first_chunk, sent, parts,
+                                       time.monotonic() + wait)
+        if not first_chunk.wait(wait):
+            logger.warning(f"AI stream deadline exceeded for {context}, using fallback response")
+            return self._fallback("deadline", fallback), False, False
+        try:
+            text = future.result(timeout=self.stream_timeout)
+        except FutureTimeout:
+            logger.warning(f"AI stream for {context} still running after {self.stream_timeout}s, returning partial reply")
+            return "".join(parts).strip(), True, False
+        except Exception as e:
+            logger.error(f"AI stream for {context} failed: {e}")
+            if sent.is_set():
+                return "".join(parts).strip(), True, False
+            return self._fallback("error", fallback), False, False
+        # An empty stream sent nothing, so the customer still needs an answer
+        return (text, True, True) if text else (self._fallback("empty", fallback), False, False)
+
+    def stats(self):
+        return dict(self.breaker.stats(), retries=self.retry_budget.spent, retries_denied=self.retry_budget.denied)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,76 @@
+"""Offline load test for the AI backend using the in-process FakeModel.
+
+Compares calling the model directly on each request thread with going
+through AIBackend's bounded pool and deadline.
+
+Run from python-server/:  python benchmarks/bench_ai_backend.py
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_backend import AIBackend, FakeModel  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def drive(call, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_id):
+        local = []
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            call(f"client {client_id} question {i}")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def report(label, result, extra=""):
+    rate, p50, p99 = result
+    print(f"{label:<28} {rate:>8.1f} req/s  p50 {p50 * 1000:>7.1f} ms  p99 {p99 * 1000:>7.1f} ms {extra}")
+
+
+def main(clients=32, requests_per_client=20):
+    logging.disable(logging.WARNING)
+    # Mostly fast answers with a heavy tail, like a congested upstream
+    model = FakeModel(latency=0.15, jitter=0.4, seed=1)
+    report("direct model call", drive(model.generate, clients, requests_per_client))
+
+    late = []
+    backend = AIBackend(FakeModel(latency=0.15, jitter=0.4, seed=1), max_workers=32, max_pending=32,
+                        timeout=0.3, late_handler=lambda context, text: late.append(context))
+    fallbacks = []
+
+    def call(prompt):
+        text = backend.generate(prompt, "FALLBACK", context=prompt)
+        if text == "FALLBACK":
+            fallbacks.append(prompt)
+
+    report("AIBackend (deadline 300ms)", drive(call, clients, requests_per_client),
+           f"fallbacks {len(fallbacks)}")
+    backend.shutdown()
+    print(f"late replies delivered afterwards: {len(late)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Bulk broadcast pipeline against the in-memory broker.
+
+Checks that a campaign
+
+* renders each recipient's language (unknown languages get the default)
+  with shop fields and CSV columns, and skips invalid numbers;
+* sends once per number: duplicate CSV rows and a second run of the same
+  campaign publish nothing new;
+* is paced by the token bucket: publishing at a given rate takes the
+  expected time, in whole batches;
+* resumes after the broker fails mid-campaign, from the checkpoint, with
+  every number published exactly once across both runs;
+* stop() finishes the current batch and a later run completes the rest;
+* can go to every stored chat session, also from a fresh process that
+  only has the persisted sessions.
+
+Then streams a large generated CSV without rate limiting and reports
+throughput and peak traced memory, which must stay flat in the number of
+recipients once the local dedup claims reach their cap. Exits non-zero if
+any check fails.
+
+Run from python-server/:  python benchmarks/bench_broadcast.py [--recipients 200000]
+"""
+import argparse
+import csv
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broadcast import DEDUP_WINDOW, Broadcast, csv_recipients, session_recipients  # noqa: E402
+from idempotency import MessageDeduplicator  # noqa: E402
+from messaging import OUTBOUND_QUEUE, InMemoryBroker  # noqa: E402
+from sessions import SessionStore, SQLiteSessionBackend  # noqa: E402
+from shared_state import LocalKeyValueStore  # noqa: E402
+from shop_data import info_fields, read_section  # noqa: E402
+
+MESSAGES = read_section("messages")["messages"]
+SHOP_INFO = read_section("shop")
+LANGUAGE_FIELDS = {language: info_fields(info) for language, info in SHOP_INFO.items()}
+FIELDS = {"offer": "10% off all earbuds this week"}
+WORK_DIR = tempfile.mkdtemp(prefix="broadcast-")
+
+
+def write_csv(name, rows, header=("number", "language", "name")):
+    path = os.path.join(WORK_DIR, name)
+    with open(path, "w", newline="", encoding="utf-8") as target:
+        writer = csv.writer(target)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+
+def campaign(broker, name, store=None, checkpoint=None, max_entries=100000, **options):
+    options.setdefault("rate", None)
+    deduplicator = MessageDeduplicator(window=DEDUP_WINDOW, max_entries=max_entries, store=store,
+                                       prefix=f"broadcast:{name}:")
+    return Broadcast(broker, MESSAGES, "promo", name, fields=FIELDS, language_fields=LANGUAGE_FIELDS,
+                     deduplicator=deduplicator,
+                     checkpoint_path=os.path.join(WORK_DIR, checkpoint) if checkpoint else None, **options)
+
+
+def numbers(broker):
+    return [payload["number"] for queue_name, payload in broker.published if queue_name == OUTBOUND_QUEUE]
+
+
+class FlakyBroker(InMemoryBroker):
+    """Fails every publish_batch after the first `healthy` ones."""
+
+    def __init__(self, healthy):
+        super().__init__()
+        self.healthy = healthy
+
+    def publish_batch(self, queue_name, payloads):
+        if self.healthy <= 0:
+            raise ConnectionError("broker connection lost")
+        self.healthy -= 1
+        super().publish_batch(queue_name, payloads)
+
+
+def check_rendering():
+    path = write_csv("render.csv", [
+        ("+94 77 123 4567", "english", "Nimal"),
+        ("94771234568@c.us", "sinhala", ""),
+        ("94771234569", "singlish", ""),
+        ("94771234570", "tamil", ""),
+        ("not-a-number", "english", ""),
+    ])
+    broker = InMemoryBroker()
+    stats = campaign(broker, "render").run(csv_recipients(path))
+    sent = {payload["number"]: payload["message"] for payload in broker.drain(OUTBOUND_QUEUE)}
+    assert stats["published"] == 4 and stats["invalid"] == 1, stats
+    assert sent["94771234567"].startswith("📢 10% off") and SHOP_INFO["english"]["phone"] in sent["94771234567"]
+    assert SHOP_INFO["sinhala"]["address"] in sent["94771234568"]
+    assert "call karanna" in sent["94771234569"]
+    # No Tamil templates: the default language is used
+    assert sent["94771234570"] == sent["94771234568"].replace("94771234568", "94771234570")
+    print("render: 4 languages -> 3 templates with shop fields, 1 invalid number skipped")
+
+
+def check_dedup():
+    rows = [(f"9477200{i:04d}", "english", "") for i in range(100)]
+    path = write_csv("dedup.csv", rows + rows[:30] + [("+" + rows[0][0], "english", "")])
+    store = LocalKeyValueStore()
+    broker = InMemoryBroker()
+    stats = campaign(broker, "dedup", store).run(csv_recipients(path))
+    assert stats["published"] == 100 and stats["duplicates"] == 31, stats
+    # A fresh process (new local claims) running the same campaign sends nothing new
+    again = campaign(broker, "dedup", store).run(csv_recipients(path))
+    assert again["published"] == 0 and len(numbers(broker)) == 100, again
+    other = campaign(broker, "dedup-2", store).run(csv_recipients(path))
+    assert other["published"] == 100, other
+    print("dedup: 131 rows -> 100 messages; re-run sent 0; another campaign sent 100")
+
+
+def check_rate(rate=400.0, recipients=1000, batch_size=20):
+    path = write_csv("rate.csv", [(f"9477300{i:04d}", "english", "") for i in range(recipients)])
+    broker = InMemoryBroker()
+    broadcast = campaign(broker, "rate", rate=rate, batch_size=batch_size)
+    start = time.perf_counter()
+    broadcast.run(csv_recipients(path))
+    elapsed = time.perf_counter() - start
+    # The first batch goes out on the initial burst
+    expected = (recipients - batch_size) / rate
+    assert expected * 0.95 <= elapsed <= expected * 1.3, (elapsed, expected)
+    print(f"rate: {recipients} messages at {rate:.0f}/s in batches of {batch_size} took {elapsed:.2f}s "
+          f"(expected {expected:.2f}s)")
+
+
+def check_resume(recipients=500, batch_size=25):
+    path = write_csv("resume.csv", [(f"9477400{i:04d}", "sinhala", "") for i in range(recipients)])
+    store = LocalKeyValueStore()
+    flaky = FlakyBroker(healthy=7)
+    try:
+        campaign(flaky, "resume", store, "resume.json", batch_size=batch_size).run(csv_recipients(path))
+        raise AssertionError("the flaky broker did not fail")
+    except ConnectionError:
+        pass
+    first = numbers(flaky)
+    assert len(first) == 7 * batch_size, len(first)
+
+    broker = InMemoryBroker()
+    stats = campaign(broker, "resume", store, "resume.json", batch_size=batch_size).run(csv_recipients(path))
+    second = numbers(broker)
+    assert sorted(first + second) == [f"9477400{i:04d}" for i in range(recipients)], "lost or repeated numbers"
+    assert stats["done"] and stats["published"] == recipients and stats["duplicates"] == 0, stats
+    assert campaign(broker, "resume", store, "resume.json").run(csv_recipients(path))["published"] == recipients
+    assert len(numbers(broker)) == len(second), "finished campaign sent again"
+    print(f"resume: broker failed after {len(first)} messages; resumed run sent the other {len(second)}, "
+          f"each number exactly once")
+
+
+def check_stop(recipients=300, batch_size=10):
+    path = write_csv("stop.csv", [(f"9477500{i:04d}", "english", "") for i in range(recipients)])
+    broker = InMemoryBroker()
+    broadcast = campaign(broker, "stop", checkpoint="stop.json", batch_size=batch_size)
+
+    class StopAfter(InMemoryBroker):
+        def publish_batch(self, queue_name, payloads):
+            broker.publish_batch(queue_name, payloads)
+            if len(broker.published) >= 100:
+                broadcast.stop()
+
+    broadcast.broker = StopAfter()
+    stats = broadcast.run(csv_recipients(path))
+    assert not stats["done"] and stats["published"] == 100, stats
+    stats = campaign(broker, "stop", checkpoint="stop.json", batch_size=batch_size).run(csv_recipients(path))
+    assert stats["done"] and sorted(numbers(broker)) == [f"9477500{i:04d}" for i in range(recipients)], stats
+    print("stop: stopped after 100 messages at a batch boundary, the next run sent the remaining 200")
+
+
+def check_sessions():
+    sessions = SessionStore()
+    for i, language in enumerate(("english", "sinhala", "singlish")):
+        state = sessions.get_or_create(f"9477600000{i}")
+        state.language = language
+        sessions.save(state.number, state)
+    broker = InMemoryBroker()
+    stats = campaign(broker, "sessions").run(session_recipients(sessions))
+    sent = {payload["number"]: payload["message"] for payload in broker.drain(OUTBOUND_QUEUE)}
+    assert stats["published"] == 3 and "Visit us at" in sent["94776000000"], (stats, sent)
+
+    # A separate broadcast process starts with an empty cache over the
+    # sessions the bot persisted (SESSION_DB)
+    path = os.path.join(WORK_DIR, "sessions.db")
+    writer = SessionStore(backend=SQLiteSessionBackend(path))
+    for i, language in enumerate(("english", "sinhala")):
+        state = writer.get_or_create(f"9477600100{i}")
+        state.language = language
+        writer.save(state.number, state)
+    writer.backend.close()
+    fresh = SessionStore(backend=SQLiteSessionBackend(path))
+    broker = InMemoryBroker()
+    stats = campaign(broker, "sessions-db").run(session_recipients(fresh))
+    sent = {payload["number"]: payload["message"] for payload in broker.drain(OUTBOUND_QUEUE)}
+    assert stats["published"] == 2 and SHOP_INFO["sinhala"]["address"] in sent["94776001001"], (stats, sent)
+    fresh.backend.close()
+    print("sessions: every stored chat got the promo in its language, also from a fresh process over SESSION_DB")
+
+
+def time_large_campaign(recipients):
+    languages = ("english", "sinhala", "singlish")
+    path = write_csv("large.csv", ((f"94{700000000 + i}", languages[i % 3], "") for i in range(recipients)))
+    peaks = []
+    for count in (recipients // 4, recipients):
+        broker = InMemoryBroker()
+        # Count messages instead of keeping them, so only the pipeline's own memory is traced
+        broker.publish_batch = lambda queue_name, payloads: None
+        broadcast = campaign(broker, f"large-{count}", max_entries=recipients // 10, batch_size=100)
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = broadcast.run(csv_recipients(path) if count == recipients else
+                              (row for _, row in zip(range(count), csv_recipients(path))))
+        elapsed = time.perf_counter() - start
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1e6)
+        tracemalloc.stop()
+        assert stats["published"] == count, stats
+        print(f"large: {count} recipients in {elapsed:.2f}s ({count / elapsed:,.0f} msg/s unthrottled), "
+              f"peak traced memory {peaks[-1]:.1f} MB")
+    # Local claims are capped (max_entries), so memory stops growing with the list
+    assert peaks[1] < peaks[0] * 1.5, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--recipients", type=int, default=200000, help="size of the generated CSV")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    try:
+        check_rendering()
+        check_dedup()
+        check_rate()
+        check_resume()
+        check_stop()
+        check_sessions()
+        time_large_campaign(args.recipients)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Catalog lookup cost as the number of SKUs grows.
+
+Compares the old linear `item.lower() in message.lower()` scan with the
+alias index (exact and typo-tolerant lookups) on synthetic catalogs.
+
+Run from python-server/:  python benchmarks/bench_catalog.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import build_catalog  # noqa: E402
+from responses import PRODUCT_ALIASES  # noqa: E402
+
+BRANDS = ["Samsung", "Apple", "Xiaomi", "Oppo", "Vivo", "Huawei"]
+MESSAGES = [
+    "do you have the samsung s{n} in stock",
+    "iphone {n} price kiyada",
+    "mata redmi note {n} pro ekak ona",
+    "is the oppo reno {n} available?",
+    "hello, are you open today?",
+]
+
+
+def synthetic_shop(size):
+    stock = {}
+    for i in range(size):
+        brand = BRANDS[i % len(BRANDS)]
+        if brand == "Samsung":
+            name = f"Samsung Galaxy S{i}"
+        elif brand == "Apple":
+            name = f"iPhone {i}"
+        elif brand == "Xiaomi":
+            name = f"Redmi Note {i} Pro"
+        else:
+            name = f"{brand} Reno {i}"
+        stock[name] = i % 7
+    return {"english": {"brands": BRANDS, "stock": stock}}
+
+
+def linear_lookup(stock, message):
+    for item in stock:
+        if item.lower() in message.lower():
+            return item
+    return None
+
+
+def bench(label, func, messages, rounds=3):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            func(message)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (rounds * len(messages)) * 1e6
+    print(f"  {label:<22} {per_call:>9.1f} us/lookup")
+
+
+def main():
+    for size in (10, 1000, 10000):
+        shop = synthetic_shop(size)
+        start = time.perf_counter()
+        catalog = build_catalog(shop, {}, PRODUCT_ALIASES)
+        build_ms = (time.perf_counter() - start) * 1000
+        messages = [template.format(n=(i * 37) % size) for i, template in enumerate(MESSAGES * 40)]
+        typos = [message.replace("samsung", "samsng").replace("iphone", "iphnoe") for message in messages]
+        print(f"{size} SKUs ({len(catalog.aliases)} aliases, built in {build_ms:.0f} ms)")
+        stock = shop["english"]["stock"]
+        bench("linear scan", lambda message: linear_lookup(stock, message), messages)
+        bench("alias index", catalog.match, messages)
+        bench("alias index + typos", catalog.match, typos)
+
+
+if __name__ == "__main__":
+    main()
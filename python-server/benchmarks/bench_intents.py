@@ -0,0 +1,78 @@
+"""Micro-benchmark: legacy per-call regex tables vs the precompiled intent engine.
+
+Run from python-server/:  python benchmarks/bench_intents.py
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import INTENT_PATTERNS, detect_intent  # noqa: E402
+
+CORPUS = [
+    ("english", "Do you have the iPhone 15 in stock?"),
+    ("english", "do you sell samsung phones"),
+    ("english", "Can you fix my screen?"),
+    ("english", "Where is your shop located? What is the address of the shop"),
+    ("english", "what is your contact number"),
+    ("english", "What time do you open on Sunday?"),
+    ("english", "how much is the galaxy s24 ultra"),
+    ("english", "thanks a lot!"),
+    ("sinhala", "මට අයිෆෝන් එකක් ඕන"),
+    ("sinhala", "සැම්සං දුරකථන තියෙනවද"),
+    ("sinhala", "චාජර් තියෙනවද?"),
+    ("sinhala", "ලිපිනය මොකක්ද"),
+    ("sinhala", "විවෘත වේලාව කීයටද"),
+    ("sinhala", "ස්තූතියි"),
+    ("singlish", "iphone 15 ganna puluwanda"),
+    ("singlish", "mata samsung phone ekak ona"),
+    ("singlish", "charger thiyenawada"),
+    ("singlish", "shop eka kohenda? place eka"),
+    ("singlish", "open time eka mokakda"),
+    ("singlish", "s24 stock available da"),
+    ("singlish", "hari hari thanks"),
+]
+
+
+def legacy_detect_intent(message, language):
+    # Verbatim behaviour of the original bot.detect_intent
+    intents = {lang: {intent: list(patterns) for intent, patterns in table.items()}
+               for lang, table in INTENT_PATTERNS.items()}
+    for intent, patterns in intents.get(language, intents["english"]).items():
+        for pattern in patterns:
+            if re.search(pattern, message.lower()):
+                return intent
+    return "general"
+
+
+def run(label, func, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for language, message in messages:
+            # The old pipeline detected intent twice per message
+            func(message, language)
+            func(message, language)
+    elapsed = time.perf_counter() - start
+    rate = rounds * len(messages) / elapsed
+    print(f"{label:<32} {rate:>12,.0f} msg/s")
+    return rate
+
+
+def main(rounds=2000):
+    for language, message in CORPUS:
+        assert legacy_detect_intent(message, language) == detect_intent(message, language), message
+
+    # Unique messages defeat the memo, so this measures the compiled matcher alone
+    unique = [(language, f"{message} #{i}") for i in range(rounds) for language, message in CORPUS]
+
+    before = run("legacy (repeated corpus)", legacy_detect_intent, CORPUS, rounds)
+    after = run("compiled + memo (repeated)", detect_intent, CORPUS, rounds)
+    cold_before = run("legacy (unique messages)", legacy_detect_intent, unique, 1)
+    cold_after = run("compiled (unique messages)", detect_intent.__wrapped__, unique, 1)
+    print(f"speedup repeated: {after / before:.1f}x, unique: {cold_after / cold_before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
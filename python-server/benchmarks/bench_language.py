@@ -0,0 +1,95 @@
+"""Accuracy and throughput of language detection.
+
+Accuracy is measured on the labelled replay corpus plus a few extra
+messages (menu digits and other letterless messages are skipped). The
+old determine_language() from bot.py is kept here as the baseline.
+
+Run from python-server/:  python benchmarks/bench_language.py
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language_detect import detect_batch, detect_language  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay", "corpus.jsonl")
+
+EXTRA = [
+    ("Can I pay by card?", "english"),
+    ("Do you have a Samsung A54 in blue", "english"),
+    ("How long does a screen replacement take", "english"),
+    ("Is the iPhone 13 still available?", "english"),
+    ("oya langa a54 thiyenawada", "singlish"),
+    ("battery eka maru karanna kiyada", "singlish"),
+    ("mage phone eka on wenne na", "singlish"),
+    ("kohomada iphone 13 ekak ganna", "singlish"),
+    ("ඔයාලා ළඟ a54 තියෙනවද", "sinhala"),
+    ("iPhone 13 එකක් ගන්න පුළුවන්ද", "sinhala"),
+    ("ගෙවීම් කරන්නේ කොහොමද", "sinhala"),
+]
+
+
+def legacy_determine_language(message):
+    if any("඀" <= char <= "෿" for char in message):
+        return "sinhala"
+    singlish_keywords = ["thiyenawa", "karanna", "eka", "api", "oya"]
+    if any(keyword in message.lower() for keyword in singlish_keywords):
+        return "singlish"
+    return "english"
+
+
+def labelled_messages():
+    samples = []
+    with open(CORPUS, encoding="utf-8") as corpus:
+        for line in corpus:
+            item = json.loads(line)
+            samples.append((item["message"], item["language"]))
+    samples.extend(EXTRA)
+    # Greetings and menu replies do not say which language the chat is in
+    return [(message, language) for message, language in samples
+            if detect_language(message)[0] is not None and message.lower() not in ("hi", "hello", "hey", "helo", "#reset")]
+
+
+def accuracy(classify, samples):
+    correct = Counter()
+    total = Counter()
+    for message, language in samples:
+        total[language] += 1
+        correct[language] += classify(message) == language
+    overall = sum(correct.values()) / sum(total.values())
+    per_language = "  ".join(f"{language} {correct[language] / total[language]:.0%}" for language in sorted(total))
+    return overall, per_language
+
+
+def rate(func, messages):
+    start = time.perf_counter()
+    func(messages)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    samples = labelled_messages()
+    print(f"{len(samples)} labelled messages")
+    for label, classify in (("legacy determine_language", legacy_determine_language),
+                            ("detect_language", lambda message: detect_language(message)[0])):
+        overall, per_language = accuracy(classify, samples)
+        print(f"{label:<26} accuracy {overall:.1%}   {per_language}")
+
+    # Log backfill: every message unique vs. a realistic mix with repeats
+    messages = [message for message, _ in samples]
+    unique = [f"{message} #{i}" for i in range(2000) for message in messages]
+    repeated = messages * 2000
+    uncached = detect_language.__wrapped__
+    print(f"\n{len(unique)} messages")
+    print(f"legacy, one by one         {rate(lambda batch: [legacy_determine_language(m) for m in batch], unique):>12,.0f} msg/s")
+    print(f"detect_language, uncached  {rate(lambda batch: [uncached(m) for m in batch], unique):>12,.0f} msg/s")
+    print(f"detect_batch, unique       {rate(detect_batch, unique):>12,.0f} msg/s")
+    print(f"detect_batch, repeated     {rate(detect_batch, repeated):>12,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Hot reload of the shop data files.
+
+Copies python-server/data to a temporary directory, points the bot at it
+and edits the files while chats are in progress, checking that:
+
+* a stock-count edit is served without a restart, keeps every session,
+  reuses the catalog indexes and the conversation flow, and leaves cached
+  AI answers alone;
+* a shop-info edit that reaches the prompt clears the response cache;
+* a template edit rebuilds only the conversation flow;
+* a catalog edit pointing at an image added since startup serves it;
+* a broken file is ignored and the previous data stays in use;
+* request threads keep answering while the data is reloaded under them.
+
+Also times a stock-only reload against a full rebuild. Exits non-zero if
+any check fails.
+
+Run from python-server/:  python benchmarks/bench_reload.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = tempfile.mkdtemp(prefix="shop-data-")
+shutil.copytree(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"), DATA_DIR,
+                dirs_exist_ok=True)
+# The watcher is left off; checks call shop.check() directly. Retrieval is
+# off so the FAQ question below is answered (and cached) by the model.
+os.environ.update({"AI_BACKEND": "fake", "FAKE_MODEL_LATENCY": "0", "LOG_FILE": "", "RETRIEVAL": "0",
+                   "SHOP_DATA_DIR": DATA_DIR, "SHOP_DATA_POLL": "0"})
+os.environ.pop("STATE_URL", None)
+
+import bot  # noqa: E402
+from shop_data import SECTIONS, freeze, read_section  # noqa: E402
+
+NUMBER = "94770003001"
+
+
+def edit(name, change):
+    path = os.path.join(DATA_DIR, name)
+    with open(path, encoding="utf-8") as data:
+        content = json.load(data)
+    change(content)
+    with open(path, "w", encoding="utf-8") as data:
+        json.dump(content, data, ensure_ascii=False, indent=2)
+    # Make sure the mtime moves even on coarse-grained filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def send(message, number=NUMBER):
+    return bot.app.test_client().post("/send", json={"number": number, "message": message}).get_json()["response"]
+
+
+def stock_reply():
+    return bot.handle_stock_inquiry("iphone 15 thiyenawada", "english", bot.shop.current)
+
+
+def set_stock(quantity):
+    def change(shop):
+        shop["english"]["stock"]["iPhone 15"] = quantity
+        shop["sinhala"]["stock"]["iPhone 15"] = quantity
+    return change
+
+
+def check_stock_edit():
+    for message in ("hi", "1", "1", "Is there a warranty on used phones?"):
+        send(message)
+    before = bot.shop.current
+    cached = bot.response_cache.stats()["entries"]
+    assert cached, "expected a cached AI answer"
+
+    edit("shop.json", set_stock(0))
+    assert bot.shop.check() == {"shop"}
+    after = bot.shop.current
+    assert "out of stock" in stock_reply(), stock_reply()
+    assert after.catalog is not before.catalog
+    assert after.catalog.aliases is before.catalog.aliases, "stock edit re-indexed the catalog"
+    assert after.conversation is before.conversation
+    # Readers holding the old version still see the old count
+    assert before.catalog.get("iphone 15").stock != 0
+    assert bot.response_cache.stats()["entries"] == cached, "stock edit dropped cached answers"
+    assert bot.chat_states.get(NUMBER).current_stage == "interaction"
+    print(f"stock edit: served after one check, session kept, {cached} cached answers kept")
+
+
+def check_prompt_edit():
+    version = bot.response_cache.version
+    edit("shop.json", lambda shop: shop["english"].update(phone="0767410963"))
+    assert bot.shop.check() == {"shop"}
+    assert bot.response_cache.version != version
+    assert bot.response_cache.stats()["entries"] == 0
+    assert "0767410963" in bot.prompt_builder.prefix("english")
+    print("prompt edit: prefix rebuilt, response cache cleared")
+
+
+def check_template_edit():
+    before = bot.shop.current
+    edit("messages.json", lambda data: data["messages"]["english"].update(
+        menu_contact="Call us on 0767410963 or visit us at No.30 Panadura Road, Horana."))
+    assert bot.shop.check() == {"messages"}
+    after = bot.shop.current
+    assert after.catalog is before.catalog
+    assert after.conversation is not before.conversation
+    number = "94770003002"
+    send("hi", number)
+    send("1", number)
+    assert send("4", number).startswith("Call us on"), "new template not served"
+    print("template edit: conversation flow rebuilt, catalog reused")
+
+
+def check_image_edit():
+    relative = "/phones/apple/iphone15-new.jpeg"
+    path = os.path.join(bot.app.static_folder, "images", relative.lstrip("/"))
+    shutil.copyfile(os.path.join(bot.app.static_folder, "images", "phones", "apple", "iphone15.jpeg"), path)
+    try:
+        with bot.app.test_request_context():
+            # Resolved (and cached) before the registry knows the file
+            assert bot.image_url("/static/images" + relative) is None
+            edit("catalog.json", lambda data: data["images"]["phones"]["apple"].update({"iPhone 15": relative}))
+            assert bot.shop.check() == {"catalog"}
+            assert bot.shop.current.catalog.get("iphone 15").image == "/static/images" + relative
+            url = bot.image_url("/static/images" + relative)
+        assert url and url.endswith(relative), url
+        assert bot.media_registry.by_path("/static/images" + relative) is not None
+    finally:
+        os.remove(path)
+    print("image edit: new image picked up by the registry and served after one check")
+
+
+def check_broken_file():
+    before = bot.shop.current
+    errors = bot.shop.errors
+    path = os.path.join(DATA_DIR, "shop.json")
+    with open(path, "a", encoding="utf-8") as data:
+        data.write("{ half a write")
+    assert bot.shop.check() == set()
+    assert bot.shop.errors == errors + 1
+    assert bot.shop.current is before
+    assert "out of stock" in stock_reply()
+    # Repair the file; the next check picks it up again
+    with open(path, encoding="utf-8") as data:
+        content = data.read()
+    with open(path, "w", encoding="utf-8") as data:
+        data.write(content[:content.rindex("{ half a write")])
+    edit("shop.json", set_stock(3))
+    assert bot.shop.check() == {"shop"}
+    assert "3 units" in stock_reply(), stock_reply()
+    print("broken file: ignored, previous data kept until it was fixed")
+
+
+def check_concurrent_reads(reloads=50, readers=4):
+    stop = threading.Event()
+    answered = [0] * readers
+    failures = []
+
+    def reader(index):
+        number = f"9477000310{index}"
+        for message in ("hi", "1", "1"):
+            send(message, number)
+        while not stop.is_set():
+            reply = stock_reply()
+            if "iPhone 15" not in reply:
+                failures.append(reply)
+            answered[index] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    for i in range(reloads):
+        edit("shop.json", set_stock(i % 5))
+        bot.shop.check()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not failures, failures[:3]
+    print(f"concurrent: {reloads} stock reloads in {elapsed:.2f}s while {readers} readers answered "
+          f"{sum(answered)} lookups, none failed")
+
+
+def time_rebuilds(rounds=50):
+    state = bot.shop.current
+    sections = {name: freeze(read_section(name, DATA_DIR)) for name in SECTIONS}
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        bot.build_shop_state(sections, state, frozenset({"shop"}))
+    stock_only = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        bot.build_shop_state(sections, None, frozenset(SECTIONS))
+    full = (time.perf_counter() - start) / rounds
+    print(f"rebuild: stock-only {stock_only * 1000:.2f} ms, full {full * 1000:.2f} ms ({full / stock_only:.0f}x)")
+
+
+def main():
+    try:
+        check_stock_edit()
+        check_prompt_edit()
+        check_template_edit()
+        check_image_edit()
+        check_broken_file()
+        check_concurrent_reads()
+        time_rebuilds()
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
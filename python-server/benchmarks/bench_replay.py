@@ -0,0 +1,236 @@
+"""Replay benchmark for the /send pipeline.
+
+Replays a JSONL corpus of {number, message} conversations (English,
+Sinhala and Singlish) through the Flask test client against the
+deterministic fake model, and reports throughput, latency percentiles,
+per-stage timings from the bot's own metrics, peak RSS and the number of
+sessions held.
+
+Each number's messages are sent in order by one client thread; different
+numbers run on parallel clients. --repeat clones the corpus under new
+numbers to scale it up. Thread scheduling decides how many identical
+questions coalesce or hit the cache, so each figure is the median of
+--runs replays, each with fresh numbers and an empty response cache.
+
+With --baseline the run fails (exit status 1) when throughput drops or a
+latency percentile or peak RSS grows by more than --tolerance compared
+with the stored baseline. --save-baseline writes the current results.
+Baselines are machine-specific: regenerate one before comparing on a new
+host.
+
+Run from python-server/:  python benchmarks/bench_replay.py --baseline benchmarks/replay/baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "replay", "corpus.jsonl")
+
+# Metrics where a larger number is better; everything else compared is "lower is better"
+HIGHER_IS_BETTER = {"messages_per_second"}
+COMPARED = ("messages_per_second", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=20, help="replay the corpus this many times under new numbers")
+    # More clients than AI workers (AI_WORKERS, default 8) mostly measures queueing
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--runs", type=int, default=3, help="replays to take the median of")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--baseline", help="fail if results regress against this JSON file")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--slack-ms", type=float, default=2.0,
+                        help="absolute latency change always allowed, for sub-millisecond percentiles")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    # Must run before bot is imported: the bot reads its configuration at import time
+    os.environ["AI_BACKEND"] = "fake"
+    os.environ["FAKE_MODEL_LATENCY"] = str(args.model_latency)
+    os.environ["FAKE_MODEL_JITTER"] = "0"
+    os.environ["FAKE_MODEL_SEED"] = "1"
+    os.environ["LOG_FILE"] = ""
+    for name in ("STATE_URL", "SESSION_DB", "RABBITMQ_URL", "STREAM_REPLIES", "GOOGLE_API_KEY"):
+        os.environ.pop(name, None)
+
+
+def load_conversations(path, repeat, run_number=0):
+    conversations = OrderedDict()
+    with open(path, encoding="utf-8") as corpus:
+        for line in corpus:
+            if line.strip():
+                item = json.loads(line)
+                conversations.setdefault(item["number"], []).append(item["message"])
+    replayed = []
+    for round_number in range(repeat):
+        for number, messages in conversations.items():
+            replayed.append((f"{number}{run_number}{round_number:03d}", messages))
+    return replayed
+
+
+def percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def stage_deltas(before, after):
+    stages = {}
+    for key, (count, total) in after.items():
+        count -= before.get(key, (0, 0.0))[0]
+        total -= before.get(key, (0, 0.0))[1]
+        if count:
+            stages[key[0]] = {"count": count, "mean_ms": round(total / count * 1000, 3), "total_s": round(total, 3)}
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["total_s"]))
+
+
+def replay(bot, conversations, clients):
+    work = queue.Queue()
+    for conversation in conversations:
+        work.put(conversation)
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def client():
+        test_client = bot.app.test_client()
+        local = []
+        while True:
+            try:
+                number, messages = work.get_nowait()
+            except queue.Empty:
+                break
+            for message in messages:
+                start = time.perf_counter()
+                response = test_client.post("/send", json={"number": number, "message": message})
+                local.append(time.perf_counter() - start)
+                if response.status_code != 200 or not response.get_json().get("response"):
+                    with lock:
+                        failures.append((number, message, response.status_code))
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - start
+
+
+def run_once(bot, args, run_number):
+    bot.response_cache.clear()
+    conversations = load_conversations(args.corpus, args.repeat, run_number)
+    sessions_before = len(bot.chat_states)
+    calls_before = bot.ai_model.calls
+    stages_before = bot.STAGE_SECONDS.totals()
+    latencies, failures, elapsed = replay(bot, conversations, args.clients)
+    ordered = sorted(latencies)
+    return {
+        "messages": len(latencies),
+        "conversations": len(conversations),
+        "clients": args.clients,
+        "model_latency_s": args.model_latency,
+        "failures": len(failures),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "sessions": len(bot.chat_states) - sessions_before,
+        "model_calls": bot.ai_model.calls - calls_before,
+        "stages": stage_deltas(stages_before, bot.STAGE_SECONDS.totals()),
+    }
+
+
+def run(args):
+    configure_environment(args)
+    import bot
+
+    runs = [run_once(bot, args, run_number) for run_number in range(args.runs)]
+    results = dict(runs[len(runs) // 2])
+    results["runs"] = len(runs)
+    for name in COMPARED + ("elapsed_s", "failures", "model_calls"):
+        results[name] = statistics.median(result[name] for result in runs)
+    # Peak RSS only grows, so the last run holds the overall peak
+    results["peak_rss_mb"] = runs[-1]["peak_rss_mb"]
+    return results
+
+
+def compare(results, baseline, tolerance, slack_ms=0.0):
+    regressions = []
+    for name in COMPARED:
+        if name not in baseline:
+            continue
+        old, new = baseline[name], results[name]
+        if name in HIGHER_IS_BETTER:
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance) + (slack_ms if name.endswith("_ms") else 0)
+        if worse:
+            regressions.append(f"{name}: {new} vs baseline {old} (tolerance {tolerance:.0%})")
+    if results["failures"] > baseline.get("failures", 0):
+        regressions.append(f"failures: {results['failures']} vs baseline {baseline.get('failures', 0)}")
+    return regressions
+
+
+def print_report(results):
+    print(f"{results['messages']} messages in {results['conversations']} conversations, "
+          f"{results['clients']} clients, fake model {results['model_latency_s'] * 1000:.0f} ms, "
+          f"median of {results['runs']} runs")
+    print(f"throughput   {results['messages_per_second']:>9.1f} msg/s   failures {results['failures']}")
+    print(f"latency      p50 {results['p50_ms']:.2f} ms   p95 {results['p95_ms']:.2f} ms   p99 {results['p99_ms']:.2f} ms")
+    print(f"memory       peak RSS {results['peak_rss_mb']:.1f} MB   sessions {results['sessions']}"
+          f"   model calls {results['model_calls']}")
+    print("stage                      count    mean ms    total s")
+    for stage, timing in results["stages"].items():
+        print(f"  {stage:<22} {timing['count']:>8} {timing['mean_ms']:>10.3f} {timing['total_s']:>10.3f}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    logging.disable(logging.CRITICAL)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+            out.write("\n")
+        print(f"baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as stored:
+            regressions = compare(results, json.load(stored), args.tolerance, args.slack_ms)
+        if regressions:
+            print("REGRESSION against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"no regression against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Retries, retry budget and circuit breaker against a fault-injecting model.
+
+Drives AIBackend with FakeModel failures switched on and off:
+
+* transient 503s: retries turn most failures into answers, and the
+  retry budget keeps the extra load to a fraction of the calls;
+* bad requests (400) are never retried;
+* full outage: the circuit opens after a few failures, the model stops
+  being called and fallbacks come back without waiting;
+* recovery: after the reset timeout one trial call closes the circuit;
+* a slow model that misses deadlines but answers does not open it;
+* through bot.py, an open circuit answers with the local FAQ text and is
+  visible on /health/ready and /metrics.
+
+Exits non-zero if any check fails.
+
+Run from python-server/:  python benchmarks/bench_resilience.py
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.update({"AI_BACKEND": "fake", "FAKE_MODEL_LATENCY": "0.01", "FAKE_MODEL_JITTER": "0", "LOG_FILE": ""})
+os.environ.pop("STATE_URL", None)
+
+from ai_backend import AIBackend, FakeModel  # noqa: E402
+from resilience import CircuitBreaker, RetryBudget  # noqa: E402
+
+FALLBACK = "FAQ"
+
+
+def drive(backend, calls, clients=8):
+    """Run `calls` generate() calls from `clients` threads; returns (answers, latencies)."""
+    results, latencies = [], []
+    lock = threading.Lock()
+
+    def client(client_id):
+        for i in range(client_id, calls, clients):
+            start = time.perf_counter()
+            text = backend.generate(f"question {i}", FALLBACK, timeout=1.0)
+            with lock:
+                results.append(text)
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    answered = sum(text != FALLBACK for text in results)
+    return answered, sorted(latencies)
+
+
+def backend_for(model, retries=2, failure_threshold=1000, reset_timeout=30.0, timeout=1.0):
+    return AIBackend(model, max_workers=8, max_pending=32, timeout=timeout, retries=retries, backoff=0.01,
+                     max_backoff=0.05, retry_budget=RetryBudget(ratio=0.2, min_per_second=0, max_tokens=5),
+                     breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout))
+
+
+def check_transient_errors(calls=400):
+    plain, _ = drive(backend_for(FakeModel(latency=0.002, jitter=0, error_rate=0.2, seed=1), retries=0), calls)
+    backend = backend_for(FakeModel(latency=0.002, jitter=0, error_rate=0.2, seed=1))
+    retried, _ = drive(backend, calls)
+    spent = backend.retry_budget.spent
+    assert retried > plain, (plain, retried)
+    # Deposits are 0.2 per call on top of the initial 5 tokens
+    assert spent <= calls * 0.2 + 5, spent
+    print(f"20% transient errors: {plain / calls:.0%} answered without retries, {retried / calls:.0%} with "
+          f"({spent} retries = {spent / calls:.0%} extra calls, {backend.retry_budget.denied} denied by the budget)")
+
+
+def check_not_retryable():
+    model = FakeModel(latency=0, jitter=0, error_rate=1.0, error_code=400)
+    backend = backend_for(model)
+    drive(backend, 20, clients=1)
+    assert model.calls == 20 and backend.retry_budget.spent == 0, (model.calls, backend.retry_budget.spent)
+    print("400 errors: 20 calls, 0 retries")
+
+
+def check_outage_and_recovery(calls=400):
+    model = FakeModel(latency=0.02, jitter=0, error_rate=1.0, seed=2)
+    unprotected = backend_for(FakeModel(latency=0.02, jitter=0, error_rate=1.0, seed=2))
+    _, slow = drive(unprotected, calls)
+
+    backend = backend_for(model, failure_threshold=5, reset_timeout=0.3)
+    _, fast = drive(backend, calls)
+    assert backend.breaker.state == CircuitBreaker.OPEN
+    # A few failures (and in-flight retries) trip it; the rest never reach the model
+    assert model.calls < 40, model.calls
+    median_slow, median_fast = slow[len(slow) // 2], fast[len(fast) // 2]
+    assert median_fast < median_slow / 10, (median_fast, median_slow)
+    print(f"outage: {calls} calls -> {model.calls} model calls, {backend.breaker.rejected} refused by the open circuit; "
+          f"median fallback {median_fast * 1000:.2f} ms vs {median_slow * 1000:.1f} ms without the breaker")
+
+    model.error_rate = 0.0
+    time.sleep(0.35)
+    assert backend.breaker.state == CircuitBreaker.HALF_OPEN
+    assert backend.generate("probe", FALLBACK) != FALLBACK
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+    answered, _ = drive(backend, 50)
+    assert answered == 50, answered
+    print("recovery: one trial call after the reset timeout closed the circuit; 50/50 answered")
+
+
+def check_slow_model():
+    # Missed deadlines get the fallback but are not failures: the answers
+    # still arrive late, so the circuit stays closed
+    late = []
+    model = FakeModel(latency=0.1, jitter=0)
+    backend = backend_for(model, failure_threshold=5, timeout=0.02)
+    backend.late_handler = lambda context, text: late.append(context)
+    for i in range(20):
+        assert backend.generate(f"slow {i}", FALLBACK, context=i, timeout=0.02) == FALLBACK
+    backend.shutdown()
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+    assert len(late) == 20, len(late)
+    print("slow model: 20 missed deadlines, circuit still closed, 20 late answers delivered")
+
+
+def check_bot():
+    import bot
+
+    client = bot.app.test_client()
+    number = "94770005001"
+    for message in ("hi", "1", "1"):
+        client.post("/send", json={"number": number, "message": message})
+    bot.ai_model.error_rate = 1.0
+    faq = bot.shop.current.faq["english"]
+    for i in range(bot.ai_backend.breaker.failure_threshold + 3):
+        reply = client.post("/send", json={"number": number, "message": f"do you sell tablets {i}"}).get_json()
+        assert reply["response"] in faq.values(), reply
+    calls = bot.ai_model.calls
+    reply = client.post("/send", json={"number": number, "message": "what are your opening hours?"}).get_json()
+    assert bot.ai_model.calls == calls, "model called while the circuit was open"
+    assert reply["response"] in faq.values(), reply
+    ready = client.get("/health/ready").get_json()
+    assert ready["ai_circuit"] == "open", ready
+    assert "chatbot_ai_circuit_state 2" in client.get("/metrics").get_data(as_text=True)
+    print("bot: FAQ answers while the circuit is open; state on /health/ready and /metrics")
+
+
+def main():
+    logging.disable(logging.ERROR)
+    check_transient_errors()
+    check_not_retryable()
+    check_outage_and_recovery()
+    check_slow_model()
+    check_bot()
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
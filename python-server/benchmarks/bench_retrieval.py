@@ -0,0 +1,181 @@
+"""Local retrieval tier in front of the model.
+
+Checks that the TF-IDF retriever
+
+* answers paraphrased FAQ, shop-info, price and stock questions in all
+  three languages with the right topic, and leaves questions it should
+  not answer (greetings, repairs quotes, products the shop does not list,
+  product inquiries that look like shop-info questions) to the model;
+* never answers a replay-corpus message with the wrong topic;
+* cuts the model calls needed to replay the corpus. The replay is run once
+  with RETRIEVAL on and once with it off, with the response cache cleared
+  between messages so every question that reaches the model is counted.
+
+Also reports search speed for single messages and batches. Exits non-zero
+if any check fails.
+
+Run from python-server/:  python benchmarks/bench_retrieval.py
+"""
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.update({"AI_BACKEND": "fake", "FAKE_MODEL_LATENCY": "0", "FAKE_MODEL_JITTER": "0",
+                   "LOG_FILE": "", "SHOP_DATA_POLL": "0"})
+for name in ("STATE_URL", "SESSION_DB", "RABBITMQ_URL", "STREAM_REPLIES", "GOOGLE_API_KEY"):
+    os.environ.pop(name, None)
+
+import bot  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "benchmarks", "replay", "corpus.jsonl")
+
+# (message, language, topic answered locally or None for the model).
+# Phrased differently from the indexed questions on purpose.
+EXPECTED = [
+    ("How long is the warranty on a new phone?", "english", "warranty"),
+    ("Can you deliver my order to Kandy?", "english", "delivery"),
+    ("Can I pay with a Visa card?", "english", "payment"),
+    ("What time do you close today?", "english", "business_hours"),
+    ("Where is the shop?", "english", "location"),
+    ("Can I get your phone number please", "english", "contact"),
+    ("Can you remove an FRP lock?", "english", "services"),
+    ("How much is the iPhone 15?", "english", "price"),
+    ("Is the Redmi Note 13 Pro in stock?", "english", "stock"),
+    ("hello", "english", None),
+    ("my phone fell in water what should I do", "english", None),
+    ("do you have Nokia 3310", "english", None),
+    ("how much is it", "english", None),
+    # Variants and accessories of a listed phone are different products
+    ("iphone 15 pro price", "english", None),
+    ("do you have iphone 15 pro in stock", "english", None),
+    ("samsung galaxy s23 ultra thiyenawada", "singlish", None),
+    ("do you have an iphone 15 case", "english", None),
+    ("iphone 15 128gb price", "english", None),
+    ("වොරන්ටි කාලය කීයද", "sinhala", "warranty"),
+    ("කඩේ තියෙන්නේ කොහේද", "sinhala", "location"),
+    ("iPhone 15 මිල කීයද", "sinhala", "price"),
+    ("ස්තූතියි", "sinhala", None),
+    ("warranty eka thiyenawada", "singlish", "warranty"),
+    ("gedarata delivery karanawada", "singlish", "delivery"),
+    ("iphone 15 price eka kiyada", "singlish", "price"),
+    # Only iPhone prices are listed, so the model answers this one
+    ("galaxy s23 price eka kiyada", "singlish", None),
+    ("earbuds thiyenawada", "singlish", "stock"),
+    ("ela machan", "singlish", None),
+    # Product inquiries and the customer's own number are not the shop's contact details
+    ("සැම්සං දුරකථන තියෙනවද", "sinhala", None),
+    ("අලුත් දුරකථන තියෙනවද", "sinhala", None),
+    ("my phone number changed", "english", None),
+]
+
+
+def check_expected(retrieval, catalog):
+    wrong = []
+    for message, language, expected in EXPECTED:
+        local = retrieval.answer(message, language, catalog, bot.detect_intent(message, language))
+        topic = local[0] if local else None
+        if topic != expected:
+            wrong.append((message, expected, topic))
+    assert not wrong, wrong
+    answered = sum(topic is not None for _, _, topic in EXPECTED)
+    print(f"labelled: {len(EXPECTED)} messages, {answered} answered locally with the right topic, "
+          f"{len(EXPECTED) - answered} left to the model")
+
+
+def corpus_conversations():
+    conversations = OrderedDict()
+    with open(CORPUS, encoding="utf-8") as corpus:
+        for line in corpus:
+            if line.strip():
+                item = json.loads(line)
+                conversations.setdefault(item["number"], []).append(item)
+    return conversations
+
+
+def check_corpus_precision(retrieval):
+    # Topics a corpus message may legitimately be answered with; anything
+    # else answered locally is a wrong answer
+    allowed = {
+        "warranty": ("warranty", "වගකීම", "වොරන්ටි"),
+        "delivery": ("deliver", "ඩිලිවරි"),
+        "payment": ("pay", "card", "ගෙව"),
+        "business_hours": ("open", "close", "විවෘත", "hours"),
+        "location": ("where", "koheda", "kohenda", "කොහේද", "ලිපින", "address"),
+        "contact": ("number", "අංක", "contact"),
+        "services": ("icloud", "software", "frp", "unlock"),
+        "price": ("price", "kiyada", "කීයද", "how much", "මිල"),
+        "stock": ("have", "stock", "thiyenawada", "තියෙනවද", "තිබේද", "available"),
+    }
+    messages = sorted({item["message"] for items in corpus_conversations().values() for item in items})
+    wrong = []
+    for message, (topic, _) in zip(messages, retrieval.topics(messages)):
+        if topic is not None and not any(word in message.lower() for word in allowed[topic]):
+            wrong.append((message, topic))
+    assert not wrong, wrong
+    print(f"corpus: {len(messages)} distinct messages, no topic answered outside its keywords")
+
+
+def replay(enabled):
+    """Replay the corpus; returns (model calls, local answers by topic)."""
+    bot.RETRIEVAL = enabled
+    bot.ai_model.calls = 0
+    local = Counter()
+    client = bot.app.test_client()
+    for number, items in corpus_conversations().items():
+        number = f"{number}{int(enabled)}"
+        client.post("/send", json={"number": number, "message": "#reset"})
+        for item in items:
+            bot.response_cache.clear()
+            before = bot.ai_model.calls
+            client.post("/send", json={"number": number, "message": item["message"]})
+            if enabled and bot.ai_model.calls == before:
+                topic = bot.shop.current.retrieval.topic(item["message"])
+                if topic is not None:
+                    local[topic] += 1
+    return bot.ai_model.calls, local
+
+
+def check_model_calls():
+    without, _ = replay(False)
+    with_retrieval, local = replay(True)
+    assert with_retrieval < without, (with_retrieval, without)
+    avoided = 1 - with_retrieval / without
+    print(f"replay: {without} model calls without retrieval, {with_retrieval} with it; "
+          f"{avoided:.0%} of LLM calls avoided")
+    print("  answered locally: " + ", ".join(f"{topic} {count}" for topic, count in local.most_common()))
+    bot.RETRIEVAL = True
+
+
+def time_search(retrieval, rounds=20):
+    messages = sorted({item["message"] for items in corpus_conversations().values() for item in items})
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            retrieval.index.search([message])
+    single = (time.perf_counter() - start) / (rounds * len(messages))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        retrieval.index.search(messages)
+    batch = (time.perf_counter() - start) / (rounds * len(messages))
+    print(f"search: {len(retrieval.index)} indexed questions, {len(retrieval.index.vocabulary)} n-grams; "
+          f"{single * 1e6:.0f} us per message alone, {batch * 1e6:.0f} us in a batch of {len(messages)}")
+
+
+def main():
+    logging.disable(logging.ERROR)
+    data = bot.shop.current
+    check_expected(data.retrieval, data.catalog)
+    check_corpus_precision(data.retrieval)
+    check_model_calls()
+    time_search(data.retrieval)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Concurrency check for request coalescing against a slow fake model.
+
+A burst of identical questions (a promo going out) should produce one model
+call per distinct question. Errors from the shared call must reach every
+waiter. Exits non-zero if either property does not hold.
+
+Run from python-server/:  python benchmarks/bench_singleflight.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_backend import FakeModel  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+
+
+def burst(group, model, keys, clients_per_key):
+    barrier = threading.Barrier(len(keys) * clients_per_key)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def client(key):
+        barrier.wait()
+        try:
+            value = group.do(key, lambda: model.generate(key), timeout=5)
+            with lock:
+                results.append((key, value))
+        except Exception as e:
+            with lock:
+                errors.append((key, e))
+
+    threads = [threading.Thread(target=client, args=(key,)) for key in keys for _ in range(clients_per_key)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors, time.perf_counter() - start
+
+
+def main():
+    keys = ["iphone 15 price", "s24 stock", "shop eka koheda"]
+    clients_per_key = 40
+
+    model = FakeModel(latency=0.5, jitter=0.0)
+    group = SingleFlight()
+    results, errors, elapsed = burst(group, model, keys, clients_per_key)
+    answers = {key: {value for k, value in results if k == key} for key in keys}
+    print(f"{len(results)} requests answered in {elapsed:.2f}s with {model.calls} model calls")
+    print(f"stats: {group.stats()}")
+    assert not errors, errors
+    assert model.calls == len(keys), model.calls
+    assert all(len(values) == 1 for values in answers.values()), answers
+
+    failing = FakeModel(latency=0.3, jitter=0.0, error_rate=1.0)
+    results, errors, _ = burst(SingleFlight(), failing, keys[:1], clients_per_key)
+    print(f"failing model: {len(errors)} waiters saw the error from {failing.calls} call(s)")
+    assert failing.calls == 1 and len(errors) == clients_per_key and not results
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
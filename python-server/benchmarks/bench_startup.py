@@ -0,0 +1,101 @@
+"""Cold-start cost of the Python API.
+
+Starts a fresh interpreter per run and times, from process start:
+
+* import   - `import bot` finished (the app can bind its port);
+* first    - the welcome reply to a first "hi" was returned;
+* ready    - GET /health/ready answered 200.
+
+Three setups are compared, each with a dummy GOOGLE_API_KEY so the Gemini
+client is configured but never called:
+
+* eager    - google.generativeai imported and configured before the app,
+             as bot.py used to do at import time;
+* lazy     - AI_WARMUP=0, the SDK is imported on the first AI question;
+* warm-up  - AI_WARMUP=1 (the default), the SDK loads on a background
+             thread while the app already answers.
+
+Exits non-zero if the lazy import is not faster than the eager one or if
+the menu path pulls in the SDK.
+
+Run from python-server/:  python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, sys, time
+if os.environ.get("EAGER_SDK") == "1":
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    genai.GenerativeModel("gemini-1.5-flash")
+import bot
+imported = time.time()
+client = bot.app.test_client()
+client.post("/send", json={"number": "94770004001", "message": "hi"})
+first = time.time()
+sdk_after_first = "google.generativeai" in sys.modules
+ready = None
+while time.time() < first + 30:
+    if client.get("/health/ready").status_code == 200:
+        ready = time.time()
+        break
+    time.sleep(0.002)
+print(json.dumps({"import": imported, "first": first, "ready": ready, "sdk_after_first": sdk_after_first}))
+"""
+
+SETUPS = {
+    "eager": {"EAGER_SDK": "1", "AI_WARMUP": "0"},
+    "lazy": {"AI_WARMUP": "0"},
+    "warm-up": {"AI_WARMUP": "1"},
+}
+
+
+def run_once(extra_env):
+    env = dict(os.environ, GOOGLE_API_KEY="benchmark-dummy-key", LOG_FILE="", SHOP_DATA_POLL="0", **extra_env)
+    for name in ("AI_BACKEND", "STATE_URL", "SESSION_DB", "RABBITMQ_URL"):
+        env.pop(name, None)
+    start = time.time()
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return {
+        "import": result["import"] - start,
+        "first": result["first"] - start,
+        "ready": result["ready"] - start if result["ready"] else None,
+        "sdk_after_first": result["sdk_after_first"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per setup; medians are reported")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'setup':<10}{'import s':>10}{'first s':>10}{'ready s':>10}   SDK loaded by first reply")
+    for name, extra_env in SETUPS.items():
+        runs = [run_once(extra_env) for _ in range(args.runs)]
+        medians = {key: statistics.median(run[key] for run in runs if run[key] is not None)
+                   for key in ("import", "first", "ready")}
+        results[name] = dict(medians, sdk_after_first=any(run["sdk_after_first"] for run in runs))
+        print(f"{name:<10}{medians['import']:>10.3f}{medians['first']:>10.3f}{medians['ready']:>10.3f}   "
+              f"{'yes' if results[name]['sdk_after_first'] else 'no'}")
+
+    eager, lazy = results["eager"], results["lazy"]
+    print(f"\nlazy start: import {eager['import'] / lazy['import']:.1f}x faster, "
+          f"first reply {eager['first'] - lazy['first']:.3f}s sooner")
+    assert lazy["import"] < eager["import"], "lazy import is not faster"
+    assert not lazy["sdk_after_first"], "the welcome reply imported the Gemini SDK"
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Time to first message, streamed vs. blocking AI replies.
+
+Uses a fake streaming model and the in-memory broker, so no Gemini key or
+RabbitMQ is needed. Checks that chunks for each customer are published in
+order and add up to the full reply, then runs one message through the
+bot's /send route with STREAM_REPLIES on.
+
+Run from python-server/:  python benchmarks/bench_streaming.py
+"""
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("AI_BACKEND", "fake")
+os.environ.setdefault("STREAM_REPLIES", "1")
+os.environ.setdefault("LOG_FILE", "")
+# The questions below must reach the model, not the local FAQ answers
+os.environ.setdefault("RETRIEVAL", "0")
+
+from ai_backend import AIBackend, FakeModel  # noqa: E402
+from messaging import InMemoryBroker, OUTBOUND_QUEUE  # noqa: E402
+from streaming import ReplyStream, chunk_stream  # noqa: E402
+
+CUSTOMERS = 8
+SENTENCES = 12
+
+
+class WholeReply:
+    """Blocking view of the same model: the reply is only available once
+    every token has been generated."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate(self, prompt):
+        return "".join(self.model.generate_stream(prompt))
+
+
+def blocking(model):
+    backend = AIBackend(WholeReply(model), max_workers=CUSTOMERS, timeout=30)
+    latencies = []
+
+    def customer(i):
+        start = time.perf_counter()
+        backend.generate(f"question {i}", "fallback")
+        latencies.append(time.perf_counter() - start)
+
+    run(customer)
+    backend.shutdown()
+    return latencies
+
+
+def streamed(model, broker):
+    backend = AIBackend(model, max_workers=CUSTOMERS, timeout=30)
+    streams = []
+
+    def customer(i):
+        stream = ReplyStream(broker, f"9477000000{i}@c.us")
+        streams.append(stream)
+        text, stream.delivered, complete = backend.stream(f"question {i}", stream.send, "fallback")
+        assert stream.delivered and complete and text.startswith("Fake reply"), text
+
+    run(customer)
+    backend.shutdown()
+    return [stream.first_chunk_seconds for stream in streams]
+
+
+def run(customer):
+    threads = [threading.Thread(target=customer, args=(i,)) for i in range(CUSTOMERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check_order(broker):
+    by_number = {}
+    for queue_name, payload in broker.published:
+        assert queue_name == OUTBOUND_QUEUE
+        by_number.setdefault(payload["number"], []).append(payload["message"])
+    for number, chunks in by_number.items():
+        sentences = " ".join(chunks).split(". ")
+        numbers = [int(sentence.split(" sentence ")[1].split(" ")[0]) for sentence in sentences]
+        assert numbers == list(range(1, SENTENCES + 1)), (number, numbers)
+    return sum(len(chunks) for chunks in by_number.values()) / len(by_number)
+
+
+def check_bot():
+    import bot
+
+    broker = InMemoryBroker()
+    bot.outbound_broker = broker
+    client = bot.app.test_client()
+    number = "94770000999"
+    for message in ("hi", "1", "1", "Do you have a warranty on used phones?"):
+        response = client.post("/send", json={"number": number, "message": message}).get_json()
+    chunks = [payload["message"] for _, payload in broker.published]
+    assert response.get("streamed") and chunks, (response, chunks)
+    assert " ".join(chunks) == " ".join(response["response"].split())
+    print(f"bot /send: reply streamed as {len(chunks)} chunks, response marked streamed")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    make_model = lambda: FakeModel(latency=0.3, jitter=0.0, stream_sentences=SENTENCES, token_latency=0.01)  # noqa: E731
+
+    # Abbreviations do not end a sentence; boundaries before min_chars are skipped
+    pieces = ["Our shop is at No. 30 Panadura Road. ", "The price is Rs. 275,", "000. ", "Call us!\n\nThanks."]
+    assert list(chunk_stream(pieces, min_chars=10)) == [
+        "Our shop is at No. 30 Panadura Road.", "The price is Rs. 275,000.", "Call us!\n\nThanks."]
+
+    full = blocking(make_model())
+    broker = InMemoryBroker()
+    first = streamed(make_model(), broker)
+    per_reply = check_order(broker)
+
+    print(f"{CUSTOMERS} customers, {SENTENCES}-sentence replies")
+    print(f"blocking   time to first message: median {statistics.median(full) * 1000:.0f} ms")
+    print(f"streaming  time to first message: median {statistics.median(first) * 1000:.0f} ms"
+          f" ({per_reply:.1f} chunks per reply, in order)")
+    check_bot()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Load test: /send throughput as the number of gunicorn workers grows.
+
+Starts gunicorn with the fake AI backend for each worker count, drives it
+with concurrent HTTP clients (one process each, so the load generator is
+not GIL-bound) and prints requests per second. Sessions go to
+a shared SQLite file so conversations stay consistent across workers.
+
+Run from python-server/:  python benchmarks/bench_workers.py [1 2 4]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 5055
+CONVERSATION = ["hi", "1", "1", "what is the warranty period", "delivery to galle?", "do you sell samsung phones"]
+
+
+def wait_until_ready(timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def client(client_id, rounds):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    done = 0
+    for round_number in range(rounds):
+        for message in CONVERSATION:
+            body = json.dumps({"number": f"bench-{client_id}-{round_number}", "message": message})
+            conn.request("POST", "/send", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            done += 1
+    return done
+
+
+def run(workers, clients=16, rounds=8):
+    session_db = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_THREADS="4", PORT=str(PORT),
+               AI_BACKEND="fake", FAKE_MODEL_LATENCY="0.01", SESSION_DB=session_db)
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready()
+        with ProcessPoolExecutor(max_workers=clients) as pool:
+            start = time.perf_counter()
+            total = sum(pool.map(client, range(clients), [rounds] * clients))
+            elapsed = time.perf_counter() - start
+        return total / elapsed
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4]
+    baseline = None
+    for workers in counts:
+        rate = run(workers)
+        baseline = baseline or rate
+        print(f"{workers} worker(s): {rate:>8.1f} req/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
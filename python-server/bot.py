@@ -1,27 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, abort, Response
 import os
 import traceback
 import re
-import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
-import google.generativeai as genai
-from responses import MESSAGES, FAQ_RESPONSES, PRODUCT_IMAGES
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("chatbot.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+from intents import detect_intent
+from ai_backend import AIBackend, GeminiModel, FakeModel
+from resilience import CircuitBreaker, RetryBudget
+from sessions import SessionStore, SQLiteSessionBackend, KeyValueSessionBackend
+from shared_state import create_store
+from response_cache import ResponseCache
+from catalog import build_catalog
+from media import MediaRegistry
+from log_config import setup_logging, SAMPLED
+from prompts import PromptBuilder
+from singleflight import SingleFlight
+from streaming import ReplyStream
+from idempotency import MessageDeduplicator, LockStripes, StoreLocks
+from conversation import ConversationFlow
+from shop_data import ShopData, DEFAULT_DATA_DIR
+from retrieval import build_retriever
+from language_detect import detect_language
+from metrics import Registry, SamplingProfiler
+from messaging import OUTBOUND_QUEUE, RabbitMQBroker, chat_id_to_number, process_batch
 
 # Load environment variables
 load_dotenv()
 
+# Configure logging: records go through a queue to a background thread
+# that writes rotating JSON logs, so disk I/O stays off the request path
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Check for required environment variables
 api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key:
@@ -30,141 +43,329 @@ if not api_key:
 # Initialize Flask app
 app = Flask(__name__)
 
+# Per-stage latency and pipeline counters, exported on GET /metrics. With
+# several workers METRICS_DIR (set by gunicorn.conf.py) lets any of them
+# answer a scrape with the numbers of all of them.
+metrics = Registry(os.getenv("METRICS_DIR") or None, flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "5")))
+STAGE_SECONDS = metrics.histogram("chatbot_stage_seconds", "Time spent in each message pipeline stage", ["stage"])
+MESSAGE_SECONDS = metrics.histogram("chatbot_message_seconds", "End-to-end time to handle one message")
+MESSAGES_TOTAL = metrics.counter("chatbot_messages_total", "Messages handled, by intent and language", ["intent", "language"])
+CACHE_LOOKUPS = metrics.counter("chatbot_response_cache_lookups_total", "AI response cache lookups", ["result"])
+AI_ERRORS = metrics.counter("chatbot_ai_errors_total", "AI responses that failed with an error")
+AI_FALLBACKS = metrics.counter("chatbot_ai_fallbacks_total", "Replies answered from FAQ fallbacks instead of the model", ["reason"])
+LANGUAGE_DETECTIONS = metrics.counter("chatbot_language_detections_total",
+                                      "Messages whose detected language differed from the chat's", ["language", "action"])
+DUPLICATES_TOTAL = metrics.counter("chatbot_duplicate_messages_total", "Redelivered or retried messages skipped by message id")
+LOCAL_ANSWERS = metrics.counter("chatbot_local_answers_total", "Free-text questions answered by retrieval without the model", ["topic"])
+SHOP_RELOADS = metrics.counter("chatbot_shop_data_reloads_total", "Data files reloaded without a restart, by section", ["section"])
+AI_FIRST_CHUNK_SECONDS = metrics.histogram("chatbot_ai_first_chunk_seconds", "Time from receiving a message to publishing the first streamed reply chunk")
+# Sampling profiler, switched on at runtime via /debug/profile/start when PROFILER_ENABLED=1
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+profiler = SamplingProfiler()
+
 # Optional: Ensure your image folder exists
 IMAGE_FOLDER = os.path.join('static', 'images')
 if not os.path.exists(IMAGE_FOLDER):
     os.makedirs(IMAGE_FOLDER)
 
-# Store user states
-chat_states = {}
-
-# Define shop information
-SHOP_INFO = {
-    "english": {
-        "name": "Sun Mobile Horana",
-        "brands": ["Samsung", "Apple", "Xiaomi", "Oppo", "Vivo", "Huawei"],
-        "services": ["hardware repairs", "software repairs", "iCloud unlock", "FRP lock removal", "screen replacement"],
-        "address": "No.30 Panadura Road, Horana (In front of the Hall)",
-        "phone": "0767410963 / 0768371984 / 0764171984",
-        "hours": "9:00 AM to 8:00 PM, seven days a week",
-        "stock": {
-            "Samsung Galaxy S23": 10,
-            "iPhone 15": 5,
-            "Redmi Note 13 Pro": 15,
-            "Fast Charger": 20,
-            "Bluetooth Earbuds": 25
-        }
-    },
-    "sinhala": {
-        "name": "සුන් මොබයිල් හොරණ",
-        "brands": ["Samsung", "Apple", "Xiaomi", "Oppo", "Vivo", "Huawei"],
-        "services": ["හාඩ්වෙයාර් අලුත්වැඩියා", "සොෆ්ට්වෙයාර් අලුත්වැඩියා", "iCloud අගුළු ඉවත් කිරීම", "FRP අගුළු ඉවත් කිරීම", "තිර ප්‍රතිස්ථාපනය"],
-        "address": "අංක 30, පානදුර පාර, හොරණ (හෝල් එක ඉස්සරහ)",
-        "phone": "0767410963 / 0768371984 / 0764171984",
-        "hours": "උදේ 9:00 සිට රාත්‍රී 8:00 දක්වා, සතියේ දින හතම",
-        "stock": {
-            "Samsung Galaxy S23": 10,
-            "iPhone 15": 5,
-            "Redmi Note 13 Pro": 15,
-            "වේගවත් චාජර්": 20,
-            "බ්ලූටූත් ඉයර්බඩ්ස්": 25
-        }
-    },
-    "singlish": {
-        "name": "Sun Mobile Horana",
-        "brands": ["Samsung", "Apple", "Xiaomi", "Oppo", "Vivo", "Huawei"],
-        "services": ["hardware repairs", "software repairs", "iCloud unlock", "FRP unlock", "screen replacement"],
-        "address": "No.30 Panadura Road, Horana (Hall eka issaraha)",
-        "phone": "0767410963 / 0768371984 / 0764171984",
-        "hours": "9:00 AM to 8:00 PM, seven days a week"
-    }
-}
-
-class ChatState:
-    def __init__(self):
-        self.current_stage = "welcome"
-        self.language = "sinhala"
-        self.conversation_history = []
-        self.is_first_message = True
-        self.last_activity = time.time()
-
-    def reset(self):
-        saved_language = self.language
-        self.__init__()
-        self.language = saved_language
-
-    def add_to_history(self, message, response):
-        response_text = response["text"] if isinstance(response, dict) else response
-        self.conversation_history.append({"message": message, "response": response_text})
-        if len(self.conversation_history) > 10:
-            self.conversation_history.pop(0)
-        self.last_activity = time.time()
-
-# Setup Google AI
-try:
-    if api_key:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        logger.info("Google AI model initialized successfully")
+# Shared state for multi-worker deployments: STATE_URL=redis://... lets
+# every gunicorn worker see the same sessions and cached AI answers
+shared_store = create_store(os.getenv("STATE_URL"))
+multi_worker = int(os.getenv("WEB_WORKERS", "1")) > 1
+if multi_worker and not shared_store.shared and not os.getenv("SESSION_DB"):
+    logger.warning("WEB_WORKERS > 1 without STATE_URL or SESSION_DB: sessions are not shared between workers")
+
+# Store user states: bounded LRU with idle expiry, optionally persisted
+# to SQLite (SESSION_DB) or the shared store so sessions survive restarts
+session_db = os.getenv("SESSION_DB")
+session_ttl = float(os.getenv("SESSION_TTL", "86400"))
+if shared_store.shared:
+    session_backend = KeyValueSessionBackend(shared_store, ttl=session_ttl)
+elif session_db:
+    session_backend = SQLiteSessionBackend(session_db)
+else:
+    session_backend = None
+chat_states = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+    idle_ttl=session_ttl,
+    backend=session_backend,
+    # Another worker may have updated a shared session since we last saw it
+    local_cache=not (shared_store.shared or (session_db and multi_worker)),
+)
+
+# Messages carrying a message_id are processed once within DEDUP_WINDOW
+# seconds (across workers when STATE_URL is set), and each number's
+# messages are handled one at a time so its ChatState is never updated by
+# two threads at once; with STATE_URL the per-number lock is also held in
+# Redis, so two workers never interleave one number's turns either.
+# Different numbers still run in parallel.
+message_dedup = MessageDeduplicator(
+    window=float(os.getenv("DEDUP_WINDOW", "600")),
+    max_entries=int(os.getenv("DEDUP_MAX_IDS", "100000")),
+    store=shared_store if shared_store.shared else None,
+)
+if shared_store.shared:
+    number_locks = StoreLocks(
+        shared_store,
+        stripes=int(os.getenv("NUMBER_LOCK_STRIPES", "1024")),
+        # Longer than the slowest message (a streamed reply, AI_STREAM_TIMEOUT)
+        ttl=float(os.getenv("NUMBER_LOCK_TTL", "90")),
+        timeout=float(os.getenv("NUMBER_LOCK_WAIT", "90")),
+    )
+else:
+    number_locks = LockStripes(int(os.getenv("NUMBER_LOCK_STRIPES", "1024")))
+
+# Image metadata (size, MIME type, content hash) computed at startup and
+# again whenever the catalog is rebuilt (build_shop_state); INLINE_MEDIA=1 adds the cached base64 payload to replies
+media_registry = MediaRegistry(
+    app.static_folder,
+    max_cache_bytes=int(os.getenv("MEDIA_CACHE_BYTES", str(32 * 1024 * 1024))),
+).scan()
+INLINE_MEDIA = os.getenv("INLINE_MEDIA", "0") == "1"
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", "86400"))
+
+@lru_cache(maxsize=4096)
+def _host_image_url(host_url, path):
+    # Only hand out URLs for images that actually exist
+    if media_registry.by_path(path) is None:
+        return None
+    return host_url.rstrip('/') + path
+
+def image_url(path):
+    # Resolved once per (host, path): the bot is reached under a handful of
+    # host names (localhost, python-api, PUBLIC_BASE_URL)
+    with STAGE_SECONDS.time(stage="image_resolution"):
+        return _host_image_url(request.host_url, path)
+
+def render_reply(reply, language):
+    response = {"text": reply.texts[language]}
+    if reply.image:
+        url = image_url(reply.image)
+        if url:
+            response["image"] = url
+    return response
+
+def send_media(entry):
+    return send_file(entry.file_path, mimetype=entry.mimetype, etag=entry.etag,
+                     conditional=True, max_age=MEDIA_MAX_AGE)
+
+# Shop info, stock, catalog data, reply templates and the conversation flow
+# are read from SHOP_DATA_DIR (python-server/data) and reloaded within
+# SHOP_DATA_POLL seconds of a file changing, without a restart. Request code
+# takes `shop.current` once and reads everything from that one version.
+class ShopState:
+    __slots__ = ("info", "messages", "faq", "catalog", "conversation", "retrieval")
+
+    def __init__(self, info, messages, faq, catalog, conversation, retrieval):
+        self.info = info
+        self.messages = messages
+        self.faq = faq
+        self.catalog = catalog
+        self.conversation = conversation
+        self.retrieval = retrieval
+
+def stock_counts_only(old_info, new_info):
+    """True when two versions of the shop info differ at most in stock counts."""
+    def without_counts(info):
+        return {language: {key: tuple(value) if key == "stock" else value for key, value in details.items()}
+                for language, details in info.items()}
+    return without_counts(old_info) == without_counts(new_info)
+
+# Free-text questions that match an FAQ, shop-info, price or stock question
+# closely enough (TF-IDF over character n-grams, every language) are
+# answered locally; the rest still go to the model. RETRIEVAL=0 turns it off.
+RETRIEVAL = os.getenv("RETRIEVAL", "1") == "1"
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.4"))
+RETRIEVAL_MIN_MARGIN = float(os.getenv("RETRIEVAL_MIN_MARGIN", "0.15"))
+
+def build_shop_state(sections, previous, changed):
+    # Only what depends on a changed file is rebuilt; a stock-count edit
+    # copies the catalog with new counts instead of re-indexing it
+    shop_info, messages = sections["shop"], sections["messages"]
+    if previous is not None and not changed & {"shop", "catalog"}:
+        catalog = previous.catalog
     else:
-        model = None
-        logger.warning("No API key found, using fallback responses")
-except Exception as e:
-    logger.error(f"Failed to initialize Google AI model: {e}")
-    model = None
-
-def detect_intent(message, language):
-    intents = {
-        "english": {
-            "product_inquiry": [r"do you (have|sell|offer).*?(phone|iphone|samsung|xiaomi)"],
-            "accessory_inquiry": [r"do you (have|sell|offer).*?(charger|cable|case|glass|headphone)"],
-            "repair_inquiry": [r"(fix|repair|replace).*?(screen|battery|phone|software)"],
-            "location_inquiry": [r"(where|what).*?(location|address|shop)"],
-            "contact_inquiry": [r"(contact|phone|number)"],
-            "hours_inquiry": [r"(when|what time).*?(open|closed|hours)"],
-            "stock_inquiry": [r"(do you have|is there|are there).*?in stock"],
-        },
-        "sinhala": {
-            "product_inquiry": [
-                r"(දුරකථන|ෆෝන්|සැම්සං|අයිෆෝන්).*?(තියෙනවද|විකුණනවද|ඕන|ගන්න)",  # Added ඕන and ගන්න
-                r"මට.*?(දුරකථන|ෆෝන්|සැම්සං|අයිෆෝන්).*?(ඕන|තියෙනවද)"  # Added pattern for "මට ... ඕන"
-            ],
-            "accessory_inquiry": [r"(චාජර්|කේබල්|කවර|ග්ලාස්|හෙඩ්ෆෝන්).*?(තියෙනවද|විකුණනවද)"],
-            "repair_inquiry": [r"(හදන්න|ප්‍රතිස්ථාපනය).*?(තිරය|බැටරිය|දුරකථනය)"],
-            "location_inquiry": [r"(ලිපිනය|ස්ථානය|කොහේද)"],
-            "contact_inquiry": [r"(දුරකථන අංකය|අංකය|සම්බන්ධ)"],
-            "hours_inquiry": [r"(විවෘත|වසා).*?(වේලාව)"],
-            "stock_inquiry": [r"(තිබේද|ඇතිද|ඇවිත්ද)"],
-        },
-        "singlish": {
-            "product_inquiry": [r"(phone|iphone|samsung|xiaomi).*?(thiyenawa|ganna)",r"mata.*?(phone|iphone|samsung|xiaomi).*?(oona|ona|eka)"],
-            "accessory_inquiry": [r"(charger|cable|case|glass|headphone).*?(thiyenawa|ganna)"],
-            "repair_inquiry": [r"(fix|repair).*?(screen|battery|phone)"],
-            "location_inquiry": [r"(where|kohenda).*?(shop|place)"],
-            "contact_inquiry": [r"(number|contact|call)"],
-            "hours_inquiry": [r"(open|close).*?(time|hours)"],
-            "stock_inquiry": [r"(thiyenawa|available).*?(stock)"],
-        }
-    }
-    for intent, patterns in intents.get(language, intents["english"]).items():
-        for pattern in patterns:
-            if re.search(pattern, message.lower()):
-                return intent
-    return "general"
+        catalog = None
+        if previous is not None and changed == {"shop"} and stock_counts_only(previous.info, shop_info):
+            catalog = previous.catalog.with_stock(shop_info["english"].get("stock", {}))
+        if catalog is None:
+            if previous is not None:
+                # A catalog edit can point at images added since startup, and
+                # resolved URLs (including misses) are cached per path
+                media_registry.scan()
+                _host_image_url.cache_clear()
+            data = sections["catalog"]
+            catalog = build_catalog(shop_info, data["images"], data["aliases"], data["prices"], app.static_folder)
+    if previous is not None and not changed & {"messages", "conversation"}:
+        conversation = previous.conversation
+    else:
+        # Stages, menu transitions and static replies, rendered for every language
+        conversation = ConversationFlow(sections["conversation"], messages["messages"])
+    # The index holds product names, so it follows a re-indexed catalog;
+    # stock and prices are read from the current catalog at answer time
+    if previous is not None and "messages" not in changed and catalog.aliases is previous.catalog.aliases:
+        retrieval = previous.retrieval
+    else:
+        with STAGE_SECONDS.time(stage="retrieval_index"):
+            retrieval = build_retriever(shop_info, messages["faq"], messages["faq_questions"], messages["messages"],
+                                        catalog, min_score=RETRIEVAL_MIN_SCORE, min_margin=RETRIEVAL_MIN_MARGIN)
+    return ShopState(shop_info, messages["messages"], messages["faq"], catalog, conversation, retrieval)
+
+shop = ShopData(
+    build_shop_state,
+    directory=os.getenv("SHOP_DATA_DIR", DEFAULT_DATA_DIR),
+    poll_interval=float(os.getenv("SHOP_DATA_POLL", "2")),
+)
+
+# Each message's language is detected from its script and Singlish words.
+# Before a language is picked it pre-selects one; afterwards a confident
+# mismatch switches the chat (LANGUAGE_DETECTION=switch), only adds a hint
+# about "*" to the reply (suggest), or is ignored (off)
+LANGUAGE_DETECTION = os.getenv("LANGUAGE_DETECTION", "switch")
+LANGUAGE_CONFIDENCE = float(os.getenv("LANGUAGE_CONFIDENCE", "0.8"))
+
+AI_WARMUP = os.getenv("AI_WARMUP", "1") == "1"
+
+# AI calls run on a bounded worker pool so a slow Gemini round trip never
+# holds a request thread past AI_TIMEOUT seconds. Transient errors are
+# retried (AI_RETRIES) within a shared budget, and after AI_BREAKER_FAILURES
+# failures in a row the circuit opens: for AI_BREAKER_RESET seconds AI
+# questions get the local FAQ answers without calling the model at all.
+# AI_BACKEND=fake swaps in an in-process stub for offline load testing.
+if os.getenv("AI_BACKEND") == "fake":
+    ai_model = FakeModel(
+        latency=float(os.getenv("FAKE_MODEL_LATENCY", "0.2")),
+        jitter=float(os.getenv("FAKE_MODEL_JITTER", "0.05")),
+        seed=int(os.environ["FAKE_MODEL_SEED"]) if os.getenv("FAKE_MODEL_SEED") else None,
+        token_latency=float(os.getenv("FAKE_MODEL_TOKEN_LATENCY", "0.01")),
+        error_rate=float(os.getenv("FAKE_MODEL_ERROR_RATE", "0")),
+    )
+elif api_key:
+    # The Gemini SDK is only imported when first needed. AI_WARMUP=1 (the
+    # default) loads it on a background thread straight away, so menu
+    # replies are served immediately and the first AI answer doesn't wait
+    ai_model = GeminiModel(api_key)
+    if AI_WARMUP:
+        ai_model.warm()
+else:
+    ai_model = None
+    logger.warning("No API key found, using fallback responses")
+ai_backend = AIBackend(
+    ai_model,
+    max_workers=int(os.getenv("AI_WORKERS", "8")),
+    max_pending=int(os.getenv("AI_MAX_PENDING", "32")),
+    timeout=float(os.getenv("AI_TIMEOUT", "8")),
+    stream_timeout=float(os.getenv("AI_STREAM_TIMEOUT", "60")),
+    retries=int(os.getenv("AI_RETRIES", "2")),
+    backoff=float(os.getenv("AI_RETRY_BACKOFF", "0.2")),
+    retry_budget=RetryBudget(ratio=float(os.getenv("AI_RETRY_BUDGET", "0.2"))),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("AI_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("AI_BREAKER_RESET", "30")),
+    ),
+    fallback_handler=lambda reason: AI_FALLBACKS.inc(reason=reason),
+)
+
+# STREAM_REPLIES=1 sends AI answers to the outbound queue sentence by
+# sentence as the model produces them, instead of one message at the end
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "0") == "1"
+
+# Batch processing (/send_batch and the queue consumer)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_WORKERS", "8")), thread_name_prefix="batch")
+
+# Late AI replies (answers that missed the request deadline) are published
+# to the outbound queue the Node bot consumes, when RabbitMQ is configured
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+outbound_broker = None
+outbound_broker_lock = threading.Lock()
+
+def get_outbound_broker():
+    # The broker reopens a lost connection itself; only the first connect is
+    # made here, and retried on the next call while RabbitMQ is unreachable
+    global outbound_broker
+    with outbound_broker_lock:
+        if outbound_broker is None and RABBITMQ_URL:
+            try:
+                outbound_broker = RabbitMQBroker(RABBITMQ_URL)
+            except Exception as e:
+                logger.error(f"Cannot connect to RabbitMQ: {e!r}")
+        return outbound_broker
+
+def publish_late_reply(number, text):
+    broker = get_outbound_broker()
+    if broker is None:
+        logger.info(f"Dropping late AI reply for {number}: RABBITMQ_URL is not set")
+        return
+    broker.publish(OUTBOUND_QUEUE, {"number": chat_id_to_number(number), "message": text})
+
+ai_backend.late_handler = publish_late_reply
+
+# Static shop-info prompt prefix rendered once per language, plus a rolling
+# per-chat summary capped at PROMPT_HISTORY_TOKENS
+prompt_builder = PromptBuilder(shop.current.info, history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", "300")))
+
+# Cache of AI answers for repeat questions; cleared whenever the shop info
+# in the prompt changes
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    version=prompt_builder.version,
+    shared=shared_store if shared_store.shared else None,
+)
 
-def extract_product_details(message, language):
+# Concurrent identical questions (same cache key) share one model call
+inflight_ai = SingleFlight()
+
+metrics.counter_callback("chatbot_ai_calls_coalesced_total", "AI calls saved by joining an identical in-flight request",
+                         lambda: inflight_ai.coalesced)
+
+CIRCUIT_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+metrics.gauge_callback("chatbot_ai_circuit_state", "AI circuit breaker: 0 closed, 1 half open, 2 open",
+                       lambda: CIRCUIT_STATES[ai_backend.breaker.state])
+metrics.counter_callback("chatbot_ai_circuit_opened_total", "Times the AI circuit breaker has opened",
+                         lambda: ai_backend.breaker.opened)
+metrics.counter_callback("chatbot_ai_retries_total", "AI calls retried after a transient error",
+                         lambda: ai_backend.retry_budget.spent)
+metrics.counter_callback("chatbot_ai_retries_denied_total", "AI retries skipped because the retry budget was spent",
+                         lambda: ai_backend.retry_budget.denied)
+
+metrics.gauge_callback("chatbot_sessions", "Chat sessions held in memory by this worker", lambda: len(chat_states))
+metrics.gauge_callback("chatbot_response_cache_entries", "Entries in the AI response cache", lambda: response_cache.stats()["entries"])
+metrics.start()
+
+def refresh_shop_version():
+    prompt_builder.rebuild(shop.current.info)
+    return response_cache.set_version(prompt_builder.version)
+
+def on_shop_change(state, changed):
+    if "shop" in changed:
+        refresh_shop_version()
+    for section in changed:
+        SHOP_RELOADS.inc(section=section)
+
+shop.listeners.append(on_shop_change)
+shop.watch()
+
+IPHONE_MODEL_RE = re.compile(r"iphone\s*(\d+)(?:\s*(pro|plus|max))?")
+SAMSUNG_MODEL_RE = re.compile(r"(galaxy|samsung)\s*([a-z]+)?\s*(\d+)(?:\s*(plus|ultra|fe))?")
+
+def extract_product_details(message, language, catalog):
     details = {}
-    brands = SHOP_INFO[language]["brands"]
-    for brand in brands:
-        if brand.lower() in message.lower():
-            details["brand"] = brand
-            break
-    iphone_match = re.search(r"iphone\s*(\d+)(?:\s*(pro|plus|max))?", message.lower())
+    product, brand = catalog.match(message)
+    if brand:
+        details["brand"] = brand
+    if product is not None:
+        details["model"] = product.model
+        return details
+    # Models we don't list still give the AI useful context
+    lowered = message.lower()
+    iphone_match = IPHONE_MODEL_RE.search(lowered)
     if iphone_match:
         model_num = iphone_match.group(1)
         variant = iphone_match.group(2) or ""
         details["model"] = f"iPhone {model_num}{' ' + variant.capitalize() if variant else ''}"
-    samsung_match = re.search(r"(galaxy|samsung)\s*([a-z]+)?\s*(\d+)(?:\s*(plus|ultra|fe))?", message.lower())
+    samsung_match = SAMSUNG_MODEL_RE.search(lowered)
     if samsung_match:
         series = samsung_match.group(2) or ""
         model_num = samsung_match.group(3)
@@ -172,216 +373,325 @@ def extract_product_details(message, language):
         details["model"] = f"Galaxy {series.upper() if series else ''}{model_num}{' ' + variant.capitalize() if variant else ''}"
     return details
 
-def handle_stock_inquiry(message, language):
-    stock = SHOP_INFO[language]["stock"]
-    for item in stock:
-        if item.lower() in message.lower():
-            quantity = stock[item]
-            if quantity > 0:
-                return MESSAGES[language]["stock_available"].format(item=item, quantity=quantity)
-            else:
-                return MESSAGES[language]["stock_unavailable"].format(item=item)
-    return MESSAGES[language]["stock_check"]
-
-def get_product_image(category, brand, model):
-    base_path = os.path.join(os.getcwd(), "static", "images")
-    try:
-        if category in PRODUCT_IMAGES:
-            if brand.lower() in PRODUCT_IMAGES[category]:
-                if model in PRODUCT_IMAGES[category][brand.lower()]:
-                    relative_path = PRODUCT_IMAGES[category][brand.lower()][model]
-                    image_path = os.path.join(base_path, relative_path.lstrip("/"))
-                    if os.path.isfile(image_path):
-                        return relative_path
-    except Exception as e:
-        logger.error(f"Error getting product image: {e}")
+# Intent and product details are cached per (message, language) (intents
+# keeps its own cache); product details are keyed by the catalog too, so
+# answers from before a reload are never reused. Treat the results as read-only.
+@lru_cache(maxsize=4096)
+def _cached_product_details(message, language, catalog):
+    return extract_product_details(message, language, catalog)
+
+def analyze_message(message, language, catalog):
+    # Timed outside the caches, so the stages count every message, hits included
+    with STAGE_SECONDS.time(stage="intent_detection"):
+        intent = detect_intent(message, language)
+    with STAGE_SECONDS.time(stage="product_extraction"):
+        product_details = _cached_product_details(message, language, catalog)
+    return intent, product_details
+
+def handle_stock_inquiry(message, language, data):
+    product, _ = data.catalog.match(message)
+    if product is not None and product.stock is not None:
+        item = product.display_name(language)
+        if product.stock > 0:
+            return data.messages[language]["stock_available"].format(item=item, quantity=product.stock)
+        else:
+            return data.messages[language]["stock_unavailable"].format(item=item)
+    return data.messages[language]["stock_check"]
+
+def get_product_image(catalog, category, brand, model):
+    # Image paths are resolved and checked once when the catalog is built
+    product = catalog.find_by_model(brand, model)
+    if product is not None and product.category == category:
+        return product.image
     return None
 
-def get_prompt_by_language(message, state, context, history):
-    base_info = SHOP_INFO[state.language]
-    if state.language == "sinhala":
-        return f"""ඔබ සුන් මොබයිල් හොරණ සහකරු ලෙස පාරිභෝගිකයාගේ විමසුමට උදව් කරන්න.
-වත්මන් සාප්පු තොරතුරු:
-- වෙළඳ නාම: {', '.join(base_info['brands'])}
-- සේවා: {', '.join(base_info['services'])}
-- ලිපිනය: {base_info['address']}
-- දුරකථන: {base_info['phone']}
-{context}
-විමසුම: {message}
-සිංහලෙන් මිත්‍රශීලී, කෙටි, වෘත්තීය පිළිතුරු දෙන්න."""
-    else:
-        return f"""You are an assistant for Sun Mobile Horana, helping with customer queries.
-Current shop info:
-- Brands: {', '.join(base_info['brands'])}
-- Services: {', '.join(base_info['services'])}
-- Address: {base_info['address']}
-- Phone: {base_info['phone']}
-{context}
-Query: {message}
-Respond in {state.language}, keeping answers friendly, concise, and professional."""
-
-def get_ai_response(message, state):
+def get_prompt_by_language(message, state, context):
+    return prompt_builder.build(message, state, context)
+
+def get_ai_response(message, state, stream=None, data=None, analysis=None):
+    data = data or shop.current
     try:
-        shop_info = SHOP_INFO[state.language]
-        intent = detect_intent(message, state.language)
-        product_details = extract_product_details(message, state.language)
+        # handle_interaction passes the analysis it already made for this message
+        intent, product_details = analysis or analyze_message(message, state.language, data.catalog)
         specific_context = ""
         if intent == "product_inquiry" and "brand" in product_details:
             brand = product_details["brand"]
             specific_context = f"Customer is asking about {brand} phones."
-        prompt = get_prompt_by_language(message, state, specific_context, "")
-        if model:
-            response = model.generate_content(prompt)
-            return response.text.strip()
-        else:
-            return FAQ_RESPONSES[state.language].get(intent, FAQ_RESPONSES[state.language]["default"])
+        fallback = data.faq[state.language].get(intent, data.faq[state.language]["default"])
+        if RETRIEVAL:
+            with STAGE_SECONDS.time(stage="retrieval"):
+                local = data.retrieval.answer(message, state.language, data.catalog, intent)
+            if local is not None:
+                topic, response_text = local
+                LOCAL_ANSWERS.inc(topic=topic)
+                return response_text
+        if not ai_backend.available:
+            AI_FALLBACKS.inc(reason="no_model")
+            return fallback
+        cache_key = ResponseCache.make_key(message, state.language, intent, product_details,
+                                           prompt_builder.history_digest(state))
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(result="hit")
+            return cached
+        CACHE_LOOKUPS.inc(result="miss")
+        with STAGE_SECONDS.time(stage="prompt_build"):
+            prompt = get_prompt_by_language(message, state, specific_context)
+
+        def generate():
+            if stream is not None and ai_backend.can_stream:
+                response_text, stream.delivered, complete = ai_backend.stream(prompt, stream.send, fallback,
+                                                                              context=state.number)
+            else:
+                response_text = ai_backend.generate(prompt, fallback, context=state.number)
+                complete = response_text != fallback
+            # Fallbacks from a missed deadline, and streams cut short, are
+            # not worth remembering
+            if complete:
+                response_cache.set(cache_key, response_text)
+            return response_text
+
+        with STAGE_SECONDS.time(stage="model_call"):
+            try:
+                response_text = inflight_ai.do(cache_key, generate, timeout=ai_backend.timeout + 1)
+            except TimeoutError:
+                AI_FALLBACKS.inc(reason="deadline")
+                response_text = fallback
+        return response_text
     except Exception as e:
+        AI_ERRORS.inc()
         logger.error(f"AI Error: {str(e)}")
-        return MESSAGES[state.language]["error"]
+        return data.messages[state.language]["error"]
+
+def apply_detected_language(message, state, data):
+    """Act on the detected language; returns a language to suggest, if any."""
+    with STAGE_SECONDS.time(stage="language_detection"):
+        detected, confidence = detect_language(message)
+    if detected is None or detected == state.language or confidence < LANGUAGE_CONFIDENCE:
+        return None
+    if state.current_stage == data.conversation.initial_stage:
+        action = "preselect"
+    elif LANGUAGE_DETECTION == "switch":
+        action = "switch"
+    else:
+        LANGUAGE_DETECTIONS.inc(language=detected, action="suggest")
+        return detected
+    LANGUAGE_DETECTIONS.inc(language=detected, action=action)
+    state.language = detected
+    return None
+
+def handle_interaction(message, state, stream, stage, data):
+    # Product inquiries and other interactions
+    analysis = analyze_message(message, state.language, data.catalog)
+    intent, product_details = analysis
+    MESSAGES_TOTAL.inc(intent=intent, language=state.language)
+
+    reply = data.conversation.keyword_reply(stage, message)
+    if reply is not None:
+        return render_reply(reply, state.language)
+
+    if intent == "product_inquiry" and product_details:
+        brand = product_details.get("brand")
+        model = product_details.get("model")
+        response_text = get_ai_response(message, state, stream, data, analysis) or f"Please tell me more about which {brand} model you're interested in."
+
+        image_path = get_product_image(data.catalog, "phones", brand, model) if brand and model else None
+        response = {"text": response_text}
+        if image_path:
+            response["image"] = image_url(image_path)
 
-def determine_language(message):
-    if any("\u0d80" <= char <= "\u0dff" for char in message):
-        return "sinhala"
-    singlish_keywords = ["thiyenawa", "karanna", "eka", "api", "oya"]
-    if any(keyword in message.lower() for keyword in singlish_keywords):
-        return "singlish"
-    return "english"
+        return response
 
-from flask import request
+    # Default response
+    response_text = get_ai_response(message, state, stream, data, analysis) or data.faq[state.language]["default"]
+    return {"text": response_text}
 
-def process_message(message, state):
+# Free-form stages name one of these in conversation.json
+STAGE_HANDLERS = {"interaction": handle_interaction}
+
+def process_message(message, state, stream=None):
+    # One version of the shop data for the whole message, even if a reload
+    # lands halfway through
+    data = shop.current
+    conversation = data.conversation
     try:
         message = message.strip()
-        logger.info(f"Processing message: '{message}' in stage: {state.current_stage}")
-
-        # Reset command
-        if message.lower() == "#reset":
-            state.reset()
-            state.is_first_message = False
-            return {
-                "text": MESSAGES["english"]["welcome"],
-                "image": request.host_url.rstrip('/') + "/static/images/logo/shop_logo.jpg"
-            }
+        # Lazy %-formatting: the string is only built if sampling keeps the record
+        logger.info("Processing message: %r in stage: %s", message, state.current_stage,
+                    extra=dict(SAMPLED, number=state.number, stage=state.current_stage))
 
-        # First message
-        if state.is_first_message:
-            state.is_first_message = False
-            return {
-                "text": MESSAGES["english"]["welcome"],
-                "image": request.host_url.rstrip('/') + "/static/images/logo/shop_logo.jpg"
-            }
-
-        # Language selection
-        if state.current_stage == "welcome":
-            if message in ["1", "2", "3"]:
-                state.language = {"1": "english", "2": "sinhala", "3": "singlish"}.get(message, "english")
-                state.current_stage = "menu"
-                return {"text": MESSAGES[state.language]["menu"]}
-            return {"text": MESSAGES["english"]["welcome"]}
-
-        # Main menu selection
-        if state.current_stage == "menu":
-            if message in ["1", "2", "3", "4"]:
-                state.current_stage = "interaction"
-                menu_responses = {
-                    "1": "Please tell me which phone you're interested in. We have Samsung, iPhone, Xiaomi, and more.",
-                    "2": "We have various accessories including chargers, cases, and screen protectors. What are you looking for?",
-                    "3": "What type of repair service do you need? We handle both hardware and software issues.",
-                    "4": "You can reach us at:\n📞 0767410963 / 0768371984\n📍 No.30 Panadura Road, Horana"
-                }
-                return {"text": menu_responses[message]}
-            return {"text": MESSAGES[state.language]["menu"]}
-
-        # Product inquiries and other interactions
-        intent = detect_intent(message, state.language)
-        product_details = extract_product_details(message, state.language)
-
-        if "iphone" in message.lower() or "apple" in message.lower() or "අයිෆෝන්" in message:
-            response_text = {
-                "english": ("Here are our iPhone models:\n"
-                          "- iPhone 15 series (starting from Rs. 275,000)\n"
-                          "- iPhone 14 series (starting from Rs. 225,000)\n"
-                          "- iPhone 13 series (starting from Rs. 195,000)\n"
-                          "Which model would you like to know more about?"),
-                "sinhala": ("අපගේ iPhone මොඩල්:\n"
-                           "- iPhone 15 (රු. 275,000 සිට)\n"
-                           "- iPhone 14 (රු. 225,000 සිට)\n"
-                           "- iPhone 13 (රු. 195,000 සිට)\n"
-                           "කුමන මොඩලය ගැන දැන ගැනීමට කැමතිද?"),
-                "singlish": ("Apey iPhone models:\n"
-                           "- iPhone 15 (Rs. 275,000 idan)\n"
-                           "- iPhone 14 (Rs. 225,000 idan)\n"
-                           "- iPhone 13 (Rs. 195,000 idan)\n"
-                           "Monawa gana details oned?")
-            }
-            image_path = "/static/images/phones/apple/iphone15.jpeg"
-            return {
-                "text": response_text[state.language],
-                "image": request.host_url.rstrip('/') + image_path if os.path.exists(os.path.join(app.static_folder, "images/phones/apple/iphone15.jpeg")) else None
-            }
+        suggested = apply_detected_language(message, state, data) if LANGUAGE_DETECTION != "off" else None
 
-        if intent == "product_inquiry" and product_details:
-            brand = product_details.get("brand")
-            model = product_details.get("model")
-            response_text = get_ai_response(message, state) or f"Please tell me more about which {brand} model you're interested in."
-            
-            image_path = get_product_image("phones", brand, model) if brand and model else None
-            response = {"text": response_text}
-            if image_path:
-                response["image"] = request.host_url.rstrip('/') + image_path
+        # Commands (#reset, *) work in every stage; the first message always gets the welcome
+        transition = conversation.command(message)
+        if transition is None and state.is_first_message:
+            transition = conversation.first_message
 
-            return response
+        if transition is None:
+            stage = conversation.stage(state.current_stage)
+            if stage.handler:
+                result = STAGE_HANDLERS[stage.handler](message, state, stream, stage, data)
+            else:
+                transition = conversation.select(stage, message)
+        if transition is not None:
+            MESSAGES_TOTAL.inc(intent=transition.intent, language=state.language)
+            result = render_reply(conversation.apply(transition, state), state.language)
 
-        # Default response
-        response_text = get_ai_response(message, state) or FAQ_RESPONSES[state.language]["default"]
-        return {"text": response_text}
+        # A streamed reply has already been sent, so there is nothing to add the hint to
+        if suggested and result.get("text") and not (stream is not None and stream.delivered):
+            result["text"] += "\n\n" + data.messages[suggested]["language_suggestion"]
+        return result
 
     except Exception as e:
         logger.error(f"Error in process_message: {str(e)}\n{traceback.format_exc()}")
-        return {"text": MESSAGES.get(getattr(state, 'language', 'english'), MESSAGES["english"])["error"]}
-
+        return {"text": data.messages.get(getattr(state, 'language', 'english'), data.messages["english"])["error"]}
+
+
+def serve_static(filename):
+    entry = media_registry.by_static_filename(filename)
+    if entry is None:
+        return app.send_static_file(filename)
+    return send_media(entry)
+
+# Registered images are served with their content hash as ETag, so clients
+# can revalidate with If-None-Match and get a 304
+app.view_functions["static"] = serve_static
+
+@app.route('/media/<media_id>', methods=['GET'])
+def get_media(media_id):
+    entry = media_registry.get(media_id)
+    if entry is None:
+        abort(404)
+    return send_media(entry)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/debug/profile/<action>', methods=['POST'])
+def profile_control(action):
+    if not PROFILER_ENABLED:
+        abort(404)
+    if action == "start":
+        started = profiler.start(interval=request.args.get("interval", type=float))
+        return jsonify({"success": True, "running": profiler.running, "changed": started}), 200
+    if action == "stop":
+        stopped = profiler.stop()
+        return jsonify({"success": True, "running": profiler.running, "changed": stopped, "samples": profiler.samples}), 200
+    abort(404)
+
+@app.route('/debug/profile', methods=['GET'])
+def profile_report():
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    if not PROFILER_ENABLED:
+        abort(404)
+    return Response(profiler.collapsed(limit=request.args.get("limit", type=int)), mimetype="text/plain")
 
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({"message": "Welcome to Sun Mobile Horana Chatbot API!", "status": "running"}), 200
 
-@app.route("/send", methods=["POST"])
-def send_message():
-    try:
-        data = request.json
-        number = data.get("number", "").strip()
-        message = data.get("message", "").strip()
+def ai_model_status():
+    if ai_model is None:
+        return "disabled"
+    if not hasattr(ai_model, "initialized"):
+        return "ready"
+    if not ai_model.initialized:
+        return "warming" if AI_WARMUP else "lazy"
+    return "ready" if ai_model.available else "failed"
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    # The worker is up and answering; restart it only if this stops responding
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    # Ready to take traffic once the shop data is loaded and a warming model
+    # client has finished. A model that failed to initialize does not hold
+    # readiness back: AI questions get the FAQ fallbacks instead.
+    model_status = ai_model_status()
+    ready = shop.current is not None and model_status != "warming"
+    # An open AI circuit is reported but keeps the worker in rotation
+    body = {"status": "ready" if ready else "starting", "ai_model": model_status, "ai_circuit": ai_backend.breaker.state,
+            "shop_data_reloads": shop.reloads}
+    return jsonify(body), 200 if ready else 503
+
+def handle_message(number, message, inline_media=None, message_id=None):
+    number = (number or "").strip()
+    message = (message or "").strip()
+
+    if not number or not message or number == 'status@broadcast':
+        return {
+            "success": True,
+            "message": "Ignoring broadcast or invalid message",
+            "response": ""
+        }
 
-        if not number or not message or number == 'status@broadcast':
-            return jsonify({
-                "success": True,
-                "message": "Ignoring broadcast or invalid message",
-                "response": ""
-            }), 200
-
-        if number not in chat_states:
-            chat_states[number] = ChatState()
-        
-        state = chat_states[number]
-        result = process_message(message, state)
-        
-        if not result:
-            return jsonify({
-                "success": True,
-                "message": "Message processed",
-                "response": MESSAGES[state.language]["error"]
-            }), 200
+    if message_id and not message_dedup.claim(message_id):
+        DUPLICATES_TOTAL.inc()
+        logger.info("Skipping duplicate message %s", message_id, extra={"number": number})
+        return {
+            "success": True,
+            "message": "Duplicate message ignored",
+            "response": "",
+            "duplicate": True
+        }
 
-        response = {
+    broker = get_outbound_broker() if STREAM_REPLIES else None
+    stream = ReplyStream(broker, number) if broker is not None else None
+
+    try:
+        with MESSAGE_SECONDS.time(), number_locks.for_key(number):
+            with STAGE_SECONDS.time(stage="session_load"):
+                state = chat_states.get_or_create(number)
+            result = process_message(message, state, stream)
+            # Free-form turns feed the rolling summary used in later prompts
+            if result and state.current_stage == "interaction" and message.lower() != "#reset":
+                prompt_builder.record_turn(state, message, result)
+            with STAGE_SECONDS.time(stage="session_save"):
+                chat_states.save(number, state)
+    except Exception:
+        # Let a redelivery of this message try again
+        if message_id:
+            message_dedup.release(message_id)
+        raise
+
+    messages = shop.current.messages
+    if not result:
+        return {
             "success": True,
             "message": "Message processed",
-            "response": result.get("text", MESSAGES[state.language]["error"])
+            "response": messages[state.language]["error"]
         }
-        
-        if "image" in result and result["image"]:
-            response["image"] = result["image"]
-        
-        return jsonify(response), 200
+
+    response = {
+        "success": True,
+        "message": "Message processed",
+        "response": result.get("text", messages[state.language]["error"])
+    }
+
+    # The text already went out chunk by chunk; only an image is left to send
+    if stream is not None and stream.delivered:
+        response["streamed"] = True
+        AI_FIRST_CHUNK_SECONDS.observe(stream.first_chunk_seconds)
+
+    if "image" in result and result["image"]:
+        response["image"] = result["image"]
+        entry = media_registry.by_url(result["image"])
+        if entry is not None:
+            response["media_id"] = entry.media_id
+            if INLINE_MEDIA if inline_media is None else inline_media:
+                response["media"] = media_registry.inline(entry)
+
+    return response
+
+@app.route("/send", methods=["POST"])
+def send_message():
+    try:
+        data = request.json
+        return jsonify(handle_message(data.get("number", ""), data.get("message", ""), data.get("inline_media"),
+                                      data.get("message_id"))), 200
 
     except Exception as e:
         logger.error(f"Error in send_message: {str(e)}\n{traceback.format_exc()}")
@@ -391,6 +701,38 @@ def send_message():
             "response": "Sorry, there was an error. Please try again."
         }), 200
 
+def handle_batch(items, base_url, on_result=None):
+    # Messages from one number run in order; different numbers run in
+    # parallel, each worker with its own request context for image URLs.
+    # on_result(result) is called as each reply is ready, in per-number order.
+    def handle(item):
+        try:
+            with app.test_request_context(base_url=base_url):
+                result = handle_message(item.get("number", ""), item.get("message", ""),
+                                        message_id=item.get("message_id"))
+        except Exception as e:
+            logger.error(f"Error in batch item for {item.get('number')}: {str(e)}\n{traceback.format_exc()}")
+            result = {
+                "success": True,
+                "message": "Error processing message",
+                "response": "Sorry, there was an error. Please try again."
+            }
+        result["number"] = item.get("number", "")
+        if on_result is not None:
+            on_result(result)
+        return result
+    return process_batch(items, handle, executor=batch_executor)
+
+@app.route("/send_batch", methods=["POST"])
+def send_batch():
+    data = request.json or {}
+    items = data.get("messages")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"success": False, "message": "Expected a 'messages' list of {number, message} objects"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"success": False, "message": f"At most {BATCH_MAX_ITEMS} messages per batch"}), 413
+    return jsonify({"success": True, "results": handle_batch(items, request.host_url)}), 200
+
 @app.route('/send', methods=['POST'])
 def send():
     data = request.json
@@ -438,9 +780,12 @@ def send():
         })
 
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+def create_app():
+    """App factory used by wsgi.py; gunicorn imports it once per worker."""
+    os.makedirs(os.path.join(app.static_folder, "images"), exist_ok=True)
+    return app
+
 
 if __name__ == "__main__":
-    os.makedirs(os.path.join(os.getcwd(), "static", "images"), exist_ok=True)
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Development server only. Production runs: gunicorn -c gunicorn.conf.py wsgi:app
+    create_app().run(host='0.0.0.0', port=int(os.getenv("PORT", "5000")), debug=os.getenv("FLASK_DEBUG") == "1")
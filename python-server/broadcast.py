@@ -0,0 +1,289 @@
+"""Bulk outbound messages (shop promos) for the whatsapp_messages queue.
+
+Streams recipients from a CSV file or the known chat sessions, renders a
+per-language reply template from messages.json for each one and publishes
+{number, message} items in batches to the queue node-server's
+connectQueue() sends from. Publishing is paced by a token bucket, every
+batch is checkpointed so an interrupted campaign resumes where it stopped,
+and each number gets a campaign's message at most once.
+
+Run with:
+    RABBITMQ_URL=amqp://rabbitmq python broadcast.py --campaign oct-promo \\
+        --template promo --csv recipients.csv --field offer="10% off all earbuds this week"
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import threading
+import time
+
+from idempotency import MessageDeduplicator
+from messaging import OUTBOUND_QUEUE, chat_id_to_number
+from shared_state import create_store
+
+logger = logging.getLogger(__name__)
+
+# Claims are kept this long, so re-running a campaign within a month skips
+# everyone who already got it
+DEDUP_WINDOW = 30 * 86400
+
+NUMBER_PATTERN = re.compile(r"\d{6,15}")
+
+
+def normalize_number(number):
+    """Digits-only number as the Node consumer expects ("94771234567"), or None."""
+    number = re.sub(r"[\s\-()+]", "", chat_id_to_number(str(number)))
+    return number if NUMBER_PATTERN.fullmatch(number) else None
+
+
+def csv_recipients(path, default_language="sinhala"):
+    """Yield (number, language, fields) per CSV row, reading one row at a time.
+
+    The file needs a "number" column; "language" is optional and every
+    other column is available to the template (e.g. {name}).
+    """
+    with open(path, newline="", encoding="utf-8-sig") as source:
+        for row in csv.DictReader(source):
+            number = row.pop("number", None)
+            language = (row.pop("language", None) or default_language).strip().lower()
+            yield number, language, {key: value for key, value in row.items() if key}
+
+
+def session_recipients(sessions):
+    """Yield (number, language, {}) for every stored chat session.
+
+    Numbers are sorted so a resumed run walks them in the same order.
+    """
+    for number in sorted(sessions.numbers()):
+        state = sessions.get(number)
+        if state is not None:
+            yield number, state.language, {}
+
+
+def campaign_deduplicator(campaign, state_url=None, max_entries=100000):
+    """Deduplicator for `campaign`, sharing its claims through the store at
+    `state_url` (Redis). Without one only the last `max_entries` numbers are
+    remembered: a local store would keep every claim for the whole window."""
+    store = create_store(state_url)
+    return MessageDeduplicator(window=DEDUP_WINDOW, max_entries=max_entries, store=store if store.shared else None,
+                               prefix=f"broadcast:{campaign}:")
+
+
+class TokenBucket:
+    """Lets `rate` items per second through on average, at most `burst` at once.
+
+    acquire(count) blocks until `count` tokens are available, so callers
+    taking whole batches are spread out to the same average rate.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+        self.waited = 0.0
+
+    def acquire(self, count=1):
+        if count > self.burst:
+            raise ValueError(f"cannot take {count} tokens from a bucket of {self.burst}")
+        # Waiting under the lock keeps concurrent callers in arrival order
+        with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= count:
+                    self._tokens -= count
+                    return
+                delay = (count - self._tokens) / self.rate
+                self.waited += delay
+                self._sleep(delay)
+
+
+class Broadcast:
+    """One campaign: render, deduplicate, pace and publish.
+
+    `messages` are the per-language reply templates (MESSAGES); the
+    `template` key must exist in every language. A recipient's fields are
+    the campaign `fields`, then `language_fields[language]` (shop address,
+    phone, ...), then the recipient's own CSV columns.
+
+    Every `batch_size` rendered messages are published with one
+    publish_batch() call once the token bucket allows it, and the
+    checkpoint file then records how many recipients have been consumed.
+    run() on the same campaign and checkpoint skips that many recipients
+    of the same stream, so the stream must come back in the same order.
+
+    A number is claimed in the deduplicator before its message is batched;
+    claims of a batch that fails to publish are released, so a resumed run
+    sends them again. With a shared store (Redis) claims also survive a
+    restart and are seen by other workers: a crash between claiming and
+    publishing can drop one batch, but nobody gets the same promo twice.
+    Without one, only the deduplicator's last `max_entries` numbers are
+    remembered, which keeps memory flat on very long lists.
+    """
+
+    def __init__(self, broker, messages, template, campaign, queue_name=OUTBOUND_QUEUE, fields=None,
+                 language_fields=None, default_language="sinhala", rate=10.0, batch_size=20,
+                 deduplicator=None, checkpoint_path=None):
+        missing = [language for language, templates in messages.items() if template not in templates]
+        if missing:
+            raise ValueError(f"Template {template!r} missing for {', '.join(missing)}")
+        self.broker = broker
+        self.messages = messages
+        self.template = template
+        self.campaign = campaign
+        self.queue_name = queue_name
+        self.fields = dict(fields or {})
+        self.language_fields = language_fields or {}
+        self.default_language = default_language
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, burst=batch_size) if rate else None
+        if deduplicator is None:
+            deduplicator = campaign_deduplicator(campaign)
+        self.deduplicator = deduplicator
+        self.checkpoint_path = checkpoint_path
+        self._stop = threading.Event()
+        self.stats = {"position": 0, "published": 0, "duplicates": 0, "invalid": 0, "failed": 0, "done": False}
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, encoding="utf-8") as checkpoint:
+            saved = json.load(checkpoint)
+        if saved.get("campaign") != self.campaign:
+            raise ValueError(f"{self.checkpoint_path} belongs to campaign {saved.get('campaign')!r}")
+        self.stats.update(saved["stats"])
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        # Written to a temporary file and renamed, so a crash mid-write
+        # leaves the previous checkpoint intact
+        temporary = f"{self.checkpoint_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as checkpoint:
+            json.dump({"campaign": self.campaign, "stats": self.stats, "updated": time.time()}, checkpoint)
+        os.replace(temporary, self.checkpoint_path)
+
+    def render(self, language, fields):
+        if language not in self.messages:
+            language = self.default_language
+        templates = self.messages[language]
+        values = dict(self.fields)
+        values.update(self.language_fields.get(language, {}))
+        values.update(fields)
+        return templates[self.template].format(**values)
+
+    def _flush(self, batch, position):
+        if batch:
+            if self.bucket is not None:
+                self.bucket.acquire(len(batch))
+            try:
+                self.broker.publish_batch(self.queue_name, list(batch))
+            except Exception:
+                # The last checkpoint still describes what was published
+                for payload in batch:
+                    self.deduplicator.release(payload["number"])
+                raise
+            self.stats["published"] += len(batch)
+            batch.clear()
+        self.stats["position"] = position
+        self.save_checkpoint()
+
+    def run(self, recipients):
+        """Publish the campaign to `recipients` ((number, language, fields)
+        tuples); returns the stats. Resumes from the checkpoint if any."""
+        self.load_checkpoint()
+        if self.stats["done"]:
+            logger.info(f"Campaign {self.campaign} already finished: {self.stats}")
+            return self.stats
+        position = self.stats["position"]
+        batch = []
+        for number, language, fields in itertools.islice(recipients, position, None):
+            position += 1
+            number = normalize_number(number) if number else None
+            if number is None:
+                self.stats["invalid"] += 1
+                continue
+            try:
+                text = self.render(language, fields)
+            except (KeyError, IndexError, ValueError) as e:
+                self.stats["failed"] += 1
+                logger.warning(f"Campaign {self.campaign}: cannot render for {number}: {e!r}")
+                continue
+            if not self.deduplicator.claim(number):
+                self.stats["duplicates"] += 1
+                continue
+            batch.append({"number": number, "message": text})
+            if len(batch) >= self.batch_size:
+                self._flush(batch, position)
+                if self.stats["published"] % (self.batch_size * 50) == 0:
+                    logger.info(f"Campaign {self.campaign}: {self.stats}")
+            if self._stop.is_set():
+                break
+        else:
+            self.stats["done"] = True
+        self._flush(batch, position)
+        logger.info(f"Campaign {self.campaign} {'finished' if self.stats['done'] else 'stopped'}: {self.stats}")
+        return self.stats
+
+    def stop(self):
+        """Finish the current batch, checkpoint and return from run()."""
+        self._stop.set()
+
+
+def main():
+    from log_config import setup_logging
+    from messaging import RabbitMQBroker
+    from shop_data import info_fields, read_section
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--campaign", required=True, help="campaign id; numbers are deduplicated per campaign")
+    parser.add_argument("--template", required=True, help="key in data/messages.json, e.g. promo")
+    parser.add_argument("--csv", help="recipients file with number[,language,...] columns")
+    parser.add_argument("--sessions", action="store_true", help="send to every stored chat session instead")
+    parser.add_argument("--field", action="append", default=[], metavar="NAME=VALUE", help="template field")
+    parser.add_argument("--rate", type=float, default=float(os.getenv("BROADCAST_RATE", "10")),
+                        help="messages per second")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BROADCAST_BATCH_SIZE", "20")))
+    parser.add_argument("--checkpoint", help="progress file (default <campaign>.checkpoint.json)")
+    args = parser.parse_args()
+    if bool(args.csv) == args.sessions:
+        parser.error("give exactly one of --csv or --sessions")
+
+    setup_logging()
+    if args.sessions:
+        # The bot's session store, configured from the same environment
+        import bot
+        recipients = session_recipients(bot.chat_states)
+        messages, shop_info = bot.shop.current.messages, bot.shop.current.info
+    else:
+        recipients = csv_recipients(args.csv)
+        messages, shop_info = read_section("messages")["messages"], read_section("shop")
+    broadcast = Broadcast(
+        RabbitMQBroker(os.getenv("RABBITMQ_URL", "amqp://rabbitmq")),
+        messages,
+        args.template,
+        args.campaign,
+        fields=dict(field.split("=", 1) for field in args.field),
+        language_fields={language: info_fields(info) for language, info in shop_info.items()},
+        rate=args.rate,
+        batch_size=args.batch_size,
+        deduplicator=campaign_deduplicator(args.campaign, os.getenv("STATE_URL")),
+        checkpoint_path=args.checkpoint or f"{args.campaign}.checkpoint.json",
+    )
+    signal.signal(signal.SIGTERM, lambda *_: broadcast.stop())
+    signal.signal(signal.SIGINT, lambda *_: broadcast.stop())
+    broadcast.run(recipients)
+
+
+if __name__ == "__main__":
+    main()
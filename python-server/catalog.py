@@ -0,0 +1,280 @@
+import copy
+import difflib
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Latin word characters plus the Sinhala block and zero-width joiner, so
+# "අයිෆෝන්" stays one token
+TOKEN_RE = re.compile(r"[\w\u0d80-\u0dff\u200d]+")
+
+# Words that name a different model when they follow a listed one:
+# "iphone 15 pro" is not the "iPhone 15" we stock
+VARIANT_WORDS = frozenset({"pro", "plus", "max", "ultra", "fe", "mini"})
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Product:
+    __slots__ = ("key", "name", "brand", "model", "category", "stock", "price", "image", "names")
+
+    def __init__(self, key, name, brand=None, model=None, category=None, stock=None, price=None, image=None):
+        self.key = key
+        self.name = name
+        self.brand = brand
+        self.model = model or name
+        self.category = category
+        self.stock = stock
+        self.price = price
+        self.image = image
+        self.names = {"english": name}
+
+    def display_name(self, language):
+        return self.names.get(language, self.name)
+
+    def __repr__(self):
+        return f"Product({self.name!r}, brand={self.brand!r}, stock={self.stock!r})"
+
+
+class Catalog:
+    """Alias index over the shop's products.
+
+    Exact lookups hash message n-grams against the alias table, so their cost
+    depends on the message length, not the catalog size. Misspelled words are
+    corrected against the vocabulary of alias words through a trigram index
+    before retrying the exact lookup; that vocabulary ("samsung", "galaxy",
+    "charger", ...) grows far slower than the number of SKUs.
+    """
+
+    def __init__(self, max_ngram=4, fuzzy_cutoff=0.8, fuzzy_candidates=5):
+        self.max_ngram = max_ngram
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.fuzzy_candidates = fuzzy_candidates
+        self.products = {}
+        self.aliases = {}
+        self.brand_aliases = {}
+        self._by_model = {}
+        self._vocabulary = set()
+        self._trigrams = defaultdict(set)
+        # English stock name -> product key, in stock-list order
+        self._stock_keys = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def _index_words(self, alias):
+        for word in alias.split():
+            # Only alphabetic words are typo-corrected; model codes like
+            # "s24" have to match exactly
+            if len(word) >= 4 and word.isalpha() and word not in self._vocabulary:
+                self._vocabulary.add(word)
+                for gram in trigrams(word):
+                    self._trigrams[gram].add(word)
+
+    def add_brand_alias(self, alias, brand):
+        alias = normalize(alias)
+        if alias and alias not in self.brand_aliases:
+            self.brand_aliases[alias] = brand
+            self._index_words(alias)
+
+    def add_alias(self, alias, key):
+        alias = normalize(alias)
+        if alias and alias not in self.aliases:
+            self.aliases[alias] = key
+            self._index_words(alias)
+
+    def add_product(self, product):
+        self.products[product.key] = product
+        if product.brand:
+            self._by_model[(product.brand.lower(), product.model.lower())] = product.key
+        self.add_alias(product.name, product.key)
+        self.add_alias(product.key, product.key)
+        return product
+
+    def get(self, key):
+        return self.products.get(key)
+
+    def find_by_model(self, brand, model):
+        key = self._by_model.get((brand.lower(), model.lower()))
+        return self.products.get(key) if key else None
+
+    def with_stock(self, stock):
+        """Copy of the catalog with new stock counts that shares every index.
+
+        `stock` must list the same English names, in the same order, as the
+        stock the catalog was built from; otherwise returns None and the
+        caller needs a full build_catalog().
+        """
+        if list(stock) != list(self._stock_keys):
+            return None
+        clone = copy.copy(self)
+        clone.products = dict(self.products)
+        for name, quantity in stock.items():
+            key = self._stock_keys[name]
+            if clone.products[key].stock != quantity:
+                # Products are never mutated once published; readers of the
+                # old catalog keep seeing the old count
+                product = copy.copy(clone.products[key])
+                product.stock = quantity
+                clone.products[key] = product
+        return clone
+
+    def match_brand(self, tokens):
+        for token in tokens:
+            brand = self.brand_aliases.get(token)
+            if brand:
+                return brand
+        return None
+
+    def _exact(self, tokens):
+        """Longest listed alias in tokens as (product, index after it)."""
+        for size in range(min(self.max_ngram, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                key = self.aliases.get(" ".join(tokens[start:start + size]))
+                if key:
+                    end = start + size
+                    # A variant we do not list: no exact product, so the
+                    # caller keeps the model name from the message itself
+                    if end < len(tokens) and tokens[end] in VARIANT_WORDS:
+                        return None, None
+                    return self.products[key], end
+        return None, None
+
+    def _correct(self, tokens):
+        corrected = list(tokens)
+        changed = False
+        for index, token in enumerate(tokens):
+            if len(token) < 4 or not token.isalpha() or token in self._vocabulary:
+                continue
+            counts = Counter()
+            for gram in trigrams(token):
+                counts.update(self._trigrams.get(gram, ()))
+            best_word, best_score = None, self.fuzzy_cutoff
+            for word, _ in counts.most_common(self.fuzzy_candidates):
+                # Typos rarely touch the first letter; this keeps "phones"
+                # from being read as "iphone"
+                if word[0] != token[0]:
+                    continue
+                score = difflib.SequenceMatcher(None, token, word).ratio()
+                if score > best_score:
+                    best_word, best_score = word, score
+            if best_word:
+                corrected[index] = best_word
+                changed = True
+        return corrected if changed else None
+
+    def _lookup(self, message):
+        tokens = tokenize(message)
+        if not tokens:
+            return None, tokens, None
+        product, end = self._exact(tokens)
+        if product is None:
+            corrected = self._correct(tokens)
+            if corrected:
+                tokens = corrected
+                product, end = self._exact(tokens)
+        return product, tokens, end
+
+    def match(self, message):
+        """Return (product, brand) for a message; either may be None."""
+        product, tokens, _ = self._lookup(message)
+        if not tokens:
+            return None, None
+        brand = product.brand if product and product.brand else self.match_brand(tokens)
+        return product, brand
+
+    def mention(self, message):
+        """Return (product, words after its name) for a message, so callers
+        can tell "iphone 15 price" from "iphone 15 case"."""
+        product, tokens, end = self._lookup(message)
+        if product is None:
+            return None, ()
+        return product, tuple(tokens[end:])
+
+
+def _strip_brand(name, brand):
+    words = name.split()
+    if brand and len(words) > 1 and words[0].lower() == brand.lower():
+        return " ".join(words[1:])
+    return name
+
+
+def build_catalog(shop_info, product_images, aliases, prices=None, static_folder=None):
+    catalog = Catalog()
+    prices = prices or {}
+    for brand, names in aliases.get("brands", {}).items():
+        catalog.add_brand_alias(brand, brand)
+        for alias in names:
+            catalog.add_brand_alias(alias, brand)
+
+    def brand_of(name):
+        return catalog.match_brand(tokenize(name))
+
+    def ensure_product(name, brand, category):
+        model = _strip_brand(name, brand)
+        key = normalize(model)
+        product = catalog.get(key)
+        if product is None:
+            product = catalog.add_product(Product(key, name, brand=brand, model=model, category=category))
+        return product
+
+    # Stock lists are parallel across languages; localized names share the
+    # position of their English counterpart
+    english_stock = shop_info["english"].get("stock", {})
+    for name, quantity in english_stock.items():
+        brand = brand_of(name)
+        product = ensure_product(name, brand, "phones" if brand else "accessories")
+        product.stock = quantity
+        catalog._stock_keys[name] = product.key
+    for language, info in shop_info.items():
+        if language == "english" or "stock" not in info:
+            continue
+        for english_name, local_name in zip(english_stock, info["stock"]):
+            product = catalog.get(normalize(_strip_brand(english_name, brand_of(english_name))))
+            product.names[language] = local_name
+            catalog.add_alias(local_name, product.key)
+
+    for category, groups in product_images.items():
+        for group, models in groups.items():
+            for name, relative_path in models.items():
+                brand = (catalog.brand_aliases.get(group) or brand_of(name)) if category == "phones" else brand_of(name)
+                product = ensure_product(name, brand, category)
+                product.category = category
+                image_path = "/static/images" + relative_path
+                if static_folder and not os.path.isfile(os.path.join(static_folder, "images", relative_path.lstrip("/"))):
+                    logger.warning(f"Missing product image for {product.name}: {relative_path}")
+                    continue
+                product.image = image_path
+
+    families = aliases.get("families", {})
+    for product in list(catalog.products.values()):
+        product.price = prices.get(product.model, prices.get(product.name))
+        words = product.key.split()
+        family, code = words[0], words[1:]
+        if family in families and code:
+            code_text = " ".join(code)
+            for family_alias in families[family]:
+                catalog.add_alias(f"{family_alias} {code_text}", product.key)
+                if len(code) == 1:
+                    catalog.add_alias(f"{family_alias}{code_text}", product.key)
+            # Codes like "s24" or "a54" are distinctive enough on their own
+            if len(code) == 1 and re.fullmatch(r"[a-z]+\d+", code_text):
+                catalog.add_alias(code_text, product.key)
+        for alias in aliases.get("products", {}).get(product.name, []):
+            catalog.add_alias(alias, product.key)
+
+    return catalog
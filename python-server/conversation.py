@@ -0,0 +1,139 @@
+import json
+
+
+class Reply:
+    """A static reply rendered for every language when the flow is loaded."""
+
+    __slots__ = ("texts", "image")
+
+    def __init__(self, texts, image=None):
+        self.texts = texts
+        self.image = image
+
+
+class Transition:
+    __slots__ = ("intent", "action", "language", "next_stage", "reply")
+
+    def __init__(self, intent, reply, action=None, language=None, next_stage=None):
+        self.intent = intent
+        self.reply = reply
+        self.action = action
+        self.language = language
+        self.next_stage = next_stage
+
+
+class Stage:
+    __slots__ = ("name", "intent", "options", "fallback", "handler", "keywords")
+
+    def __init__(self, name, intent=None, options=None, fallback=None, handler=None, keywords=()):
+        self.name = name
+        self.intent = intent
+        self.options = options or {}
+        self.fallback = fallback
+        self.handler = handler
+        self.keywords = keywords
+
+
+class ConversationFlow:
+    """Declarative conversation state machine loaded from a JSON config.
+
+    Each stage either maps exact replies ("1", "2", "*") to transitions with
+    a fallback for anything else, or names a handler for free-form messages.
+    Commands (like "#reset") apply in every stage. Reply templates come from
+    MESSAGES and are rendered for every language up front, so dispatching a
+    message is a dict lookup and adding a menu entry or a language is a
+    config change.
+    """
+
+    def __init__(self, config, messages):
+        self.messages = messages
+        self.languages = tuple(messages)
+        self.initial_stage = config["initial_stage"]
+        self.commands = {name.lower(): self._transition(spec) for name, spec in config.get("commands", {}).items()}
+        self.first_message = self._transition(config["first_message"]) if config.get("first_message") else None
+        self.stages = {}
+        for name, spec in config["stages"].items():
+            self.stages[name] = Stage(
+                name,
+                intent=spec.get("intent", name),
+                options={key: self._transition(option, spec.get("intent", name)) for key, option in spec.get("options", {}).items()},
+                fallback=self._transition(spec["fallback"], spec.get("intent", name)) if "fallback" in spec else None,
+                handler=spec.get("handler"),
+                keywords=tuple((tuple(word.lower() for word in keyword["match"]), self._reply(keyword["reply"]))
+                               for keyword in spec.get("keywords", ())),
+            )
+        self._validate()
+
+    @classmethod
+    def load(cls, path, messages):
+        with open(path, encoding="utf-8") as config:
+            return cls(json.load(config), messages)
+
+    def _reply(self, spec):
+        template = spec["template"]
+        fixed = spec.get("language")
+        texts = {}
+        for language in self.languages:
+            source = self.messages[fixed or language]
+            if template not in source:
+                raise ValueError(f"Reply template {template!r} is missing for {fixed or language}")
+            texts[language] = source[template]
+        return Reply(texts, spec.get("image"))
+
+    def _transition(self, spec, intent=None):
+        return Transition(
+            spec.get("intent", intent),
+            self._reply(spec["reply"]),
+            action=spec.get("action"),
+            language=spec.get("language"),
+            next_stage=spec.get("next"),
+        )
+
+    def _validate(self):
+        if self.initial_stage not in self.stages:
+            raise ValueError(f"Unknown initial stage {self.initial_stage!r}")
+        transitions = list(self.commands.values())
+        if self.first_message:
+            transitions.append(self.first_message)
+        for stage in self.stages.values():
+            if not stage.handler and stage.fallback is None:
+                raise ValueError(f"Stage {stage.name!r} needs a handler or a fallback")
+            transitions.extend(stage.options.values())
+            if stage.fallback:
+                transitions.append(stage.fallback)
+        for transition in transitions:
+            if transition.next_stage and transition.next_stage not in self.stages:
+                raise ValueError(f"Transition to unknown stage {transition.next_stage!r}")
+            if transition.language and transition.language not in self.languages:
+                raise ValueError(f"Transition to unknown language {transition.language!r}")
+            if transition.action not in (None, "reset"):
+                raise ValueError(f"Unknown action {transition.action!r}")
+
+    def stage(self, name):
+        # Sessions saved under a stage that no longer exists start over
+        return self.stages.get(name) or self.stages[self.initial_stage]
+
+    def command(self, message):
+        return self.commands.get(message.lower())
+
+    def select(self, stage, message):
+        return stage.options.get(message, stage.fallback)
+
+    def keyword_reply(self, stage, message):
+        lowered = message.lower()
+        for words, reply in stage.keywords:
+            if any(word in lowered for word in words):
+                return reply
+        return None
+
+    def apply(self, transition, state):
+        """Move `state` along `transition` and return the reply to send."""
+        if transition.action == "reset":
+            state.reset()
+            state.current_stage = self.initial_stage
+        state.is_first_message = False
+        if transition.language:
+            state.language = transition.language
+        if transition.next_stage:
+            state.current_stage = transition.next_stage
+        return transition.reply
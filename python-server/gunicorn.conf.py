@@ -0,0 +1,44 @@
+# Production server settings; every value can be overridden from the environment
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_WORKERS", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_class = "gthread"
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# Each worker imports the app itself, so thread pools, SQLite handles and
+# broker connections are never shared across a fork
+preload_app = False
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+errorlog = "-"
+
+# Workers log to stderr only (the container log): each would otherwise open
+# and rotate chatbot.log on its own. LOG_FILE=chatbot.{pid}.log keeps a file
+# per worker instead.
+os.environ.setdefault("LOG_FILE", "")
+
+# bot.py checks this to decide whether sessions need a shared backend
+os.environ["WEB_WORKERS"] = str(workers)
+
+# Workers share their metrics through this directory, so a scrape of any
+# one of them reports all of them (see metrics.Registry)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "chatbot-metrics"))
+
+
+def on_starting(server):
+    # Numbers from a previous run would be added to this one's
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["METRICS_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    # A dead worker's counters still count; its gauges do not
+    try:
+        os.remove(os.path.join(os.environ["METRICS_DIR"], f"gauges-{worker.pid}.json"))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,115 @@
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class MessageDeduplicator:
+    """Remembers message ids for `window` seconds so redelivered or retried
+    messages are processed once.
+
+    claim() is atomic: of several concurrent deliveries of the same id
+    exactly one gets True. With a shared store (Redis) the claim is also
+    made there with an add-if-absent, so a duplicate landing on another
+    worker is caught too. At most `max_entries` ids are kept locally; the
+    oldest are forgotten first.
+    """
+
+    def __init__(self, window=600.0, max_entries=100000, store=None, prefix="msgid:"):
+        self.window = window
+        self.max_entries = max_entries
+        self.store = store
+        self.prefix = prefix
+        self.duplicates = 0
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # Entries are kept in claim order, so expired ones are at the front
+        while self._seen:
+            message_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[message_id]
+
+    def claim(self, message_id):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if message_id in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[message_id] = now + self.window
+        if self.store is not None and not self.store.add(self.prefix + message_id, 1, ttl=self.window):
+            with self._lock:
+                self.duplicates += 1
+            return False
+        return True
+
+    def release(self, message_id):
+        """Forget a claim whose processing failed, so a redelivery is retried."""
+        with self._lock:
+            self._seen.pop(message_id, None)
+        if self.store is not None:
+            self.store.delete(self.prefix + message_id)
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class LockStripes:
+    """A fixed pool of locks shared out by key hash.
+
+    Work for one key always takes the same lock, so it runs one at a time;
+    different keys usually land on different stripes and run in parallel.
+    Memory stays bounded however many keys are seen, at the cost of an
+    occasional wait when two active keys share a stripe.
+    """
+
+    def __init__(self, stripes=1024):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def for_key(self, key):
+        return self._locks[zlib.crc32(key.encode("utf-8")) % len(self._locks)]
+
+
+class StoreLocks:
+    """Per-key locks that also hold across worker processes.
+
+    for_key() first takes the key's local stripe, so threads of one worker
+    queue up in memory, then a lock in the shared store (Redis SET NX PX
+    under a random token). It is released only while that token still
+    holds it. The store lock expires after `ttl` seconds, so a crashed
+    worker cannot block a key for ever; `ttl` must therefore exceed the
+    longest time one key's work can take. Waiting longer than `timeout`
+    raises TimeoutError.
+    """
+
+    def __init__(self, store, stripes=1024, ttl=90.0, timeout=90.0, poll_interval=0.005, prefix="lock:"):
+        self.store = store
+        self.local = LockStripes(stripes)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.waits = 0
+
+    @contextmanager
+    def for_key(self, key):
+        with self.local.for_key(key):
+            name = self.prefix + key
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.timeout
+            delay = self.poll_interval
+            while not self.store.acquire_lock(name, token, self.ttl):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Lock for {key} still held after {self.timeout}s")
+                self.waits += 1
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+            try:
+                yield
+            finally:
+                self.store.release_lock(name, token)
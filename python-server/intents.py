@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+
+# Intent patterns per language, checked in priority order
+INTENT_PATTERNS = {
+    "english": {
+        "product_inquiry": [r"do you (have|sell|offer).*?(phone|iphone|samsung|xiaomi)"],
+        "accessory_inquiry": [r"do you (have|sell|offer).*?(charger|cable|case|glass|headphone)"],
+        "repair_inquiry": [r"(fix|repair|replace).*?(screen|battery|phone|software)"],
+        "location_inquiry": [r"(where|what).*?(location|address|shop)"],
+        "contact_inquiry": [r"(contact|phone|number)"],
+        "hours_inquiry": [r"(when|what time).*?(open|closed|hours)"],
+        "stock_inquiry": [r"(do you have|is there|are there).*?in stock"],
+    },
+    "sinhala": {
+        "product_inquiry": [
+            r"(දුරකථන|ෆෝන්|සැම්සං|අයිෆෝන්).*?(තියෙනවද|විකුණනවද|ඕන|ගන්න)",  # Added ඕන and ගන්න
+            r"මට.*?(දුරකථන|ෆෝන්|සැම්සං|අයිෆෝන්).*?(ඕන|තියෙනවද)"  # Added pattern for "මට ... ඕන"
+        ],
+        "accessory_inquiry": [r"(චාජර්|කේබල්|කවර|ග්ලාස්|හෙඩ්ෆෝන්).*?(තියෙනවද|විකුණනවද)"],
+        "repair_inquiry": [r"(හදන්න|ප්‍රතිස්ථාපනය).*?(තිරය|බැටරිය|දුරකථනය)"],
+        "location_inquiry": [r"(ලිපිනය|ස්ථානය|කොහේද)"],
+        "contact_inquiry": [r"(දුරකථන අංකය|අංකය|සම්බන්ධ)"],
+        "hours_inquiry": [r"(විවෘත|වසා).*?(වේලාව)"],
+        "stock_inquiry": [r"(තිබේද|ඇතිද|ඇවිත්ද)"],
+    },
+    "singlish": {
+        "product_inquiry": [r"(phone|iphone|samsung|xiaomi).*?(thiyenawa|ganna)", r"mata.*?(phone|iphone|samsung|xiaomi).*?(oona|ona|eka)"],
+        "accessory_inquiry": [r"(charger|cable|case|glass|headphone).*?(thiyenawa|ganna)"],
+        "repair_inquiry": [r"(fix|repair).*?(screen|battery|phone)"],
+        "location_inquiry": [r"(where|kohenda).*?(shop|place)"],
+        "contact_inquiry": [r"(number|contact|call)"],
+        "hours_inquiry": [r"(open|close).*?(time|hours)"],
+        "stock_inquiry": [r"(thiyenawa|available).*?(stock)"],
+    }
+}
+
+
+def _compile_language(patterns_by_intent):
+    # Each intent becomes a lookahead anchored at the start of the message,
+    # followed by an empty named group. Alternation is tried left to right, so
+    # a single match() returns the highest-priority intent, exactly like
+    # looping over the patterns with re.search.
+    branches = []
+    for intent, patterns in patterns_by_intent.items():
+        alternatives = "|".join(f"(?:{pattern})" for pattern in patterns)
+        branches.append(f"(?=[\\s\\S]*?(?:{alternatives}))(?P<{intent}>)")
+    return re.compile("^(?:" + "|".join(branches) + ")")
+
+
+# Built once at import time
+COMPILED_INTENTS = {language: _compile_language(patterns) for language, patterns in INTENT_PATTERNS.items()}
+
+
+@lru_cache(maxsize=4096)
+def detect_intent(message, language):
+    matcher = COMPILED_INTENTS.get(language, COMPILED_INTENTS["english"])
+    match = matcher.match(message.lower())
+    if match:
+        return match.lastgroup
+    return "general"
@@ -0,0 +1,148 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# WhatsApp ids and phone numbers: 9+ digits, optionally with +, spaces or
+# dashes, not inside a word. "_" and "@" count as boundaries, so numbers in
+# message ids ("false_94771234567@c.us_3EB0...") are masked too. A timestamp
+# ("2026-10-18 21:05") also matches, so only the message, extra fields and
+# exception text are redacted, never the record's own time.
+PHONE_RE = re.compile(r"(?<![^\W_]|\.)\+?(?:\d[ -]?){8,}\d(?![^\W_]|\.)")
+
+# Pass as `extra=SAMPLED` on high-volume INFO lines (one per message) so
+# LOG_MESSAGE_SAMPLE_RATE can thin them out
+SAMPLED = {"sampled": True}
+
+
+def redact_numbers(text):
+    return PHONE_RE.sub(lambda match: "*" * max(0, len(match.group()) - 3) + match.group()[-3:], text)
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, redact=False):
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record):
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        entry = {"level": record.levelname, "logger": record.name, "message": record.getMessage()}
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        text = json.dumps(entry, ensure_ascii=False, default=str)
+        if self.redact:
+            text = redact_numbers(text)
+        # The timestamp goes in after redaction
+        return f'{{"ts": "{ts}", {text[1:]}'
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, redact=False):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.redact = redact
+
+    def format(self, record):
+        if not self.redact:
+            return super().format(record)
+        # Redact a copy's message and traceback, then add the time prefix
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args = redact_numbers(record.getMessage()), None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact_numbers(record.exc_text)
+        return super().format(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of records marked with extra=SAMPLED."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when
+    the listener falls behind, so logging never adds latency to a request."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only resolve the
+        # message and exception text here so the record can cross threads
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler(path):
+    when = os.getenv("LOG_ROTATE_WHEN")
+    backups = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding="utf-8")
+    max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+
+
+def setup_logging(level=logging.INFO):
+    """Route all logging through a bounded queue to a background listener.
+
+    The listener writes JSON (LOG_FORMAT=json, the default) or text to a
+    rotating file (LOG_FILE) and stderr. A "{pid}" in LOG_FILE gives every
+    process its own file, since processes rotating one shared file lose
+    each other's lines. LOG_MESSAGE_SAMPLE_RATE thins per-message INFO
+    lines and LOG_REDACT_NUMBERS masks phone numbers.
+    """
+    redact = os.getenv("LOG_REDACT_NUMBERS", "1") == "1"
+    formatter = TextFormatter(redact) if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter(redact)
+
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv("LOG_FILE", "chatbot.log")
+    if log_file:
+        handlers.append(_file_handler(log_file.format(pid=os.getpid())))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_MESSAGE_SAMPLE_RATE", "1.0"))))
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    return listener
@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class MediaEntry:
+    __slots__ = ("media_id", "url_path", "file_path", "filename", "size", "mimetype", "etag", "mtime", "payload")
+
+    def __init__(self, media_id, url_path, file_path, size, mimetype, etag, mtime):
+        self.media_id = media_id
+        self.url_path = url_path
+        self.file_path = file_path
+        self.filename = os.path.basename(file_path)
+        self.size = size
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+        self.payload = None
+
+    def to_dict(self):
+        return {
+            "media_id": self.media_id,
+            "mimetype": self.mimetype,
+            "filename": self.filename,
+            "size": self.size,
+        }
+
+
+class MediaRegistry:
+    """Metadata for every file under static/images, computed by scan().
+
+    Entries carry size, MIME type and a content hash used both as the media
+    ID and as the ETag. Base64 payloads are encoded on first use and kept in
+    memory up to `max_cache_bytes`, so replies can carry the image inline
+    instead of the client fetching and re-encoding it every time.
+    """
+
+    def __init__(self, static_folder, subdir="images", url_prefix="/static", max_cache_bytes=32 * 1024 * 1024):
+        self.static_folder = static_folder
+        self.subdir = subdir
+        self.url_prefix = url_prefix
+        self.max_cache_bytes = max_cache_bytes
+        self.cached_bytes = 0
+        self._by_id = {}
+        self._by_path = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def scan(self):
+        by_id, by_path = {}, {}
+        root = os.path.join(self.static_folder, self.subdir)
+        for directory, _, files in os.walk(root):
+            for filename in sorted(files):
+                file_path = os.path.join(directory, filename)
+                mimetype = mimetypes.guess_type(filename)[0]
+                if not mimetype or not mimetype.startswith("image/"):
+                    continue
+                try:
+                    with open(file_path, "rb") as f:
+                        digest = hashlib.sha1(f.read()).hexdigest()
+                    stat = os.stat(file_path)
+                except OSError as e:
+                    logger.error(f"Skipping unreadable media file {file_path}: {e}")
+                    continue
+                relative = os.path.relpath(file_path, self.static_folder).replace(os.sep, "/")
+                url_path = f"{self.url_prefix}/{relative}"
+                entry = MediaEntry(digest[:16], url_path, file_path, stat.st_size, mimetype, digest, stat.st_mtime)
+                by_id[entry.media_id] = entry
+                by_path[url_path] = entry
+        # Swap both maps in at once so readers never see a half-built registry
+        self._by_id, self._by_path = by_id, by_path
+        self.cached_bytes = 0
+        logger.info(f"Media registry loaded {len(by_id)} files from {root}")
+        return self
+
+    def get(self, media_id):
+        return self._by_id.get(media_id)
+
+    def by_path(self, url_path):
+        return self._by_path.get(url_path)
+
+    def by_url(self, url):
+        return self._by_path.get(urlparse(url).path) if url else None
+
+    def by_static_filename(self, filename):
+        return self._by_path.get(f"{self.url_prefix}/{filename}")
+
+    def payload(self, entry):
+        if entry.payload is not None:
+            return entry.payload
+        with open(entry.file_path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        with self._lock:
+            if self.cached_bytes + len(encoded) <= self.max_cache_bytes:
+                entry.payload = encoded
+                self.cached_bytes += len(encoded)
+        return encoded
+
+    def inline(self, entry):
+        data = entry.to_dict()
+        data["data"] = self.payload(entry)
+        return data
@@ -0,0 +1,242 @@
+import json
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+INBOUND_QUEUE = "incoming_messages"
+OUTBOUND_QUEUE = "whatsapp_messages"
+
+
+def process_batch(items, handler, executor=None, max_workers=8):
+    """Run handler(item) for every item, returning results in input order.
+
+    Items are grouped by their "number"; each group runs sequentially so a
+    customer's messages are answered in the order they were sent, while
+    different numbers are processed in parallel.
+    """
+    groups = OrderedDict()
+    for index, item in enumerate(items):
+        groups.setdefault(item.get("number"), []).append(index)
+
+    results = [None] * len(items)
+
+    def run_group(indexes):
+        for index in indexes:
+            results[index] = handler(items[index])
+
+    if len(groups) <= 1 or (executor is None and max_workers <= 1):
+        for indexes in groups.values():
+            run_group(indexes)
+        return results
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(groups)), thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(run_group, indexes) for indexes in groups.values()]
+        for future in futures:
+            future.result()
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    return results
+
+
+def chat_id_to_number(chat_id):
+    # whatsapp-web.js ids look like "94771234567@c.us"; the Node queue
+    # consumer appends "@c.us" itself
+    return chat_id.split("@", 1)[0]
+
+
+class InMemoryBroker:
+    """Thread-safe stand-in for RabbitMQ used in tests and benchmarks."""
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.published = []
+
+    def _queue(self, name):
+        return self._queues.setdefault(name, queue.Queue())
+
+    def publish(self, queue_name, payload):
+        with self._lock:
+            self._queue(queue_name).put(payload)
+            self.published.append((queue_name, payload))
+
+    def publish_batch(self, queue_name, payloads):
+        with self._lock:
+            target = self._queue(queue_name)
+            for payload in payloads:
+                target.put(payload)
+                self.published.append((queue_name, payload))
+
+    def get_batch(self, queue_name, max_items, timeout=1.0):
+        with self._lock:
+            source = self._queue(queue_name)
+        items = []
+        try:
+            items.append(source.get(timeout=timeout))
+            while len(items) < max_items:
+                items.append(source.get_nowait())
+        except queue.Empty:
+            pass
+        return items, None
+
+    def ack(self, token):
+        pass
+
+    def drain(self, queue_name):
+        items, _ = self.get_batch(queue_name, max_items=1 << 30, timeout=0)
+        return items
+
+    def close(self):
+        pass
+
+
+class RabbitMQBroker:
+    """Minimal pika-based broker: batched basic_get, JSON bodies, durable queues.
+
+    pika's BlockingConnection is not thread-safe, so every channel operation
+    is serialized through one lock. It also only answers RabbitMQ's
+    heartbeats while it is being used, so a background thread services the
+    connection every `keepalive_interval` seconds; an idle publisher would
+    otherwise be disconnected. A connection lost anyway (StreamLostError and
+    other AMQPConnectionErrors, or a closed channel) is dropped and reopened
+    and the operation retried once; if reconnecting fails the error is
+    raised and the next call tries again.
+    """
+
+    def __init__(self, url, keepalive_interval=5.0):
+        import pika
+
+        self._pika = pika
+        self._errors = (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError)
+        self._parameters = pika.URLParameters(url)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._declared = set()
+        # Bumped on every (re)connect; delivery tags are only valid on the
+        # channel they came from
+        self.generation = 0
+        self.reconnects = 0
+        self._closed = threading.Event()
+        with self._lock:
+            self._connect()
+        self._keepalive = threading.Thread(target=self._keep_alive, args=(keepalive_interval,),
+                                           name="rabbitmq-keepalive", daemon=True)
+        self._keepalive.start()
+
+    def _connect(self):
+        self._connection = self._pika.BlockingConnection(self._parameters)
+        self._channel = self._connection.channel()
+        self._declared = set()
+        self.generation += 1
+
+    def _drop(self):
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _run(self, operation):
+        """operation() under the lock on an open channel, reconnecting once
+        if the connection turns out to be lost."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._channel is None or not self._channel.is_open:
+                        self._drop()
+                        self._connect()
+                    return operation()
+                except self._errors as e:
+                    self._drop()
+                    if attempt:
+                        raise
+                    self.reconnects += 1
+                    logger.warning(f"RabbitMQ connection lost ({e!r}); reconnecting")
+
+    def _keep_alive(self, interval):
+        while not self._closed.wait(interval):
+            with self._lock:
+                if self._connection is None:
+                    continue
+                try:
+                    self._connection.process_data_events(time_limit=0)
+                except Exception as e:
+                    # Reopened by the next operation
+                    logger.warning(f"RabbitMQ connection lost while idle ({e!r})")
+                    self._drop()
+
+    def _declare(self, queue_name):
+        if queue_name not in self._declared:
+            self._channel.queue_declare(queue=queue_name, durable=True)
+            self._declared.add(queue_name)
+
+    def publish(self, queue_name, payload):
+        self.publish_batch(queue_name, [payload])
+
+    def publish_batch(self, queue_name, payloads):
+        """Publish several payloads under one lock acquisition, in order.
+
+        A batch interrupted by a lost connection is published again in full,
+        so a few of its messages may go out twice.
+        """
+        bodies = [json.dumps(payload, ensure_ascii=False).encode("utf-8") for payload in payloads]
+        properties = self._pika.BasicProperties(delivery_mode=2, content_type="application/json")
+
+        def operation():
+            self._declare(queue_name)
+            for body in bodies:
+                self._channel.basic_publish(exchange="", routing_key=queue_name, body=body, properties=properties)
+
+        self._run(operation)
+
+    def get_batch(self, queue_name, max_items, timeout=1.0):
+        def operation():
+            items = []
+            last_tag = None
+            self._declare(queue_name)
+            while len(items) < max_items:
+                method, _, body = self._channel.basic_get(queue=queue_name, auto_ack=False)
+                if method is None:
+                    break
+                last_tag = method.delivery_tag
+                try:
+                    items.append(json.loads(body))
+                except ValueError:
+                    logger.error(f"Dropping malformed queue message: {body[:200]!r}")
+            if not items and last_tag is None:
+                self._connection.sleep(timeout)
+                return items, None
+            return items, (self.generation, last_tag)
+
+        # Messages fetched on a connection that is then lost are redelivered
+        return self._run(operation)
+
+    def ack(self, token):
+        if token is None:
+            return
+        generation, tag = token
+
+        def operation():
+            if generation != self.generation:
+                # The channel that delivered them is gone; RabbitMQ redelivers
+                # them and the message id deduplication skips the repeats
+                logger.warning(f"Not acking delivery {tag} from a lost RabbitMQ connection")
+                return
+            self._channel.basic_ack(delivery_tag=tag, multiple=True)
+
+        self._run(operation)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._drop()
@@ -0,0 +1,332 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, dumped):
+        for key, value in dumped:
+            self.inc(value, **dict(zip(self.labelnames, key)))
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._values.items()]
+
+    def merge(self, dumped):
+        with self._lock:
+            for key, counts, total, count in dumped:
+                entry = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def totals(self):
+        """(count, sum) per label tuple, for reading metrics in-process."""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", le)), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+class GaugeCallback:
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def samples(self):
+        return [(self.name, "", self.func())]
+
+
+class CounterCallback:
+    """A counter whose value is read from `func`, for totals another object
+    keeps (retries, breaker trips). `func` must never decrease."""
+
+    kind = "counter"
+    labelnames = ()
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def samples(self):
+        return [(self.name, "", self.func())]
+
+    def dump(self):
+        return [[[], self.func()]]
+
+
+class Registry:
+    """Holds this process's metrics and renders the Prometheus text format.
+
+    A scrape reaches a single gunicorn worker, so with several workers give
+    every process the same `directory` (METRICS_DIR), like prometheus_client's
+    multiprocess mode. Each process then writes its counters and histograms
+    to counters-<pid>-<start>.json and its gauges to gauges-<pid>.json
+    every `flush_interval` seconds and on every render(), and render() sums
+    the counters and histograms of all files, dead workers included, so
+    they never go backwards. Gauges get a pid label; a worker's gauge file
+    is removed when it exits (gunicorn's child_exit hook).
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self._metrics = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._write_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            pid = os.getpid()
+            self._counters_path = os.path.join(directory, f"counters-{pid}-{int(time.time() * 1000)}.json")
+            self._gauges_path = os.path.join(directory, f"gauges-{pid}.json")
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, func):
+        return self.register(GaugeCallback(name, documentation, func))
+
+    def counter_callback(self, name, documentation, func):
+        return self.register(CounterCallback(name, documentation, func))
+
+    def render(self):
+        if self.directory:
+            return self._render_directory()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start(self):
+        """Write this process's numbers every `flush_interval` seconds, so
+        workers that are never scraped still show up."""
+        if self.directory and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_forever, name="metrics-flush", daemon=True)
+            self._flusher.start()
+        return self
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f"Could not write metrics to {self.directory}: {e!r}")
+
+    def write(self):
+        counters = {metric.name: metric.dump() for metric in self._metrics if metric.kind != "gauge"}
+        gauges = {metric.name: metric.func() for metric in self._metrics if metric.kind == "gauge"}
+        with self._write_lock:
+            for path, data in ((self._counters_path, counters), (self._gauges_path, gauges)):
+                # Written to a temporary file and renamed, so readers never see half a file
+                temporary = f"{path}.tmp"
+                with open(temporary, "w", encoding="utf-8") as target:
+                    json.dump(data, target)
+                os.replace(temporary, path)
+
+    def _read(self, pattern):
+        for path in sorted(glob.glob(os.path.join(self.directory, pattern))):
+            try:
+                with open(path, encoding="utf-8") as source:
+                    yield path, json.load(source)
+            except (OSError, ValueError):
+                # Removed (worker exited) between listing and reading
+                continue
+
+    def _render_directory(self):
+        self.write()
+        merged = {}
+        for metric in self._metrics:
+            if metric.kind == "counter":
+                merged[metric.name] = Counter(metric.name, metric.documentation, metric.labelnames)
+            elif metric.kind == "histogram":
+                merged[metric.name] = Histogram(metric.name, metric.documentation, metric.labelnames, metric.buckets)
+        for _, counters in self._read("counters-*.json"):
+            for name, dumped in counters.items():
+                if name in merged:
+                    merged[name].merge(dumped)
+        gauges = {}
+        for path, values in self._read("gauges-*.json"):
+            pid = os.path.basename(path)[len("gauges-"):-len(".json")]
+            for name, value in values.items():
+                gauges.setdefault(name, []).append((_format_labels(("pid",), (pid,)), value))
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "gauge":
+                samples = [(metric.name, labels, value) for labels, value in gauges.get(metric.name, [])]
+            else:
+                samples = merged[metric.name].samples()
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that can be switched on at runtime.
+
+    A background thread snapshots every other thread's stack every
+    `interval` seconds and counts collapsed stacks, which can be fed
+    straight into flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = _Tally()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Separate from _lock, which stop() holds while joining the sampler
+        self._stacks_lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        with self._lock:
+            if self.running:
+                return False
+            if interval:
+                self.interval = interval
+            self._stacks.clear()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop.set()
+            self._thread.join()
+            return True
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self.max_depth)
+                key = ";".join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})" for entry in stack)
+                with self._stacks_lock:
+                    self._stacks[key] += 1
+            self.samples += 1
+
+    def collapsed(self, limit=None):
+        # Copied under the lock: the sampler thread keeps adding stacks
+        with self._stacks_lock:
+            stacks = self._stacks.copy()
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common(limit)]
+        return "\n".join(lines) + "\n"
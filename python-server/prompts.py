@@ -0,0 +1,95 @@
+import hashlib
+
+# Per-turn text kept in the rolling summary; long AI answers are clipped
+TURN_CHARS = 200
+
+
+def estimate_tokens(text):
+    # Roughly four bytes of UTF-8 per token; close enough for budgeting both
+    # English and Sinhala text without pulling in a tokenizer
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def _clip(text, limit=TURN_CHARS):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class PromptBuilder:
+    """Builds model prompts from a pre-rendered shop-info prefix per language
+    plus a rolling summary of the conversation.
+
+    The static prefix is rendered once from the shop info (and again only
+    when rebuild() is called); `version` changes only when the rendered
+    text does, so edits that never reach a prompt (stock counts) keep
+    cached answers valid. The summary lives on the ChatState and is updated
+    one turn at a time by record_turn(), dropping the oldest turns once it
+    exceeds `history_tokens`, so prompt size stays bounded however long the
+    chat runs.
+    """
+
+    LABELS = {
+        "sinhala": {"history": "මෑත සංවාදය:", "customer": "පාරිභෝගිකයා", "assistant": "සහකරු", "query": "විමසුම"},
+        "default": {"history": "Recent conversation:", "customer": "Customer", "assistant": "Assistant", "query": "Query"},
+    }
+
+    def __init__(self, shop_info, history_tokens=300):
+        self.history_tokens = history_tokens
+        self.rebuild(shop_info)
+
+    def rebuild(self, shop_info):
+        prefixes, suffixes = {}, {}
+        for language, info in shop_info.items():
+            if language == "sinhala":
+                prefixes[language] = f"""ඔබ සුන් මොබයිල් හොරණ සහකරු ලෙස පාරිභෝගිකයාගේ විමසුමට උදව් කරන්න.
+වත්මන් සාප්පු තොරතුරු:
+- වෙළඳ නාම: {', '.join(info['brands'])}
+- සේවා: {', '.join(info['services'])}
+- ලිපිනය: {info['address']}
+- දුරකථන: {info['phone']}"""
+                suffixes[language] = "සිංහලෙන් මිත්‍රශීලී, කෙටි, වෘත්තීය පිළිතුරු දෙන්න."
+            else:
+                prefixes[language] = f"""You are an assistant for Sun Mobile Horana, helping with customer queries.
+Current shop info:
+- Brands: {', '.join(info['brands'])}
+- Services: {', '.join(info['services'])}
+- Address: {info['address']}
+- Phone: {info['phone']}"""
+                suffixes[language] = f"Respond in {language}, keeping answers friendly, concise, and professional."
+        # Swap both maps in one assignment so a concurrent build() never mixes versions
+        self._templates = (prefixes, suffixes)
+        self.version = hashlib.sha1(repr(self._templates).encode("utf-8")).hexdigest()
+
+    def prefix(self, language):
+        return self._templates[0][language]
+
+    def labels(self, language):
+        return self.LABELS.get(language, self.LABELS["default"])
+
+    def record_turn(self, state, message, response):
+        state.add_to_history(message, response)
+        labels = self.labels(state.language)
+        text = response["text"] if isinstance(response, dict) else response
+        line = f"{labels['customer']}: {_clip(message)}\n{labels['assistant']}: {_clip(text)}"
+        state.summary.append(line)
+        state.summary_tokens += estimate_tokens(line)
+        while len(state.summary) > 1 and state.summary_tokens > self.history_tokens:
+            state.summary_tokens -= estimate_tokens(state.summary.pop(0))
+
+    def history_digest(self, state):
+        if not state.summary:
+            return ""
+        return hashlib.sha1("\n".join(state.summary).encode("utf-8")).hexdigest()[:16]
+
+    def build(self, message, state, context=""):
+        prefixes, suffixes = self._templates
+        labels = self.labels(state.language)
+        parts = [prefixes[state.language]]
+        if state.summary:
+            parts.append(labels["history"])
+            parts.extend(state.summary)
+        if context:
+            parts.append(context)
+        parts.append(f"{labels['query']}: {message}")
+        parts.append(suffixes[state.language])
+        return "\n".join(parts)
@@ -0,0 +1,99 @@
+"""Queue consumer mode for the chatbot.
+
+Pulls inbound {number, message, message_id} items from INBOUND_QUEUE in
+batches, runs them through the same pipeline as /send and publishes each
+reply to the whatsapp_messages queue that node-server's connectQueue()
+consumes.
+
+Run with:  RABBITMQ_URL=amqp://rabbitmq python queue_worker.py
+"""
+import logging
+import os
+import time
+
+from messaging import INBOUND_QUEUE, OUTBOUND_QUEUE, RabbitMQBroker, chat_id_to_number
+
+logger = logging.getLogger(__name__)
+
+
+class QueueConsumer:
+    def __init__(self, broker, handle_batch, inbound=INBOUND_QUEUE, outbound=OUTBOUND_QUEUE,
+                 batch_size=50, poll_timeout=1.0, max_failures=10, max_backoff=30.0):
+        self.broker = broker
+        self.handle_batch = handle_batch
+        self.inbound = inbound
+        self.outbound = outbound
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.max_failures = max_failures
+        self.max_backoff = max_backoff
+        self.processed = 0
+        self._running = False
+
+    def run_once(self):
+        items, token = self.broker.get_batch(self.inbound, self.batch_size, timeout=self.poll_timeout)
+        if not items:
+            self.broker.ack(token)
+            return 0
+        # Each reply is published as soon as it is ready, from the worker
+        # handling that number, so it cannot overtake (or fall behind)
+        # streamed chunks of the same customer's next message
+        self.handle_batch(items, self.publish_result)
+        self.broker.ack(token)
+        self.processed += len(items)
+        return len(items)
+
+    def publish_result(self, result):
+        if not result or not result.get("response"):
+            return
+        # Streamed replies were already published chunk by chunk; only an
+        # attached image still needs to go out
+        streamed = result.get("streamed", False)
+        if streamed and not result.get("image"):
+            return
+        payload = {"number": chat_id_to_number(result["number"]), "message": "" if streamed else result["response"]}
+        for key in ("image", "media_id", "media"):
+            if result.get(key):
+                payload[key] = result[key]
+        self.broker.publish(self.outbound, payload)
+
+    def run_forever(self):
+        """Consume until stop(). Errors are retried with exponential backoff;
+        after `max_failures` in a row (the broker stays unreachable) the last
+        one is raised, so the process exits and Docker restarts it."""
+        self._running = True
+        failures = 0
+        while self._running:
+            try:
+                self.run_once()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if failures >= self.max_failures:
+                    logger.critical(f"Queue consumer giving up after {failures} errors in a row: {e!r}")
+                    raise
+                logger.error(f"Queue consumer error ({failures} in a row): {e!r}")
+                time.sleep(min(self.max_backoff, self.poll_timeout * 2 ** (failures - 1)))
+
+    def stop(self):
+        self._running = False
+
+
+def main():
+    import bot
+
+    url = os.getenv("RABBITMQ_URL", "amqp://rabbitmq")
+    base_url = os.getenv("PUBLIC_BASE_URL", "http://python-api:5000/")
+    consumer = QueueConsumer(
+        RabbitMQBroker(url),
+        lambda items, on_result: bot.handle_batch(items, base_url, on_result),
+        inbound=os.getenv("INBOUND_QUEUE", INBOUND_QUEUE),
+        batch_size=int(os.getenv("QUEUE_BATCH_SIZE", "50")),
+        max_failures=int(os.getenv("QUEUE_MAX_FAILURES", "10")),
+    )
+    logger.info(f"Consuming {consumer.inbound} from {url}")
+    consumer.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses (as carried by google.api_core errors in `.code`) worth
+# retrying: timeouts, rate limits and server-side failures
+RETRYABLE_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_retryable(error):
+    """Transient errors are retried; bad requests and blocked prompts are not."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """Stops calling a dependency that keeps failing.
+
+    While "closed" every call goes through and `failure_threshold`
+    consecutive failures open the circuit. While "open" calls are refused
+    outright; after `reset_timeout` seconds it turns "half_open" and lets
+    `half_open_max` trial calls through. A success closes the circuit
+    again, a failure re-opens it for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trials = 0
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def _refresh(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trials = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allow(self):
+        """Whether a call may go ahead now; counts as a trial when half open."""
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._trials < self.half_open_max:
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self._state != self.CLOSED:
+                self._state = self.CLOSED
+                logger.info("Circuit closed, calls resumed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self.opened += 1
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures, "
+                               f"refusing calls for {self.reset_timeout}s")
+
+    def stats(self):
+        state = self.state
+        return {"state": state, "consecutive_failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class RetryBudget:
+    """Caps retries at a fraction of all calls, across every request.
+
+    Each call deposits `ratio` tokens and each retry spends one, so during
+    an outage retries add at most `ratio` extra load instead of multiplying
+    it. `min_per_second` tokens also trickle in so a quiet worker can still
+    retry; the balance never exceeds `max_tokens`.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, max_tokens=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = clock()
+        self.spent = 0
+        self.denied = 0
+
+    def _add(self, amount):
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + amount + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._add(self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            self._add(0.0)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.spent += 1
+                return True
+            self.denied += 1
+            return False
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Common Singlish spellings folded onto one form so that
+# "shop eka kohenda" and "shop ek koheda?" share a cache entry
+SINGLISH_VARIANTS = {
+    "kohenda": "koheda",
+    "kohed": "koheda",
+    "thiyanawa": "thiyenawa",
+    "tiyenawa": "thiyenawa",
+    "thiyenawada": "thiyenawa",
+    "thiyanawada": "thiyenawa",
+    "tiyenawada": "thiyenawa",
+    "thiyenawad": "thiyenawa",
+    "oona": "ona",
+    "onna": "ona",
+    "one": "ona",
+    "ek": "eka",
+    "ekak": "eka",
+    "puluwanda": "puluwan",
+    "keeyada": "kiyada",
+    "kiyeda": "kiyada",
+}
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s\u0d80-\u0dff\u200d]")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Stretched letters ("hiiii", "pleeease"); digits are left alone so
+# "1000" and "10000" stay different questions
+_REPEATED_RE = re.compile(r"([^\W\d_])\1{2,}")
+
+
+def normalize_query(message, language=None):
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    text = _REPEATED_RE.sub(r"\1", text)
+    tokens = _WHITESPACE_RE.split(text.strip())
+    if language == "singlish":
+        tokens = [SINGLISH_VARIANTS.get(token, token) for token in tokens]
+    return " ".join(token for token in tokens if token)
+
+
+def fingerprint(data):
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of AI answers with a TTL.
+
+    Entries are tagged with a data version (the prompt builder's version);
+    calling set_version() with a new value drops everything cached
+    against the old shop data. With a `shared` key-value store, local misses
+    fall through to it so answers are reused across worker processes.
+    """
+
+    def __init__(self, max_entries=5000, ttl=3600, version=None, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.shared = shared
+        self.shared_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(message, language, intent, product_details, context=""):
+        # context is a digest of the conversation so far; follow-up questions
+        # only share an answer when the preceding turns match too
+        details = tuple(sorted(product_details.items())) if product_details else ()
+        return (language, intent, details, normalize_query(message, language), context)
+
+    def _shared_key(self, key):
+        # The version is part of the key, so stale shop data is never served
+        digest = hashlib.sha1(repr((self.version, key)).encode("utf-8")).hexdigest()
+        return f"response:{digest}"
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        if self.shared is not None:
+            value = self.shared.get(self._shared_key(key))
+            if value is not None:
+                self._store_local(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._store_local(key, value)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), value, ttl=self.ttl)
+
+    def _store_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version):
+        with self._lock:
+            if version == self.version:
+                return False
+            self.version = version
+            self._entries.clear()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "shared_hits": self.shared_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "version": self.version,
+            }
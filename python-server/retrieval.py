@@ -0,0 +1,207 @@
+import math
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from catalog import tokenize
+from response_cache import normalize_query
+from shop_data import info_fields
+
+# Character n-grams inside word boundaries cope with Singlish spelling
+# variants and Sinhala inflections that whole-word matching would miss
+NGRAM_SIZES = (3, 4, 5)
+
+# Answers that come from the catalog rather than a fixed text; their
+# questions hold an {item} placeholder filled with every product name
+PRODUCT_TOPICS = ("price", "stock")
+
+# A message detected as one of these intents is asking for a product; a
+# shop-info answer (say the contact numbers for "do you have phones") would
+# be wrong, so only product topics are answered locally for it
+PRODUCT_INTENTS = ("product_inquiry", "accessory_inquiry")
+
+
+def char_ngrams(text):
+    grams = []
+    for word in normalize_query(text, "singlish").split():
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+class TfidfIndex:
+    """TF-IDF vectors of character n-grams, scored by cosine similarity.
+
+    The matrix is stored term-major (one row per n-gram, one column per
+    document), so scoring a query gathers the few rows for its n-grams and
+    takes one dot product against every document at once. N-grams the
+    index has never seen still count towards the query's norm, weighted
+    like the rarest indexed n-gram, so a message that is mostly about
+    something else scores low instead of matching on a few shared words.
+    """
+
+    def __init__(self, documents, labels):
+        # Columns are grouped by label so per-label maxima are one reduceat
+        order = sorted(range(len(documents)), key=lambda index: labels[index])
+        documents = [documents[index] for index in order]
+        labels = [labels[index] for index in order]
+        counts = [Counter(char_ngrams(document)) for document in documents]
+        self.vocabulary = {}
+        for grams in counts:
+            for gram in grams:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+        self.labels = sorted(set(labels))
+        self._label_starts = np.array([labels.index(label) for label in self.labels])
+
+        document_frequency = np.zeros(len(self.vocabulary))
+        for grams in counts:
+            document_frequency[[self.vocabulary[gram] for gram in grams]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        self.unknown_idf = math.log(1 + len(documents)) + 1
+
+        self.matrix = np.zeros((len(self.vocabulary), len(documents)), dtype=np.float32)
+        for column, grams in enumerate(counts):
+            rows = [self.vocabulary[gram] for gram in grams]
+            self.matrix[rows, column] = (1 + np.log(list(grams.values()))) * self.idf[rows]
+        self.matrix /= np.maximum(np.linalg.norm(self.matrix, axis=0), 1e-12)
+
+    def __len__(self):
+        return self.matrix.shape[1]
+
+    def _query(self, text):
+        rows, weights, unknown = [], [], 0.0
+        for gram, count in Counter(char_ngrams(text)).items():
+            weight = 1 + math.log(count)
+            row = self.vocabulary.get(gram)
+            if row is None:
+                unknown += (weight * self.unknown_idf) ** 2
+            else:
+                rows.append(row)
+                weights.append(weight * self.idf[row])
+        weights = np.array(weights, dtype=np.float32)
+        norm = math.sqrt(float(weights @ weights) + unknown)
+        return rows, weights / norm if norm else weights
+
+    def scores(self, texts):
+        """Cosine similarity of each text to each document: (texts x documents)."""
+        queries = [self._query(text) for text in texts]
+        rows = sorted({row for query_rows, _ in queries for row in query_rows})
+        position = {row: index for index, row in enumerate(rows)}
+        dense = np.zeros((len(texts), len(rows)), dtype=np.float32)
+        for index, (query_rows, weights) in enumerate(queries):
+            dense[index, [position[row] for row in query_rows]] = weights
+        return dense @ self.matrix[rows]
+
+    def search(self, texts):
+        """Best label per text as (label, score, margin over the next label)."""
+        if not texts:
+            return []
+        scores = self.scores(texts)
+        # Best document score per label, for every text at once
+        by_label = np.maximum.reduceat(scores, self._label_starts, axis=1)
+        rows = np.arange(len(texts))
+        order = np.argsort(-by_label, axis=1)
+        best = by_label[rows, order[:, 0]]
+        second = by_label[rows, order[:, 1]] if len(self.labels) > 1 else np.zeros(len(texts))
+        return [(self.labels[label], float(score), float(score - runner_up))
+                for label, score, runner_up in zip(order[:, 0], best, second)]
+
+
+class Retriever:
+    """Answers FAQ, shop-info, price and stock questions without the model.
+
+    Questions are indexed per topic in every language; a message is
+    answered locally only when its best topic scores at least `min_score`
+    and beats the next topic by `min_margin`. Price and stock answers also
+    need the catalog to recognise the product and know its price or count;
+    otherwise the message goes to the model as before.
+
+    Topics are memoized per message text: customers repeat the same few
+    questions, and each NumPy call gives up the GIL, which costs a busy
+    worker far more than the arithmetic.
+    """
+
+    def __init__(self, questions, answers, messages, min_score=0.4, min_margin=0.15, cache_size=4096,
+                 question_words=()):
+        self.answers = answers
+        # Words a price or stock question may have right after the product
+        # name ("price", "in", "thiyenawada", ...)
+        self.question_words = frozenset(question_words)
+        self.messages = messages
+        self.min_score = min_score
+        self.min_margin = min_margin
+        texts, labels = [], []
+        for topic, topic_questions in questions.items():
+            texts.extend(topic_questions)
+            labels.extend([topic] * len(topic_questions))
+        self.index = TfidfIndex(texts, labels)
+        self.topic = lru_cache(maxsize=cache_size)(self._topic)
+
+    def topics(self, messages):
+        """Confident topic (or None) and score for each message."""
+        results = []
+        for topic, score, margin in self.index.search(messages):
+            confident = score >= self.min_score and margin >= self.min_margin
+            results.append((topic if confident else None, score))
+        return results
+
+    def _topic(self, message):
+        return self.topics([message])[0][0]
+
+    def answer(self, message, language, catalog, intent=None):
+        """Return (topic, text) for a confidently matched message, else None.
+
+        `intent` is detect_intent()'s label for the message, if known.
+        """
+        topic = self.topic(message)
+        if topic is None:
+            return None
+        if topic not in PRODUCT_TOPICS:
+            if intent in PRODUCT_INTENTS:
+                return None
+            return topic, self.answers[topic][language]
+        product, following = catalog.mention(message)
+        # "iphone 15 case" or "iphone 15 128gb" are about something the
+        # catalog did not recognise: only the model can answer those
+        if product is None or (following and following[0] not in self.question_words):
+            return None
+        templates = self.messages[language]
+        item = product.display_name(language)
+        if topic == "price":
+            if product.price is None:
+                return None
+            return topic, templates["price_answer"].format(item=item, price=product.price)
+        if product.stock is None:
+            return None
+        if product.stock > 0:
+            return topic, templates["stock_available"].format(item=item, quantity=product.stock)
+        return topic, templates["stock_unavailable"].format(item=item)
+
+
+def build_retriever(shop_info, faq, faq_questions, messages, catalog, **options):
+    """Index the FAQ questions of every language plus product questions
+    expanded with the catalog's product names."""
+    questions, question_words = {}, set()
+    names = sorted({name for product in catalog.products.values() for name in product.names.values()})
+    for language_questions in faq_questions.values():
+        for topic, topic_questions in language_questions.items():
+            expanded = questions.setdefault(topic, [])
+            for question in topic_questions:
+                if topic in PRODUCT_TOPICS:
+                    expanded.extend(question.format(item=name) for name in names)
+                    question_words.update(tokenize(question.format(item=" ")))
+                else:
+                    expanded.append(question)
+    # FAQ answers may quote the shop info ({address}, {phone}, {services}, ...)
+    answers = {}
+    for language, entries in faq.items():
+        fields = info_fields(shop_info.get(language, shop_info["english"]))
+        for topic in questions:
+            if topic in entries:
+                answers.setdefault(topic, {})[language] = entries[topic].format(**fields)
+    missing = [topic for topic in questions if topic not in PRODUCT_TOPICS and len(answers.get(topic, ())) != len(faq)]
+    if missing:
+        raise ValueError(f"FAQ answers missing for {', '.join(missing)} in some languages")
+    return Retriever(questions, answers, messages, question_words=question_words, **options)
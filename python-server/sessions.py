@@ -0,0 +1,256 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = 10
+
+
+class ChatState:
+    __slots__ = ("number", "current_stage", "language", "conversation_history", "is_first_message", "last_activity",
+                 "summary", "summary_tokens")
+
+    def __init__(self, number=None):
+        self.number = number
+        self.current_stage = "welcome"
+        self.language = "sinhala"
+        self.conversation_history = deque(maxlen=HISTORY_LIMIT)
+        self.is_first_message = True
+        self.last_activity = time.time()
+        # Rolling prompt summary maintained by prompts.PromptBuilder
+        self.summary = []
+        self.summary_tokens = 0
+
+    def reset(self):
+        saved_language = self.language
+        self.__init__(self.number)
+        self.language = saved_language
+
+    def add_to_history(self, message, response):
+        response_text = response["text"] if isinstance(response, dict) else response
+        self.conversation_history.append({"message": message, "response": response_text})
+        self.last_activity = time.time()
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "current_stage": self.current_stage,
+            "language": self.language,
+            "conversation_history": list(self.conversation_history),
+            "is_first_message": self.is_first_message,
+            "last_activity": self.last_activity,
+            "summary": self.summary,
+            "summary_tokens": self.summary_tokens,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data.get("number"))
+        state.current_stage = data.get("current_stage", state.current_stage)
+        state.language = data.get("language", state.language)
+        state.conversation_history.extend(data.get("conversation_history", []))
+        state.is_first_message = data.get("is_first_message", state.is_first_message)
+        state.last_activity = data.get("last_activity", state.last_activity)
+        state.summary = list(data.get("summary", []))
+        state.summary_tokens = data.get("summary_tokens", 0)
+        return state
+
+
+class SQLiteSessionBackend:
+    """Persists sessions in a SQLite file so they survive restarts.
+
+    Rows are only read when a number is not already in memory, so startup
+    does not load every stored session.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "number TEXT PRIMARY KEY, data TEXT NOT NULL, last_activity REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_activity ON sessions (last_activity)")
+        self._conn.commit()
+
+    def load(self, number):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE number = ?", (number,)).fetchone()
+        return ChatState.from_dict(json.loads(row[0])) if row else None
+
+    def save(self, number, state):
+        data = json.dumps(state.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (number, data, last_activity) VALUES (?, ?, ?)",
+                (number, data, state.last_activity),
+            )
+            self._conn.commit()
+
+    def delete(self, number):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE number = ?", (number,))
+            self._conn.commit()
+
+    def purge_older_than(self, cutoff):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE last_activity < ?", (cutoff,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def numbers(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT number FROM sessions")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class KeyValueSessionBackend:
+    """Stores sessions in a shared key-value store (see shared_state) so
+    every worker process sees the same conversation state."""
+
+    def __init__(self, store, ttl=86400, prefix="session:"):
+        self.store = store
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, number):
+        data = self.store.get(self.prefix + number)
+        return ChatState.from_dict(data) if data else None
+
+    def save(self, number, state):
+        self.store.set(self.prefix + number, state.to_dict(), ttl=self.ttl)
+
+    def delete(self, number):
+        self.store.delete(self.prefix + number)
+
+    def purge_older_than(self, cutoff):
+        # Entries expire through the store's own TTL
+        return 0
+
+    def numbers(self):
+        return [key[len(self.prefix):] for key in self.store.keys(self.prefix)]
+
+
+class SessionStore:
+    """Bounded in-memory session map with LRU and idle-TTL eviction.
+
+    At most `max_sessions` states are kept in memory; the least recently used
+    one is dropped when the cap is reached. A session whose last_activity is
+    older than `idle_ttl` seconds is treated as gone. With a backend, states
+    are written through on save() and lazily reloaded on a miss.
+
+    When the backend is shared between worker processes, set
+    local_cache=False so every lookup reads the backend and a worker never
+    answers from a copy another worker has since updated.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=86400, backend=None, sweep_interval=60, local_cache=True):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.local_cache = local_cache or backend is None
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, number):
+        return self.get(number) is not None
+
+    def _expired(self, state, now):
+        return now - state.last_activity > self.idle_ttl
+
+    def get(self, number):
+        now = time.time()
+        with self._lock:
+            state = self._sessions.get(number)
+            if state is not None:
+                if not self._expired(state, now):
+                    self._sessions.move_to_end(number)
+                    return state
+                del self._sessions[number]
+        if self.backend is None:
+            return None
+        state = self.backend.load(number)
+        if state is None or self._expired(state, now):
+            return None
+        with self._lock:
+            self._insert(number, state)
+        return state
+
+    def get_or_create(self, number):
+        state = self.get(number)
+        if state is None:
+            state = ChatState(number)
+            with self._lock:
+                self._insert(number, state)
+            self._maybe_sweep()
+        return state
+
+    def save(self, number, state):
+        state.last_activity = time.time()
+        with self._lock:
+            self._insert(number, state)
+        self._maybe_sweep()
+        if self.backend is not None:
+            try:
+                self.backend.save(number, state)
+            except Exception as e:
+                logger.error(f"Failed to persist session for {number}: {e}")
+
+    def delete(self, number):
+        with self._lock:
+            self._sessions.pop(number, None)
+        if self.backend is not None:
+            self.backend.delete(number)
+
+    def numbers(self):
+        """Every number with a session here or in the backend; a fresh
+        process only has the backend's. Expired ones are filtered by get()."""
+        with self._lock:
+            numbers = list(self._sessions)
+        if self.backend is not None:
+            local = set(numbers)
+            numbers.extend(number for number in self.backend.numbers() if number not in local)
+        return numbers
+
+    def _insert(self, number, state):
+        if not self.local_cache:
+            return
+        self._sessions[number] = state
+        self._sessions.move_to_end(number)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep > self.sweep_interval:
+            self.evict_expired()
+
+    def evict_expired(self):
+        now = time.time()
+        evicted = 0
+        with self._lock:
+            self._last_sweep = now
+            # Oldest-used sessions sit at the front, so stop at the first live one
+            while self._sessions:
+                number, state = next(iter(self._sessions.items()))
+                if not self._expired(state, now):
+                    break
+                del self._sessions[number]
+                evicted += 1
+        if self.backend is not None:
+            self.backend.purge_older_than(now - self.idle_ttl)
+        return evicted
@@ -0,0 +1,124 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LocalKeyValueStore:
+    """In-process stand-in for a shared key-value store.
+
+    Values are JSON-serialized exactly like the Redis backend so code
+    exercised against this store behaves the same in production. Only
+    suitable for a single worker process and for tests.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            raw, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (raw, expires_at)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is absent (or expired); True if it was set."""
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] > now):
+                return False
+            self._data[key] = (raw, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def acquire_lock(self, key, token, ttl):
+        """Take a lock held as `token` for `ttl` seconds; False if someone holds it."""
+        return self.add(key, token, ttl=ttl)
+
+    def release_lock(self, key, token):
+        """Release a lock only if it is still held as `token`."""
+        raw = json.dumps(token, ensure_ascii=False)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] == raw:
+                del self._data[key]
+                return True
+        return False
+
+    def keys(self, prefix=""):
+        now = time.time()
+        with self._lock:
+            return [key for key, (_, expires_at) in self._data.items()
+                    if key.startswith(prefix) and (expires_at is None or expires_at > now)]
+
+
+class RedisKeyValueStore:
+    """Key-value store backed by Redis, shared by every worker process."""
+
+    shared = True
+
+    def __init__(self, url, prefix="chatbot:"):
+        import redis
+
+        self.prefix = prefix
+        # redis-py keeps a connection pool per client; one client per process
+        self._client = redis.Redis.from_url(url)
+        self._release_script = self._client.register_script(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end")
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        raw = json.dumps(value, ensure_ascii=False)
+        self._client.set(self.prefix + key, raw, ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        raw = json.dumps(value, ensure_ascii=False)
+        return bool(self._client.set(self.prefix + key, raw, ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def acquire_lock(self, key, token, ttl):
+        raw = json.dumps(token, ensure_ascii=False)
+        return bool(self._client.set(self.prefix + key, raw, px=max(1, int(ttl * 1000)), nx=True))
+
+    def release_lock(self, key, token):
+        # Compare and delete in one step, so a lock that expired and was
+        # taken by another worker is never released by the old holder
+        raw = json.dumps(token, ensure_ascii=False)
+        return bool(self._release_script(keys=[self.prefix + key], args=[raw]))
+
+    def keys(self, prefix=""):
+        start = len(self.prefix)
+        return [key.decode("utf-8")[start:] for key in self._client.scan_iter(match=f"{self.prefix}{prefix}*")]
+
+
+def create_store(url=None):
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        logger.info("Using Redis for shared state")
+        return RedisKeyValueStore(url)
+    return LocalKeyValueStore()
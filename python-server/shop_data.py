@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+
+from response_cache import fingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Section name -> file in the data directory
+SECTIONS = {
+    # Per-language shop details and stock counts (SHOP_INFO)
+    "shop": "shop.json",
+    # Product images, aliases and prices: {"images", "aliases", "prices"}
+    "catalog": "catalog.json",
+    # Reply templates and FAQ fallbacks: {"messages", "faq"}
+    "messages": "messages.json",
+    # Conversation stages and menu transitions (see conversation.py)
+    "conversation": "conversation.json",
+}
+
+
+def freeze(value):
+    """Read-only copy of parsed JSON: dicts become mappingproxies, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def read_section(name, directory=DEFAULT_DATA_DIR):
+    with open(os.path.join(directory, SECTIONS[name]), encoding="utf-8") as data:
+        return json.load(data)
+
+
+def info_fields(info):
+    """Template fields from one language's shop info ({address}, {phone},
+    {services}, ...); lists are joined with commas and stock is left out."""
+    return {key: ", ".join(value) if isinstance(value, (list, tuple)) else value
+            for key, value in info.items() if key != "stock"}
+
+
+class ShopData:
+    """Shop data loaded from JSON files and swapped in atomically on change.
+
+    Each load parses the files into read-only mappings and passes them to
+    `build(sections, previous, changed)` together with the previous state
+    and the names of the sections whose content changed. Whatever `build`
+    returns replaces `current` in a single assignment, so request threads
+    read `current` once, without a lock, and never see half an update;
+    `build` reuses what it derived from unchanged sections. Caches kept
+    outside the state register in `listeners` and are called with
+    (current, changed) after each swap.
+
+    watch() polls file mtimes every `poll_interval` seconds. A file that
+    fails to parse or build is logged and the previous state stays in use.
+    """
+
+    def __init__(self, build, directory=DEFAULT_DATA_DIR, poll_interval=2.0):
+        self.build = build
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.fingerprints = {}
+        self.current = None
+        self.listeners = []
+        self.reloads = 0
+        self.errors = 0
+        self._stamps = {}
+        # Serializes reloads only; readers never take it
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reload()
+
+    def _stamp(self, name):
+        try:
+            stat = os.stat(os.path.join(self.directory, SECTIONS[name]))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        """Re-read every file; returns the set of sections that changed."""
+        with self._lock:
+            # Stamped before reading, so a write that lands mid-read is
+            # picked up by the next poll
+            self._stamps = {name: self._stamp(name) for name in SECTIONS}
+            raw = {name: read_section(name, self.directory) for name in SECTIONS}
+            fingerprints = {name: fingerprint(data) for name, data in raw.items()}
+            changed = frozenset(name for name in SECTIONS if fingerprints[name] != self.fingerprints.get(name))
+            if changed:
+                sections = {name: freeze(data) for name, data in raw.items()}
+                self.current = self.build(sections, self.current, changed)
+                self.fingerprints = fingerprints
+                self.reloads += 1
+                for listener in self.listeners:
+                    listener(self.current, changed)
+            return changed
+
+    def check(self):
+        """Reload if any file's mtime or size moved since the last load."""
+        if {name: self._stamp(name) for name in SECTIONS} == self._stamps:
+            return frozenset()
+        try:
+            changed = self.reload()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Shop data reload failed, keeping the previous version: {e}")
+            return frozenset()
+        if changed:
+            logger.info("Reloaded shop data: %s", ", ".join(sorted(changed)))
+        return changed
+
+    def watch(self):
+        if self._thread is None and self.poll_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="shop-data-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,74 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for that result instead of starting their own call.
+    Errors raised by the leader are re-raised in every waiter. Waiters give
+    up after `timeout` seconds with TimeoutError.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, func, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+        elif not call.event.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out waiting for in-flight call {key!r}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._calls),
+            }
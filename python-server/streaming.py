@@ -0,0 +1,74 @@
+import re
+import time
+
+from messaging import OUTBOUND_QUEUE, chat_id_to_number
+
+# Sentence ends followed by whitespace, skipping abbreviations that show up
+# in prices and addresses ("Rs. 275,000", "No. 30"). A full stop at the very
+# end of the buffer is not a boundary yet: the next piece may be "5,000".
+SENTENCE_END_RE = re.compile(r"(?<!\bRs)(?<!\bNo)(?<!\bMr)(?<!\bDr)[.!?](?=\s)")
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def _find_cut(buffer, min_chars, max_chars):
+    paragraph = PARAGRAPH_RE.search(buffer, min_chars)
+    sentence = SENTENCE_END_RE.search(buffer, min_chars - 1)
+    cuts = []
+    if paragraph:
+        cuts.append(paragraph.start())
+    if sentence:
+        cuts.append(sentence.end())
+    if cuts and min(cuts) <= max_chars:
+        return min(cuts)
+    if len(buffer) > max_chars:
+        # No natural boundary in range: break at the last space that fits
+        space = buffer.rfind(" ", 0, max_chars)
+        return space if space > 0 else max_chars
+    return None
+
+
+def chunk_stream(pieces, min_chars=80, max_chars=700):
+    """Regroup streamed model output into message-sized chunks.
+
+    Text is cut at the first paragraph or sentence boundary after
+    `min_chars`, so short sentences are sent together instead of as a burst
+    of tiny WhatsApp messages. A chunk never exceeds `max_chars`. Whatever
+    is left when the stream ends is yielded as the last chunk.
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while True:
+            cut = _find_cut(buffer, min_chars, max_chars)
+            if cut is None:
+                break
+            chunk, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+            if chunk:
+                yield chunk
+    tail = buffer.strip()
+    if tail:
+        yield tail
+
+
+class ReplyStream:
+    """Publishes one customer's reply chunks, in order, to the outbound queue
+    consumed by node-server.
+
+    `delivered` is set by the caller once the reply went out as chunks, so
+    the regular reply path knows not to send the text a second time.
+    """
+
+    def __init__(self, broker, number, queue_name=OUTBOUND_QUEUE):
+        self.broker = broker
+        self.number = chat_id_to_number(number)
+        self.queue_name = queue_name
+        self.sent = 0
+        self.delivered = False
+        self.started = time.perf_counter()
+        self.first_chunk_seconds = None
+
+    def send(self, text):
+        self.broker.publish(self.queue_name, {"number": self.number, "message": text})
+        if self.sent == 0:
+            self.first_chunk_seconds = time.perf_counter() - self.started
+        self.sent += 1
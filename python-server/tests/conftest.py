@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py reads its configuration at import time; tests share one instance
+# with the fake model and no external services
+os.environ.update({"AI_BACKEND": "fake", "FAKE_MODEL_LATENCY": "0.2", "FAKE_MODEL_JITTER": "0", "LOG_FILE": "",
+                   "RETRIEVAL": "0", "SHOP_DATA_POLL": "0", "AI_WARMUP": "0"})
+for name in ("STATE_URL", "SESSION_DB", "RABBITMQ_URL", "STREAM_REPLIES", "GOOGLE_API_KEY"):
+    os.environ.pop(name, None)
@@ -0,0 +1,112 @@
+import pytest
+
+from broadcast import Broadcast, TokenBucket, campaign_deduplicator, csv_recipients, session_recipients
+from idempotency import MessageDeduplicator
+from messaging import OUTBOUND_QUEUE, InMemoryBroker
+from sessions import SessionStore, SQLiteSessionBackend
+from shared_state import LocalKeyValueStore
+
+MESSAGES = {
+    "english": {"promo": "📢 {offer} Call {phone}."},
+    "sinhala": {"promo": "📢 {offer} {phone} අමතන්න."},
+}
+FIELDS = {"offer": "10% off"}
+LANGUAGE_FIELDS = {"english": {"phone": "0767410963"}, "sinhala": {"phone": "0767410963"}}
+
+
+def recipients(count):
+    return ((f"9477100{i:04d}", "english", {}) for i in range(count))
+
+
+def test_claims_stay_capped_without_state_url():
+    deduplicator = campaign_deduplicator("capped", state_url=None, max_entries=100)
+    assert deduplicator.store is None
+    broadcast = Broadcast(InMemoryBroker(), MESSAGES, "promo", "capped", fields=FIELDS,
+                          language_fields=LANGUAGE_FIELDS, rate=None, deduplicator=deduplicator)
+    assert broadcast.run(recipients(1000))["published"] == 1000
+    # The cap is applied before each claim is added
+    assert len(deduplicator._seen) <= 100 + 1
+
+
+def campaign(broker, name, store=None, checkpoint=None, **options):
+    deduplicator = MessageDeduplicator(window=3600, store=store, prefix=f"broadcast:{name}:")
+    return Broadcast(broker, MESSAGES, "promo", name, fields=FIELDS, language_fields=LANGUAGE_FIELDS, rate=None,
+                     deduplicator=deduplicator, checkpoint_path=str(checkpoint) if checkpoint else None, **options)
+
+
+def numbers(broker):
+    return [payload["number"] for queue_name, payload in broker.published if queue_name == OUTBOUND_QUEUE]
+
+
+class FlakyBroker(InMemoryBroker):
+    """Fails every publish_batch after the first `healthy` ones."""
+
+    def __init__(self, healthy):
+        super().__init__()
+        self.healthy = healthy
+
+    def publish_batch(self, queue_name, payloads):
+        if self.healthy <= 0:
+            raise ConnectionError("broker connection lost")
+        self.healthy -= 1
+        super().publish_batch(queue_name, payloads)
+
+
+def test_render_and_skip_invalid_numbers(tmp_path):
+    path = tmp_path / "render.csv"
+    path.write_text("number,language\n+94 77 123 4567,english\n94771234568@c.us,sinhala\n"
+                    "94771234569,tamil\nnot-a-number,english\n", encoding="utf-8")
+    broker = InMemoryBroker()
+    stats = campaign(broker, "render").run(csv_recipients(str(path)))
+    sent = {payload["number"]: payload["message"] for payload in broker.drain(OUTBOUND_QUEUE)}
+    assert stats["published"] == 3 and stats["invalid"] == 1
+    assert sent["94771234567"] == "📢 10% off Call 0767410963."
+    # No Tamil template: the default language (Sinhala) is used
+    assert sent["94771234569"] == sent["94771234568"] == "📢 10% off 0767410963 අමතන්න."
+
+
+def test_each_number_gets_a_campaign_once():
+    rows = [(f"9477200{i:04d}", "english", {}) for i in range(50)]
+    store = LocalKeyValueStore()
+    broker = InMemoryBroker()
+    stats = campaign(broker, "dedup", store).run(iter(rows + rows[:10]))
+    assert stats["published"] == 50 and stats["duplicates"] == 10
+    # Another process running the same campaign sends nothing new
+    assert campaign(broker, "dedup", store).run(iter(rows))["published"] == 0
+    assert campaign(broker, "dedup-2", store).run(iter(rows))["published"] == 50
+
+
+def test_resume_after_broker_failure(tmp_path):
+    rows = [(f"9477400{i:04d}", "english", {}) for i in range(100)]
+    store = LocalKeyValueStore()
+    flaky = FlakyBroker(healthy=3)
+    with pytest.raises(ConnectionError):
+        campaign(flaky, "resume", store, tmp_path / "resume.json", batch_size=10).run(iter(rows))
+    broker = InMemoryBroker()
+    stats = campaign(broker, "resume", store, tmp_path / "resume.json", batch_size=10).run(iter(rows))
+    assert stats["done"] and sorted(numbers(flaky) + numbers(broker)) == [number for number, _, _ in rows]
+
+
+def test_token_bucket_paces_batches():
+    now = [0.0]
+    # Powers of two keep the simulated clock exact
+    bucket = TokenBucket(rate=64, burst=16, clock=lambda: now[0],
+                         sleep=lambda delay: now.__setitem__(0, now[0] + delay))
+    for _ in range(10):
+        bucket.acquire(16)
+    # The first batch goes out on the initial burst
+    assert now[0] == 9 * 16 / 64
+
+
+def test_sessions_from_a_fresh_process(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    writer = SessionStore(backend=SQLiteSessionBackend(path))
+    for i, language in enumerate(("english", "sinhala")):
+        state = writer.get_or_create(f"9477600100{i}")
+        state.language = language
+        writer.save(state.number, state)
+    writer.backend.close()
+    fresh = SessionStore(backend=SQLiteSessionBackend(path))
+    assert [(number, language) for number, language, _ in session_recipients(fresh)] == [
+        ("94776001000", "english"), ("94776001001", "sinhala")]
+    fresh.backend.close()
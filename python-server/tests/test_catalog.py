@@ -0,0 +1,42 @@
+import pytest
+
+from catalog import build_catalog
+from shop_data import read_section
+
+import bot
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    data = read_section("catalog")
+    return build_catalog(read_section("shop"), data["images"], data["aliases"], data["prices"])
+
+
+@pytest.mark.parametrize("message, name", [
+    ("do you have iphone 15", "iPhone 15"),
+    ("Samsung Galaxy S23 price?", "Samsung Galaxy S23"),
+    ("redmi note 13 pro thiyenawada", "Redmi Note 13 Pro"),
+])
+def test_listed_models_match(catalog, message, name):
+    product, _ = catalog.match(message)
+    assert product is not None and product.name == name
+
+
+@pytest.mark.parametrize("message, brand", [
+    ("iphone 15 pro max", "Apple"),
+    ("iphone 15 plus price", "Apple"),
+    ("samsung galaxy s23 ultra", "Samsung"),
+    ("galaxy s23 fe in stock?", "Samsung"),
+])
+def test_unlisted_variants_do_not_match(catalog, message, brand):
+    product, matched_brand = catalog.match(message)
+    assert product is None
+    assert matched_brand == brand
+
+
+@pytest.mark.parametrize("message, model", [
+    ("iphone 15 pro max", "iPhone 15 Pro"),
+    ("samsung galaxy s23 ultra", "Galaxy S23 Ultra"),
+])
+def test_variant_keeps_model_name_from_message(catalog, message, model):
+    assert bot.extract_product_details(message, "english", catalog)["model"] == model
@@ -0,0 +1,125 @@
+"""Ingestion guarantees of /send: duplicate deliveries are processed once
+and one number's messages never interleave, within and across workers."""
+import threading
+import time
+
+import pytest
+
+import bot
+from idempotency import StoreLocks
+from sessions import KeyValueSessionBackend, SessionStore
+from shared_state import LocalKeyValueStore
+
+MODEL_LATENCY = 0.2
+
+
+def post_all(payloads):
+    """POST every payload from its own thread, all released at once."""
+    barrier = threading.Barrier(len(payloads))
+    responses = [None] * len(payloads)
+
+    def client(index):
+        test_client = bot.app.test_client()
+        barrier.wait()
+        responses[index] = test_client.post("/send", json=payloads[index]).get_json()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(payloads))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses, time.perf_counter() - start
+
+
+def to_interaction(number):
+    client = bot.app.test_client()
+    for message in ("hi", "1", "1"):
+        client.post("/send", json={"number": number, "message": message})
+
+
+def test_duplicate_deliveries_processed_once():
+    number = "94770001001"
+    client = bot.app.test_client()
+    client.post("/send", json={"number": number, "message": "hi", "message_id": "welcome-1"})
+    # Processing the language choice twice would skip straight past the menu
+    responses, _ = post_all([{"number": number, "message": "1", "message_id": "lang-1"}] * 20)
+    assert sum(not r.get("duplicate") for r in responses) == 1
+    assert bot.chat_states.get(number).current_stage == "menu"
+
+    client.post("/send", json={"number": number, "message": "1", "message_id": "menu-1"})
+    calls = bot.ai_model.calls
+    responses, _ = post_all([{"number": number, "message": "Is there a warranty on used phones?",
+                              "message_id": "q-1"}] * 20)
+    assert sum(not r.get("duplicate") for r in responses) == 1
+    assert bot.ai_model.calls - calls == 1
+
+
+def test_one_number_is_serialized():
+    number = "94770001002"
+    to_interaction(number)
+    before = len(bot.chat_states.get(number).conversation_history)
+    payloads = [{"number": number, "message": f"question {i} about phones", "message_id": f"serial-{i}"}
+                for i in range(6)]
+    responses, _ = post_all(payloads)
+    assert not any(r.get("duplicate") for r in responses)
+    assert len(bot.chat_states.get(number).conversation_history) - before == len(payloads)
+
+
+def test_different_numbers_run_in_parallel():
+    numbers = [f"9477000200{i}" for i in range(6)]
+    for number in numbers:
+        to_interaction(number)
+    payloads = [{"number": number, "message": f"parallel question from {number}", "message_id": f"par-{number}"}
+                for number in numbers]
+    _, elapsed = post_all(payloads)
+    # Serialized, six model calls would take 6 x MODEL_LATENCY
+    assert elapsed < MODEL_LATENCY * 3
+
+
+def test_store_lock_serializes_workers():
+    # Two "workers": separate local stripes and session caches, one shared store
+    store = LocalKeyValueStore()
+    workers = [(StoreLocks(store), SessionStore(backend=KeyValueSessionBackend(store), local_cache=False))
+               for _ in range(2)]
+    number = "94770001003"
+    turns = 20
+
+    def worker(locks, sessions):
+        for turn in range(turns):
+            with locks.for_key(number):
+                state = sessions.get_or_create(number)
+                # Widen the read-modify-write window a race would need
+                time.sleep(0.001)
+                state.summary_tokens += 1
+                sessions.save(number, state)
+
+    threads = [threading.Thread(target=worker, args=(locks, sessions)) for locks, sessions in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # An interleaved read-modify-write would lose increments
+    assert workers[0][1].get(number).summary_tokens == 2 * turns
+    assert sum(locks.waits for locks, _ in workers) > 0
+
+
+def test_store_lock_release_checks_token():
+    store = LocalKeyValueStore()
+    assert store.acquire_lock("lock:n", "first", ttl=0.05)
+    assert not store.acquire_lock("lock:n", "second", ttl=0.05)
+    time.sleep(0.06)
+    # Expired: another worker takes it, and the first holder cannot release it
+    assert store.acquire_lock("lock:n", "second", ttl=5)
+    assert not store.release_lock("lock:n", "first")
+    assert not store.acquire_lock("lock:n", "third", ttl=5)
+    assert store.release_lock("lock:n", "second")
+
+
+def test_store_lock_wait_times_out():
+    store = LocalKeyValueStore()
+    store.acquire_lock("lock:94770001004", "other-worker", ttl=5)
+    locks = StoreLocks(store, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        with locks.for_key("94770001004"):
+            pass
@@ -0,0 +1,40 @@
+import json
+import logging
+import time
+
+from log_config import JsonFormatter, TextFormatter, redact_numbers
+
+
+def make_record(message, **extra):
+    record = logging.LogRecord("bot", logging.INFO, __file__, 1, message, (), None)
+    # An hour whose "YYYY-MM-DD HH" prefix has as many digits as a phone number
+    record.created = time.mktime((2026, 10, 18, 21, 5, 0, 0, 0, -1))
+    record.msecs = 0
+    record.__dict__.update(extra)
+    return record
+
+
+def test_text_keeps_the_timestamp_and_masks_the_number():
+    text = TextFormatter(redact=True).format(make_record("Message from 94771234567"))
+    assert text.startswith("2026-10-18 21:05:00,000 - bot - INFO - ")
+    assert text.endswith("Message from ********567")
+
+
+def test_json_masks_message_and_extra_fields():
+    entry = json.loads(JsonFormatter(redact=True).format(make_record("Message from +94 77 123 4567",
+                                                                     number="94771234567")))
+    assert entry["message"] == "Message from ************567"
+    assert entry["number"] == "********567"
+    assert entry["ts"].startswith("20") and "*" not in entry["ts"]
+
+
+def test_redaction_can_be_off():
+    text = TextFormatter(redact=False).format(make_record("Message from 94771234567"))
+    assert text.endswith("Message from 94771234567")
+
+
+def test_numbers_inside_message_ids_are_masked():
+    message_id = "false_94771234567@c.us_3EB0C767D26A1D6F0A5F"
+    assert redact_numbers(f"Skipping duplicate message {message_id}") == \
+        "Skipping duplicate message false_********567@c.us_3EB0C767D26A1D6F0A5F"
+    assert redact_numbers("94771234567@c.us") == "********567@c.us"
@@ -0,0 +1,166 @@
+"""RabbitMQBroker reconnects after a lost connection; the consumer gives up
+(so Docker restarts it) when it cannot."""
+from types import SimpleNamespace
+
+import pika
+import pika.exceptions
+import pytest
+
+from messaging import InMemoryBroker, RabbitMQBroker
+from queue_worker import QueueConsumer
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.published = []
+        self.acked = []
+
+    @property
+    def is_open(self):
+        return self.connection.is_open
+
+    def _check(self):
+        if self.connection.lost:
+            raise pika.exceptions.StreamLostError("Transport indicated EOF")
+
+    def queue_declare(self, queue, durable):
+        self._check()
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self._check()
+        self.published.append(body)
+
+    def basic_get(self, queue, auto_ack):
+        self._check()
+        if self.connection.server.pending:
+            return SimpleNamespace(delivery_tag=1), None, self.connection.server.pending.pop(0)
+        return None, None, None
+
+    def basic_ack(self, delivery_tag, multiple):
+        self._check()
+        self.acked.append(delivery_tag)
+
+
+class FakeServer:
+    """Hands out connections; `down` makes connecting fail."""
+
+    def __init__(self):
+        self.connections = []
+        self.pending = []
+        self.down = False
+
+    def connect(self, parameters):
+        if self.down:
+            raise pika.exceptions.AMQPConnectionError("Connection refused")
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.is_open = True
+        self.lost = False
+        self.events = 0
+        self.channels = []
+
+    def channel(self):
+        self.channels.append(FakeChannel(self))
+        return self.channels[-1]
+
+    def process_data_events(self, time_limit):
+        if self.lost:
+            raise pika.exceptions.StreamLostError("missed heartbeats from server")
+        self.events += 1
+
+    def sleep(self, duration):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(pika, "BlockingConnection", server.connect)
+    return server
+
+
+def test_publish_reconnects_after_a_lost_connection(server):
+    broker = RabbitMQBroker("amqp://rabbitmq", keepalive_interval=60)
+    broker.publish("whatsapp_messages", {"number": "94771234567", "message": "hi"})
+    server.connections[0].lost = True
+    broker.publish("whatsapp_messages", {"number": "94771234567", "message": "again"})
+    assert len(server.connections) == 2 and broker.reconnects == 1
+    assert len(server.connections[1].channels[0].published) == 1
+    broker.close()
+
+
+def test_ack_from_a_lost_connection_is_skipped(server):
+    broker = RabbitMQBroker("amqp://rabbitmq", keepalive_interval=60)
+    server.pending.append(b'{"number": "94771234567", "message": "hi"}')
+    items, token = broker.get_batch("incoming_messages", 10)
+    assert len(items) == 1
+    server.connections[0].lost = True
+    broker.ack(token)
+    assert broker.generation == 2
+    assert not any(channel.acked for connection in server.connections for channel in connection.channels)
+    broker.close()
+
+
+def test_keepalive_services_heartbeats_and_drops_a_dead_connection(server):
+    broker = RabbitMQBroker("amqp://rabbitmq", keepalive_interval=0.01)
+    first = server.connections[0]
+    broker._closed.wait(0.1)
+    assert first.events > 0
+    first.lost = True
+    broker._closed.wait(0.1)
+    assert broker._connection is None and not first.is_open
+    broker.publish("whatsapp_messages", {"number": "94771234567", "message": "hi"})
+    assert len(server.connections) == 2
+    broker.close()
+
+
+def test_publish_raises_while_the_server_is_down(server):
+    broker = RabbitMQBroker("amqp://rabbitmq", keepalive_interval=60)
+    server.connections[0].lost = True
+    server.down = True
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        broker.publish("whatsapp_messages", {"number": "94771234567", "message": "hi"})
+    server.down = False
+    broker.publish("whatsapp_messages", {"number": "94771234567", "message": "hi"})
+    broker.close()
+
+
+def test_consumer_exits_when_the_broker_stays_down():
+    class DownBroker(InMemoryBroker):
+        calls = 0
+
+        def get_batch(self, queue_name, max_items, timeout=1.0):
+            self.calls += 1
+            raise pika.exceptions.AMQPConnectionError("Connection refused")
+
+    broker = DownBroker()
+    consumer = QueueConsumer(broker, lambda items, on_result: None, poll_timeout=0.001, max_failures=4)
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        consumer.run_forever()
+    assert broker.calls == 4
+
+
+def test_consumer_recovers_from_a_few_errors():
+    class FlakyBroker(InMemoryBroker):
+        failures = 3
+
+        def get_batch(self, queue_name, max_items, timeout=1.0):
+            if self.failures:
+                self.failures -= 1
+                raise pika.exceptions.StreamLostError("Transport indicated EOF")
+            consumer.stop()
+            return super().get_batch(queue_name, max_items, timeout=0)
+
+    consumer = QueueConsumer(FlakyBroker(), lambda items, on_result: None, poll_timeout=0.001, max_failures=4)
+    consumer.run_forever()
+    assert consumer.broker.failures == 0
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import bot
+from metrics import Registry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import sys
+from metrics import Registry
+metrics = Registry(sys.argv[1])
+metrics.counter("messages_total", "Messages", ["intent"]).inc(3, intent="greeting")
+metrics.histogram("stage_seconds", "Stages", ["stage"]).observe(0.2, stage="model_call")
+metrics.gauge_callback("sessions", "Sessions", lambda: 7)
+metrics.counter_callback("retries_total", "Retries", lambda: 5)
+metrics.write()
+"""
+
+
+def registry(directory):
+    metrics = Registry(directory)
+    messages = metrics.counter("messages_total", "Messages", ["intent"])
+    stages = metrics.histogram("stage_seconds", "Stages", ["stage"])
+    metrics.gauge_callback("sessions", "Sessions", lambda: 2)
+    metrics.counter_callback("retries_total", "Retries", lambda: 1)
+    return metrics, messages, stages
+
+
+def test_directory_sums_every_process(tmp_path):
+    # Another worker process, which has since exited
+    subprocess.run([sys.executable, "-c", WORKER, str(tmp_path)], cwd=ROOT, check=True)
+    metrics, messages, stages = registry(str(tmp_path))
+    messages.inc(intent="greeting")
+    stages.observe(0.01, stage="model_call")
+
+    text = metrics.render()
+    assert 'messages_total{intent="greeting"} 4' in text
+    assert 'stage_seconds_count{stage="model_call"} 2' in text
+    assert 'stage_seconds_bucket{stage="model_call",le="0.01"} 1' in text
+    assert f'sessions{{pid="{os.getpid()}"}} 2' in text
+    assert text.count("sessions{pid=") == 2
+    assert "# TYPE retries_total counter\nretries_total 6" in text
+
+
+def test_process_without_directory_renders_its_own():
+    metrics, messages, _ = registry(None)
+    messages.inc(intent="greeting")
+    text = metrics.render()
+    assert 'messages_total{intent="greeting"} 1' in text and "sessions 2" in text
+    assert "# TYPE retries_total counter\nretries_total 1" in text
+
+
+def test_analysis_stages_count_cached_messages():
+    def count(stage):
+        return bot.STAGE_SECONDS.totals().get((stage,), (0, 0.0))[0]
+
+    client = bot.app.test_client()
+    for message in ("hi", "1", "1"):
+        client.post("/send", json={"number": "94770009101", "message": message})
+    before = count("intent_detection"), count("product_extraction")
+    for _ in range(3):
+        client.post("/send", json={"number": "94770009101", "message": "do you have warranty"})
+    assert (count("intent_detection"), count("product_extraction")) == (before[0] + 3, before[1] + 3)
@@ -0,0 +1,41 @@
+import pytest
+
+from ai_backend import AIBackend, FakeModel
+from resilience import CircuitBreaker, RetryBudget
+
+
+class BlockedModel:
+    """Raises what the Gemini SDK raises for a safety-blocked response."""
+
+    def generate(self, prompt):
+        raise ValueError("response.text requires a valid Part; the candidate was blocked")
+
+
+def backend_for(model, reset_timeout=30.0):
+    return AIBackend(model, max_workers=2, timeout=1, retries=0, retry_budget=RetryBudget(),
+                     breaker=CircuitBreaker(failure_threshold=5, reset_timeout=reset_timeout))
+
+
+@pytest.mark.parametrize("model", [BlockedModel(), FakeModel(latency=0, jitter=0, error_rate=1.0, error_code=400)])
+def test_client_errors_do_not_open_the_circuit(model):
+    backend = backend_for(model)
+    for i in range(20):
+        assert backend.generate(f"prompt {i}", "fallback") == "fallback"
+    assert backend.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_open_the_circuit():
+    backend = backend_for(FakeModel(latency=0, jitter=0, error_rate=1.0, error_code=503))
+    for i in range(5):
+        backend.generate(f"prompt {i}", "fallback")
+    assert backend.breaker.state == CircuitBreaker.OPEN
+
+
+def test_client_error_on_trial_call_closes_the_circuit():
+    model = FakeModel(latency=0, jitter=0, error_rate=1.0, error_code=503)
+    backend = backend_for(model, reset_timeout=0)
+    for i in range(5):
+        backend.generate(f"prompt {i}", "fallback")
+    model.error_code = 400
+    backend.generate("trial", "fallback")
+    assert backend.breaker.state == CircuitBreaker.CLOSED
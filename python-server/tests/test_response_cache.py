@@ -0,0 +1,17 @@
+from response_cache import ResponseCache, normalize_query
+
+
+def test_stretched_letters_collapse():
+    assert normalize_query("Hiiii, priceeee?") == normalize_query("hi price")
+
+
+def test_repeated_digits_are_kept():
+    assert normalize_query("price under 1000") == "price under 1000"
+    assert normalize_query("price under 1000") != normalize_query("price under 10000")
+    assert normalize_query("call 0777 111 222") == "call 0777 111 222"
+
+
+def test_amounts_do_not_share_a_cache_key():
+    keys = {ResponseCache.make_key(f"phones under {amount}", "english", "product_inquiry", {}, "")
+            for amount in ("1000", "10000", "100000")}
+    assert len(keys) == 3
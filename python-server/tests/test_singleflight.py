@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+import bot
+from ai_backend import FakeModel
+from singleflight import SingleFlight
+
+
+def burst(group, model, keys, clients_per_key):
+    """Every client calls group.do() for its key at once; returns
+    (key, value) results and (key, error) errors."""
+    barrier = threading.Barrier(len(keys) * clients_per_key)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def client(key):
+        barrier.wait()
+        try:
+            value = group.do(key, lambda: model.generate(key), timeout=5)
+            with lock:
+                results.append((key, value))
+        except Exception as e:
+            with lock:
+                errors.append((key, e))
+
+    threads = [threading.Thread(target=client, args=(key,)) for key in keys for _ in range(clients_per_key)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_identical_calls_share_one_model_call():
+    keys = ["iphone 15 price", "s24 stock", "shop eka koheda"]
+    model = FakeModel(latency=0.3, jitter=0.0)
+    group = SingleFlight()
+    results, errors = burst(group, model, keys, 20)
+    assert not errors and len(results) == 60
+    assert model.calls == len(keys)
+    assert all(len({value for k, value in results if k == key}) == 1 for key in keys)
+    assert group.stats()["coalesced"] == 60 - len(keys) and group.in_flight() == 0
+
+
+def test_error_reaches_every_waiter():
+    model = FakeModel(latency=0.3, jitter=0.0, error_rate=1.0)
+    group = SingleFlight()
+    results, errors = burst(group, model, ["iphone 15 price"], 20)
+    assert model.calls == 1 and not results and len(errors) == 20
+    assert len({id(error) for _, error in errors}) == 1
+    assert group.stats()["errors"] == 1
+
+
+def test_waiter_times_out():
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait()
+        return "answer"
+
+    group = SingleFlight()
+    leader = threading.Thread(target=group.do, args=("key", slow))
+    leader.start()
+    started.wait()
+    with pytest.raises(TimeoutError):
+        group.do("key", slow, timeout=0.05)
+    release.set()
+    leader.join()
+    assert group.stats()["timeouts"] == 1
+
+
+def test_bot_coalesces_identical_questions():
+    bot.response_cache.clear()
+    bot.ai_model.calls = 0
+    client = bot.app.test_client()
+    numbers = [f"9477000920{i}" for i in range(8)]
+    for number in numbers:
+        for message in ("hi", "1", "1"):
+            client.post("/send", json={"number": number, "message": message})
+    barrier = threading.Barrier(len(numbers))
+
+    def ask(number):
+        barrier.wait()
+        client.post("/send", json={"number": number, "message": "can you fix a cracked back glass"})
+
+    threads = [threading.Thread(target=ask, args=(number,)) for number in numbers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bot.ai_model.calls == 1
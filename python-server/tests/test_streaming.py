@@ -0,0 +1,118 @@
+"""Streamed AI replies: chunking, per-customer order, and replies cut
+short are not cached as complete answers."""
+import threading
+import time
+
+import pytest
+
+import bot
+from ai_backend import AIBackend, FakeModel
+from messaging import InMemoryBroker
+from sessions import ChatState
+from streaming import ReplyStream, chunk_stream
+
+# Each longer than chunk_stream's min_chars, so each goes out as it ends
+SENTENCES = [f"{word} sentence of the answer, long enough to be sent to the customer as its own WhatsApp message. "
+             for word in ("First", "Second", "Third")]
+
+
+class BrokenStreamModel:
+    """Streams two sentences, then fails (or stalls) before the rest."""
+
+    def __init__(self, stall=0.0):
+        self.stall = stall
+        self.calls = 0
+
+    def generate(self, prompt):
+        return "".join(SENTENCES)
+
+    def generate_stream(self, prompt):
+        self.calls += 1
+        yield SENTENCES[0]
+        yield SENTENCES[1]
+        if self.stall:
+            time.sleep(self.stall)
+        else:
+            raise ConnectionError("stream reset by peer")
+        yield SENTENCES[2]
+
+
+def test_stream_reports_completion():
+    backend = AIBackend(BrokenStreamModel(), max_workers=1, timeout=1, retries=0)
+    chunks = []
+    text, streamed, complete = backend.stream("q", chunks.append, "fallback")
+    assert streamed and not complete
+    assert text.startswith("First sentence") and "Third" not in text
+
+    backend = AIBackend(BrokenStreamModel(stall=0.5), max_workers=1, timeout=1, stream_timeout=0.1, retries=0)
+    _, streamed, complete = backend.stream("q", chunks.append, "fallback")
+    assert streamed and not complete
+    backend.shutdown()
+
+
+@pytest.fixture
+def broken_model():
+    model, saved = BrokenStreamModel(), bot.ai_backend.model
+    bot.ai_backend.model = model
+    yield model
+    bot.ai_backend.model = saved
+
+
+def test_partial_stream_is_not_cached(broken_model):
+    bot.response_cache.clear()
+    for attempt in range(2):
+        state = ChatState("94770009001")
+        state.language = "english"
+        state.current_stage = "interaction"
+        stream = ReplyStream(InMemoryBroker(), state.number)
+        text = bot.get_ai_response("tell me about your repair turnaround", state, stream)
+        assert "Third" not in text
+    # The second customer got a fresh call instead of the truncated reply
+    assert broken_model.calls == 2
+    assert bot.response_cache.stats()["entries"] == 0
+
+
+def test_chunks_cut_at_sentence_boundaries():
+    # Abbreviations do not end a sentence; boundaries before min_chars are skipped
+    pieces = ["Our shop is at No. 30 Panadura Road. ", "The price is Rs. 275,", "000. ", "Call us!\n\nThanks."]
+    assert list(chunk_stream(pieces, min_chars=10)) == [
+        "Our shop is at No. 30 Panadura Road.", "The price is Rs. 275,000.", "Call us!\n\nThanks."]
+
+
+def test_concurrent_streams_keep_each_customer_in_order():
+    sentences = 8
+    backend = AIBackend(FakeModel(latency=0.05, jitter=0.0, stream_sentences=sentences, token_latency=0.001),
+                        max_workers=4, timeout=10)
+    broker = InMemoryBroker()
+
+    def customer(i):
+        stream = ReplyStream(broker, f"9477000900{i}@c.us")
+        _, stream.delivered, complete = backend.stream(f"question {i}", stream.send, "fallback")
+        assert stream.delivered and complete
+
+    threads = [threading.Thread(target=customer, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    backend.shutdown()
+    by_number = {}
+    for _, payload in broker.published:
+        by_number.setdefault(payload["number"], []).append(payload["message"])
+    assert len(by_number) == 4
+    for chunks in by_number.values():
+        numbers = [int(sentence.split(" sentence ")[1].split(" ")[0]) for sentence in " ".join(chunks).split(". ")]
+        assert numbers == list(range(1, sentences + 1))
+
+
+def test_send_streams_the_reply(monkeypatch):
+    broker = InMemoryBroker()
+    monkeypatch.setattr(bot, "STREAM_REPLIES", True)
+    monkeypatch.setattr(bot, "outbound_broker", broker)
+    bot.response_cache.clear()
+    client = bot.app.test_client()
+    for message in ("hi", "1", "1", "Do you have a warranty on used phones?"):
+        response = client.post("/send", json={"number": "94770009002", "message": message}).get_json()
+    chunks = [payload["message"] for _, payload in broker.published]
+    assert response.get("streamed") and chunks
+    assert " ".join(chunks) == " ".join(response["response"].split())